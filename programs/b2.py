@@ -26,7 +26,7 @@ class PID(object):
         self._prev_error = None
         self._prev_response = None
 
-    def act(self, set_point: float, state: float, dt: float = None):
+    def act(self, set_point: float, state: float, dt: float = None):  # profile
         """
         :param set_point:
         :param state:
@@ -58,7 +58,7 @@ class PID(object):
 
 def balance(angle: float, pid: PID, dt):
     global motors, hub, STOP_ANGLE
-    while True:
+    while True:  # profile 25
         state = hub.motion_sensor.get_roll_angle()
         if abs(state-SET_POINT) >= STOP_ANGLE:
             motors.stop()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+# Names of the values in a m=0 sensor notification, e.g. "A.2" for the third value of port A or "gyroscope.x".
+
+PORTS = "ABCDEF"
+PORT_VALUES = 4
+SENSORS = {
+    "accelerometer": ("x", "y", "z"),
+    "gyroscope": ("x", "y", "z"),
+    "position": ("yaw", "pitch", "roll"),
+}
+
+CHANNELS = [f"{port}.type" for port in PORTS] + [f"{port}.{i}" for port in PORTS for i in range(PORT_VALUES)] + \
+    [f"{sensor}.{axis}" for sensor, axes in SENSORS.items() for axis in axes]
+
+
+def sensor_channels(p):
+    """Flattens the payload of a m=0 notification into (channel, value) pairs, without display and time."""
+    for port, (gadget, values) in zip(PORTS, p[0:6]):
+        yield f"{port}.type", gadget
+        for i, value in enumerate(values[:PORT_VALUES]):
+            yield f"{port}.{i}", value
+    for (sensor, axes), values in zip(SENSORS.items(), p[6:9]):
+        for axis, value in zip(axes, values):
+            yield f"{sensor}.{axis}", value
+
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# Relates the hub's clock to the host's clock. The time field at the end of each m=0 frame (ms) and the host time when
+# the frame arrived give a transit time (arrival - hub time), which is the clock offset plus the link latency. The
+# lower envelope of the transit times, the minimum per second fitted by a line over the last minute, follows the
+# offset and drift of the hub's clock with the minimal latency; everything above it is queueing delay on the link.
+# The minimal one-way latency itself is estimated from the round trips of requests as half of the fastest one.
+#
+# A frame gets the host time when it was sampled on the hub: its hub time mapped by the envelope minus the minimal
+# latency. Without a running hub clock (the time field is 0 while no program runs) the arrival time minus the mean
+# latency is used.
+
+import time
+from collections import deque
+
+# jitter and mean latency are exponential moving averages with this gain (as in RFC 3550)
+GAIN = 1 / 16
+
+
+class ClockSync:
+    def __init__(self, window=60, bucket=1.0, unit=0.001):
+        self.window = window
+        self.bucket = bucket
+        self.unit = unit
+        self.rtts = deque(maxlen=100)
+        self.rtt_jitter = 0.0
+        self.reset()
+
+    def reset(self):
+        self.minima = deque()  # (hub time, minimal transit) of the closed buckets
+        self.current = None  # [bucket, hub time, minimal transit] of the open bucket
+        self.offset = None  # transit = offset + drift * hub time
+        self.drift = 0.0
+        self.last = None  # (hub time, transit) of the previous frame
+        self.jitter = 0.0
+        self.queueing = 0.0
+
+    def frame(self, hub_time, received=None):
+        """Adds a m=0 frame with the hub's time field received at host time received and returns the corrected host
+        time when it was sampled."""
+        received = time.time() if received is None else received
+        if not isinstance(hub_time, (int, float)) or hub_time <= 0:
+            return received - self.latency()
+        hub = hub_time * self.unit
+        if self.last is not None and hub < self.last[0] - self.bucket:
+            # the hub's time was reset, e.g. by starting a program
+            self.reset()
+        transit = received - hub
+
+        if self.last is not None:
+            # interarrival jitter as in RFC 3550
+            self.jitter += (abs(transit - self.last[1]) - self.jitter) * GAIN
+        self.last = (hub, transit)
+
+        bucket = int(hub // self.bucket)
+        if self.current is None or bucket != self.current[0]:
+            if self.current is not None:
+                self.minima.append(tuple(self.current[1:]))
+                while self.minima and self.minima[0][0] < hub - self.window:
+                    self.minima.popleft()
+                self.fit()
+            self.current = [bucket, hub, transit]
+        elif transit < self.current[2]:
+            self.current[1:] = hub, transit
+
+        if self.offset is None or transit < self.envelope(hub):
+            # no fit yet or the link is faster than ever, the envelope moves down at once
+            self.offset = transit - self.drift * hub
+        self.queueing += (transit - self.envelope(hub) - self.queueing) * GAIN
+        return hub + self.envelope(hub) - self.min_latency()
+
+    def fit(self):
+        """Fits a line through the minimal transit times of the closed buckets."""
+        if len(self.minima) < 2:
+            return
+        n = len(self.minima)
+        mean_x = sum(x for x, _ in self.minima) / n
+        mean_y = sum(y for _, y in self.minima) / n
+        sxx = sum((x - mean_x) ** 2 for x, _ in self.minima)
+        if sxx == 0:
+            return
+        self.drift = sum((x - mean_x) * (y - mean_y) for x, y in self.minima) / sxx
+        # a line through the minima, shifted down so that no minimum is below it
+        self.offset = min(y - self.drift * x for x, y in self.minima)
+
+    def envelope(self, hub):
+        return self.offset + self.drift * hub
+
+    def round_trip(self, rtt):
+        """Adds the round trip time of a request in seconds."""
+        if self.rtts:
+            self.rtt_jitter += (abs(rtt - self.rtts[-1]) - self.rtt_jitter) * GAIN
+        self.rtts.append(rtt)
+
+    def min_latency(self):
+        return min(self.rtts) / 2 if self.rtts else 0.0
+
+    def latency(self):
+        """Mean one-way latency from the hub to the host in seconds."""
+        return self.min_latency() + self.queueing
+
+    def state(self):
+        return {
+            "synced": self.offset is not None,
+            "offset": self.offset,
+            "drift_ppm": self.drift * 1e6,
+            "latency": self.latency(),
+            "jitter": self.jitter,
+            "rtt_min": min(self.rtts) if self.rtts else None,
+            "rtt_mean": sum(self.rtts) / len(self.rtts) if self.rtts else None,
+            "rtt_jitter": self.rtt_jitter,
+        }
@@ -0,0 +1,57 @@
+import random
+import unittest
+
+import clocksync
+
+
+class ClockSyncTestCase(unittest.TestCase):
+    def run_link(self, sync, offset, drift, latency, seconds=30, rate=50):
+        """Feeds frames of a hub clock with offset and drift over a link with latency and random queueing delays,
+        returns the largest error of the corrected times."""
+        rng = random.Random(1)
+        error = 0
+        for n in range(seconds * rate):
+            sampled = 1000 + n / rate
+            hub_ms = round((sampled - offset) / (1 + drift) * 1000)
+            received = sampled + latency + rng.expovariate(1 / 0.01)
+            corrected = sync.frame(hub_ms, received)
+            if n > 3 * rate:
+                error = max(error, abs(corrected - sampled))
+        return error
+
+    def test_offset_and_drift(self):
+        sync = clocksync.ClockSync()
+        for n in range(10):
+            sync.round_trip(0.030 + n * 0.002)
+        error = self.run_link(sync, offset=900, drift=100e-6, latency=0.015)
+        self.assertLess(error, 0.005)
+        state = sync.state()
+        self.assertTrue(state["synced"])
+        self.assertAlmostEqual(100, state["drift_ppm"], delta=30)
+        self.assertAlmostEqual(0.025, state["latency"], delta=0.005)
+        self.assertGreater(state["jitter"], 0.003)
+
+    def test_without_hub_clock(self):
+        sync = clocksync.ClockSync()
+        sync.round_trip(0.04)
+        self.assertAlmostEqual(99.98, sync.frame(0, 100.0))
+        self.assertFalse(sync.state()["synced"])
+
+    def test_reset(self):
+        sync = clocksync.ClockSync()
+        sync.frame(50000, 100.0)
+        self.assertAlmostEqual(110.0, sync.frame(10000, 110.0))
+        self.assertAlmostEqual(100.0, sync.offset)
+
+    def test_round_trips(self):
+        sync = clocksync.ClockSync()
+        for rtt in (0.05, 0.03, 0.04):
+            sync.round_trip(rtt)
+        state = sync.state()
+        self.assertAlmostEqual(0.03, state["rtt_min"])
+        self.assertAlmostEqual(0.04, state["rtt_mean"])
+        self.assertAlmostEqual(0.015, sync.latency())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+# Delta encoding of the sensor stream for clients on slow links. Every n-th m=0 notification is sent as is
+# (keyframe), in between only the channels that changed since they were sent last:
+#
+#   {"m":0,"d":{"A.2":-139,"gyroscope.x":3}}
+#
+# Numeric channels can have a deadband, changes up to this amount are not sent. It can be given per channel
+# ("gyroscope.x"), per port or sensor ("A", "gyroscope") or as default ("*"). The hub time changes in every frame, it
+# is only sent along with other changes. Frames without any change are dropped, all other messages are passed through.
+
+import json
+
+from channels import PORTS, SENSORS, sensor_channels
+
+SENSOR_INDEX = {sensor: 6 + i for i, sensor in enumerate(SENSORS)}
+
+
+def frame_channels(p):
+    """Returns all values of a m=0 payload by channel name, including display and time."""
+    values = dict(sensor_channels(p))
+    values["display"] = p[9]
+    values["time"] = p[10]
+    return values
+
+
+def channel_path(channel):
+    """Returns the position of a channel in a m=0 payload as a tuple of indices."""
+    if channel == "display":
+        return (9,)
+    if channel == "time":
+        return (10,)
+    group, value = channel.split(".", 1)
+    if group in SENSORS:
+        return (SENSOR_INDEX[group], SENSORS[group].index(value))
+    if value == "type":
+        return (PORTS.index(group), 0)
+    return (PORTS.index(group), 1, int(value))
+
+
+class DeltaEncoder:
+    def __init__(self, keyframe=50, deadband=None):
+        # both come from the clients, invalid values would fail in the middle of the stream
+        if not isinstance(keyframe, int) or isinstance(keyframe, bool) or keyframe < 1:
+            raise ValueError(f"keyframe has to be a positive integer: {keyframe!r}")
+        deadband = {} if deadband is None else deadband
+        if not isinstance(deadband, dict) or any(not isinstance(value, (int, float)) or isinstance(value, bool) or
+                                                 not value >= 0 for value in deadband.values()):
+            raise ValueError(f"deadband has to map channels to non-negative numbers: {deadband!r}")
+        self.keyframe = keyframe
+        self.deadband = deadband
+        self.sent = None
+        self.count = 0
+
+    def get_deadband(self, channel):
+        if channel in self.deadband:
+            return self.deadband[channel]
+        return self.deadband.get(channel.split(".", 1)[0], self.deadband.get("*", 0))
+
+    def encode(self, line, message):
+        if message is None or message.get("m") != 0 or len(message) != 2:
+            return line + b'\r'
+        values = frame_channels(message["p"])
+        self.count += 1
+        if self.sent is None or self.count >= self.keyframe or values.keys() != self.sent.keys():
+            self.sent = values
+            self.count = 0
+            return line + b'\r'
+
+        delta = {}
+        for channel, value in values.items():
+            if channel == "time":
+                continue
+            sent = self.sent[channel]
+            if value == sent:
+                continue
+            if isinstance(value, (int, float)) and isinstance(sent, (int, float)) and \
+                    abs(value - sent) <= self.get_deadband(channel):
+                continue
+            delta[channel] = value
+            self.sent[channel] = value
+        if not delta:
+            return b''
+        if values["time"] != self.sent["time"]:
+            delta["time"] = self.sent["time"] = values["time"]
+        return json.dumps({"m": 0, "d": delta}, separators=(',', ':')).encode('utf-8') + b'\r'
+
+
+class DeltaDecoder:
+    """Restores complete m=0 notifications from keyframes and deltas."""
+
+    def __init__(self):
+        self.p = None
+
+    def decode(self, message):
+        if message.get("m") != 0:
+            return message
+        if "p" in message:
+            self.p = message["p"]
+        elif self.p is None:
+            # no keyframe received yet
+            return None
+        else:
+            self.p = json.loads(json.dumps(self.p))
+            for channel, value in message["d"].items():
+                *path, last = channel_path(channel)
+                target = self.p
+                for index in path:
+                    target = target[index]
+                target[last] = value
+        return {"m": 0, "p": self.p}
@@ -0,0 +1,75 @@
+import json
+import unittest
+
+import delta
+
+FRAME = {"m": 0, "p": [[75, [0, 0, -138, 0]], [75, [0, 1, 121, 0]], [75, [0, 0, 136, 0]], [62, [None]], [0, []],
+                       [0, []], [-19, -11, 1008], [3, 8, -1], [-47, 1, 0], "", 0]}
+
+
+def changed(**values):
+    message = json.loads(json.dumps(FRAME))
+    for channel, value in values.items():
+        *path, last = delta.channel_path(channel.replace("_", "."))
+        target = message["p"]
+        for index in path:
+            target = target[index]
+        target[last] = value
+    return message
+
+
+def encode(encoder, message):
+    return encoder.encode(json.dumps(message).encode('utf-8'), message)
+
+
+class DeltaTestCase(unittest.TestCase):
+    def test_roundtrip(self):
+        encoder = delta.DeltaEncoder(keyframe=3)
+        decoder = delta.DeltaDecoder()
+        messages = [FRAME, changed(A_2=-139), FRAME, changed(gyroscope_x=4, display="9"), changed(time=20)]
+        for message in messages:
+            data = encode(encoder, message)
+            if data:
+                self.assertEqual(decoder.decode(json.loads(data)), message)
+
+    def test_deltas_and_keyframes(self):
+        encoder = delta.DeltaEncoder(keyframe=3)
+        self.assertIn(b'"p"', encode(encoder, FRAME))
+        self.assertEqual(encode(encoder, changed(A_2=-139)), b'{"m":0,"d":{"A.2":-139}}\r')
+        self.assertEqual(encode(encoder, changed(A_2=-139)), b'')
+        self.assertIn(b'"p"', encode(encoder, changed(A_2=-139)))
+
+    def test_structure_change_sends_keyframe(self):
+        encoder = delta.DeltaEncoder()
+        encode(encoder, FRAME)
+        message = json.loads(json.dumps(FRAME))
+        message["p"][4] = [61, [3]]
+        self.assertIn(b'"p"', encode(encoder, message))
+
+    def test_deadband(self):
+        encoder = delta.DeltaEncoder(deadband={"gyroscope": 2, "gyroscope.z": 0})
+        encode(encoder, FRAME)
+        self.assertEqual(encode(encoder, changed(gyroscope_x=5)), b'')
+        self.assertEqual(encode(encoder, changed(gyroscope_x=6)), b'{"m":0,"d":{"gyroscope.x":6}}\r')
+        self.assertEqual(encode(encoder, changed(gyroscope_x=6, gyroscope_z=0)), b'{"m":0,"d":{"gyroscope.z":0}}\r')
+
+    def test_time_alone_is_no_change(self):
+        encoder = delta.DeltaEncoder()
+        encode(encoder, FRAME)
+        self.assertEqual(encode(encoder, changed(time=20)), b'')
+        self.assertEqual(encode(encoder, changed(time=40, A_2=-139)), b'{"m":0,"d":{"A.2":-139,"time":40}}\r')
+
+    def test_invalid_parameters(self):
+        for keyframe, deadband in ((0, None), ("5", None), (True, None), (50, {"*": -1}), (50, {"*": "1"}),
+                                   (50, {"*": float("nan")}), (50, [1])):
+            self.assertRaises(ValueError, delta.DeltaEncoder, keyframe, deadband)
+
+    def test_other_messages_pass_through(self):
+        encoder = delta.DeltaEncoder()
+        self.assertEqual(encoder.encode(b'{"m":2,"p":[7.89,80,true]}', {"m": 2, "p": [7.89, 80, True]}),
+                         b'{"m":2,"p":[7.89,80,true]}\r')
+        self.assertEqual(encoder.encode(b'0]}', None), b'0]}\r')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Runs hub programs on the host with stand-ins for the mindstorms modules (see emulator/). Motors, the differential
+# drive and the pen move on a virtual clock, so a program that takes a minute on the robot finishes in milliseconds.
+# The result contains the pen strokes (cm), the timeline of all commands and the printed output. Many variants,
+# e.g. seeds of programs/crazy.py, can be run in parallel.
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+import traceback
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "emulator"))
+
+import world  # noqa: E402
+
+
+def run(path, seed=None, **options):
+    """Runs a program in a new world and returns its result."""
+    with open(path) as file:
+        code = compile(file.read(), path, "exec")
+    world.current = emulated = world.World(**options)
+    if seed is not None:
+        random.seed(seed)
+
+    error = None
+    started = time.perf_counter()
+    real_time = sys.modules["time"]
+    sys.modules["time"] = emulated.time_module()
+    try:
+        exec(code, {"__name__": "__main__", "__file__": path, "print": emulated.print})
+    except world.TimeLimit as e:
+        error = str(e)
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        sys.modules["time"] = real_time
+
+    result = emulated.result()
+    result.update({"program": path, "seed": seed, "error": error, "wall_time": time.perf_counter() - started})
+    return result
+
+
+def run_seed(args):
+    path, seed, options = args
+    return run(path, seed, **options)
+
+
+def summary(result):
+    ink = sum(sum(((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5 for (x0, y0), (x1, y1) in zip(stroke, stroke[1:]))
+              for stroke in result["strokes"])
+    seed = "" if result["seed"] is None else f"seed {result['seed']:<6} "
+    status = "ok" if result["error"] is None else result["error"].strip().splitlines()[-1]
+    return f"{seed}{result['time']:8.2f}s robot time in {result['wall_time'] * 1000:6.1f}ms, " \
+        f"{len(result['strokes'])} strokes, {ink:.1f}cm ink, pose {result['pose']}: {status}"
+
+
+def svg(result, margin=2):
+    points = [point for stroke in result["strokes"] for point in stroke] or [[0, 0]]
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    left, top = min(xs) - margin, -max(ys) - margin
+    width, height = max(xs) - min(xs) + 2 * margin, max(ys) - min(ys) + 2 * margin
+    lines = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{left:.2f} {top:.2f} {width:.2f} {height:.2f}" '
+             f'width="{width * 10:.0f}" height="{height * 10:.0f}">']
+    for stroke in result["strokes"]:
+        coordinates = " ".join(f"{x:.2f},{-y:.2f}" for x, y in stroke)
+        lines.append(f'<polyline points="{coordinates}" fill="none" stroke="black" stroke-width="0.2"/>')
+    lines.append("</svg>")
+    return "\n".join(lines) + "\n"
+
+
+def start():
+    parser = argparse.ArgumentParser(description="Run hub programs on an emulated robot.")
+    parser.add_argument("program", help="program to run", metavar="<path>")
+    parser.add_argument("-s", "--seeds", help="seed or range of seeds for random, e.g. 0:1000", metavar="<seeds>")
+    parser.add_argument("-j", "--jobs", help="parallel runs (default: number of CPUs)", metavar="<n>", type=int)
+    parser.add_argument("-t", "--time-limit", help="virtual seconds until a run is stopped (default: 600)",
+                        metavar="<seconds>", default=600, type=float)
+    parser.add_argument("-o", "--output", help="write the results as JSON", metavar="<path>")
+    parser.add_argument("--svg", help="write the pen strokes of the first run as SVG", metavar="<path>")
+    args = parser.parse_args()
+
+    options = {"time_limit": args.time_limit}
+    if args.seeds is None:
+        results = [run(args.program, **options)]
+    else:
+        start, _, stop = args.seeds.partition(":")
+        seeds = range(int(start), int(stop)) if stop else [int(start)]
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.jobs) as pool:
+            results = pool.map(run_seed, [(args.program, seed, options) for seed in seeds], chunksize=16)
+        print(f"{len(results)} runs in {time.perf_counter() - started:.2f}s")
+
+    for result in results[:20]:
+        print(summary(result))
+    if len(results) > 20:
+        print("...")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results if len(results) > 1 else results[0], file)
+    if args.svg:
+        with open(args.svg, "w") as file:
+            file.write(svg(results[0]))
+
+
+if __name__ == "__main__":
+    start()
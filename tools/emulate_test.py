@@ -0,0 +1,53 @@
+import os
+import unittest
+
+import emulate
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "programs")
+
+
+def program(name):
+    return os.path.join(PROGRAMS, name)
+
+
+def length(stroke):
+    return sum(((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5 for (x0, y0), (x1, y1) in zip(stroke, stroke[1:]))
+
+
+class EmulateTestCase(unittest.TestCase):
+    def test_house(self):
+        result = emulate.run(program("house.py"))
+        self.assertIsNone(result["error"])
+        self.assertEqual(6, len(result["strokes"]))
+        for stroke in result["strokes"][:4]:
+            self.assertAlmostEqual(5, length(stroke), delta=0.1)
+        # the four walls form a closed square
+        corners = [stroke[0] for stroke in result["strokes"][:4]]
+        self.assertAlmostEqual(corners[0][0], result["strokes"][3][-1][0], delta=0.1)
+        self.assertAlmostEqual(corners[0][1], result["strokes"][3][-1][1], delta=0.1)
+        self.assertEqual({"text": "done"}, result["events"][-1]["args"])
+        self.assertLess(result["wall_time"], 5)
+
+    def test_timeline(self):
+        result = emulate.run(program("drive.py"))
+        moves = [event for event in result["events"] if event["target"] == "BA"]
+        self.assertEqual(["move_tank", "move", "move", "move_tank", "move"], [event["command"] for event in moves])
+        for event, following in zip(moves, moves[1:]):
+            self.assertGreaterEqual(following["t"], event["t"] + event["duration"])
+        self.assertAlmostEqual(result["time"], result["events"][-1]["t"], delta=0.01)
+
+    def test_seeds(self):
+        first = emulate.run(program("crazy.py"), seed=7)
+        self.assertIsNone(first["error"])
+        self.assertEqual(30, len(first["strokes"]))
+        self.assertEqual(first["strokes"], emulate.run(program("crazy.py"), seed=7)["strokes"])
+        self.assertNotEqual(first["strokes"], emulate.run(program("crazy.py"), seed=8)["strokes"])
+
+    def test_time_limit(self):
+        result = emulate.run(program("balance.py"), time_limit=2)
+        self.assertIn("longer than 2s", result["error"])
+        self.assertAlmostEqual(2, result["time"], delta=0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+
+# Stand-in for the mindstorms module of the hub, acting on the emulated world (see emulate.py).
+
+import world
+
+DEFAULT_MOTOR_SPEED = 75
+DEFAULT_PAIR_SPEED = 100
+
+
+def degrees(amount, unit, circumference):
+    """Converts an amount of a unit into motor degrees."""
+    if unit == "cm":
+        return amount / circumference * 360
+    if unit == "in":
+        return amount * 2.54 / circumference * 360
+    if unit == "rotations":
+        return amount * 360
+    if unit == "degrees":
+        return amount
+    raise ValueError(f"unknown unit '{unit}'")
+
+
+class Motor:
+    def __init__(self, port):
+        self.port = port
+        self.default_speed = DEFAULT_MOTOR_SPEED
+        world.current.motor(port)
+
+    @property
+    def state(self):
+        return world.current.motor(self.port)
+
+    def run_for_degrees(self, degrees, speed=None):
+        speed = self.default_speed if speed is None else speed
+        if degrees < 0:
+            degrees, speed = -degrees, -speed
+        self.run(degrees / world.current.speed(abs(speed)) if speed else 0, speed, "run_for_degrees",
+                 degrees=degrees)
+
+    def run_for_rotations(self, rotations, speed=None):
+        self.run_for_degrees(rotations * 360, speed)
+
+    def run_for_seconds(self, seconds, speed=None):
+        self.run(seconds, self.default_speed if speed is None else speed, "run_for_seconds")
+
+    def run_to_position(self, degrees, direction="shortest path", speed=None):
+        speed = abs(self.default_speed if speed is None else speed)
+        current = self.state.degrees % 360
+        delta = (degrees - current) % 360
+        if direction == "counterclockwise" or direction == "shortest path" and delta > 180:
+            delta -= 360
+        duration = abs(delta) / world.current.speed(speed) if speed else 0
+        self.run(duration, speed if delta >= 0 else -speed, "run_to_position", degrees=degrees)
+
+    def run_to_degrees_counted(self, degrees, speed=None):
+        speed = abs(self.default_speed if speed is None else speed)
+        delta = degrees - self.state.degrees
+        duration = abs(delta) / world.current.speed(speed) if speed else 0
+        self.run(duration, speed if delta >= 0 else -speed, "run_to_degrees_counted", degrees=degrees)
+
+    def run(self, duration, speed, command, **args):
+        world.current.record(self.port, command, duration, speed=speed, **args)
+        self.state.speed = world.current.speed(speed)
+        world.current.advance(duration)
+        self.state.speed = 0.0
+
+    def start(self, speed=None):
+        speed = self.default_speed if speed is None else speed
+        world.current.record(self.port, "start", speed=speed)
+        self.state.speed = world.current.speed(speed)
+
+    def start_at_power(self, power):
+        world.current.record(self.port, "start_at_power", power=power)
+        self.state.speed = world.current.speed(power)
+
+    def stop(self):
+        world.current.record(self.port, "stop")
+        self.state.speed = 0.0
+
+    def get_speed(self):
+        world.current.call()
+        return int(round(self.state.speed * 100 / world.current.max_speed))
+
+    def get_position(self):
+        world.current.call()
+        return int(round(self.state.degrees)) % 360
+
+    def get_degrees_counted(self):
+        world.current.call()
+        return int(round(self.state.degrees))
+
+    def set_degrees_counted(self, degrees_counted):
+        self.state.degrees = degrees_counted
+
+    def get_default_speed(self):
+        return self.default_speed
+
+    def set_default_speed(self, default_speed):
+        self.default_speed = default_speed
+
+    def set_stop_action(self, action):
+        pass
+
+    def set_stall_detection(self, stop_when_stalled):
+        pass
+
+    def was_interrupted(self):
+        return False
+
+    def was_stalled(self):
+        return False
+
+
+class MotorPair:
+    def __init__(self, left_port, right_port):
+        self.ports = (left_port, right_port)
+        self.default_speed = DEFAULT_PAIR_SPEED
+        self.circumference = 17.6
+        world.current.drive = self.ports
+        for port in self.ports:
+            world.current.motor(port)
+
+    def set_speeds(self, left, right):
+        left_motor, right_motor = (world.current.motor(port) for port in self.ports)
+        # the left motor is mirrored, see World.advance
+        left_motor.speed = -world.current.speed(left)
+        right_motor.speed = world.current.speed(right)
+
+    def run(self, amount, unit, left, right, command, **args):
+        fastest = max(abs(left), abs(right))
+        if unit == "seconds":
+            duration = abs(amount)
+        else:
+            duration = abs(degrees(amount, unit, self.circumference)) / world.current.speed(fastest) \
+                if fastest else 0
+        if amount < 0:
+            left, right = -left, -right
+        world.current.record("".join(self.ports), command, duration, amount=amount, unit=unit, **args)
+        self.set_speeds(left, right)
+        world.current.advance(duration)
+        self.set_speeds(0, 0)
+
+    def move(self, amount, unit="cm", steering=0, speed=None):
+        speed = self.default_speed if speed is None else speed
+        left, right = self.steer(steering, speed)
+        self.run(amount, unit, left, right, "move", steering=steering, speed=speed)
+
+    def move_tank(self, amount, unit="cm", left_speed=None, right_speed=None):
+        left = self.default_speed if left_speed is None else left_speed
+        right = self.default_speed if right_speed is None else right_speed
+        self.run(amount, unit, left, right, "move_tank", left_speed=left, right_speed=right)
+
+    def steer(self, steering, speed):
+        steering = max(-100, min(100, steering))
+        if steering >= 0:
+            return speed, speed * (100 - 2 * steering) / 100
+        return speed * (100 + 2 * steering) / 100, speed
+
+    def start(self, steering=0, speed=None):
+        speed = self.default_speed if speed is None else speed
+        world.current.record("".join(self.ports), "start", steering=steering, speed=speed)
+        self.set_speeds(*self.steer(steering, speed))
+
+    def start_tank(self, left_speed, right_speed):
+        world.current.record("".join(self.ports), "start_tank", left_speed=left_speed, right_speed=right_speed)
+        self.set_speeds(left_speed, right_speed)
+
+    def start_at_power(self, power, steering=0):
+        world.current.record("".join(self.ports), "start_at_power", power=power, steering=steering)
+        self.set_speeds(*self.steer(steering, power))
+
+    def start_tank_at_power(self, left_power, right_power):
+        world.current.record("".join(self.ports), "start_tank_at_power", left_power=left_power,
+                             right_power=right_power)
+        self.set_speeds(left_power, right_power)
+
+    def stop(self):
+        world.current.record("".join(self.ports), "stop")
+        self.set_speeds(0, 0)
+
+    def set_motor_rotation(self, amount=17.6, unit="cm"):
+        self.circumference = amount * 2.54 if unit == "in" else amount
+        world.current.wheel_circumference = self.circumference
+
+    def set_default_speed(self, speed):
+        self.default_speed = speed
+
+    def get_default_speed(self):
+        return self.default_speed
+
+    def set_stop_action(self, action):
+        pass
+
+
+class LightMatrix:
+    def show_image(self, image, brightness=100):
+        world.current.record("light_matrix", "show_image", image=image, brightness=brightness)
+
+    def write(self, text):
+        world.current.record("light_matrix", "write", text=str(text))
+
+    def set_pixel(self, x, y, brightness=100):
+        world.current.record("light_matrix", "set_pixel", x=x, y=y, brightness=brightness)
+
+    def off(self):
+        world.current.record("light_matrix", "off")
+
+
+class StatusLight:
+    def on(self, color="white"):
+        world.current.record("status_light", "on", color=color)
+
+    def off(self):
+        world.current.record("status_light", "off")
+
+
+class Speaker:
+    def __init__(self):
+        self.volume = 100
+
+    def beep(self, note=60, seconds=0.2, volume=None):
+        world.current.record("speaker", "beep", seconds, note=note)
+        world.current.advance(seconds)
+
+    def start_beep(self, note=60, volume=None):
+        world.current.record("speaker", "start_beep", note=note)
+
+    def stop(self):
+        world.current.record("speaker", "stop")
+
+    def get_volume(self):
+        return self.volume
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+
+class Button:
+    """A button that is never pressed, waiting for it returns immediately."""
+
+    def wait_until_pressed(self):
+        pass
+
+    def wait_until_released(self):
+        pass
+
+    def was_pressed(self):
+        return False
+
+    def is_pressed(self):
+        return False
+
+    def is_released(self):
+        return True
+
+
+class MotionSensor:
+    def get_yaw_angle(self):
+        world.current.call()
+        return world.current.yaw()
+
+    def get_roll_angle(self):
+        world.current.call()
+        return world.current.roll
+
+    def get_pitch_angle(self):
+        world.current.call()
+        return world.current.pitch
+
+    def reset_yaw_angle(self):
+        world.current.yaw_offset = world.current.heading
+
+    def get_orientation(self):
+        return "front"
+
+    def get_gesture(self):
+        return None
+
+    def was_gesture(self, gesture):
+        return False
+
+    def wait_for_new_gesture(self):
+        return None
+
+    def wait_for_new_orientation(self):
+        return "front"
+
+
+class MSHub:
+    def __init__(self):
+        self.light_matrix = LightMatrix()
+        self.status_light = StatusLight()
+        self.speaker = Speaker()
+        self.motion_sensor = MotionSensor()
+        self.left_button = Button()
+        self.right_button = Button()
+        self.PORT_A, self.PORT_B, self.PORT_C, self.PORT_D, self.PORT_E, self.PORT_F = "ABCDEF"
+
+
+class ColorSensor:
+    """A color sensor that sees nothing."""
+
+    def __init__(self, port):
+        self.port = port
+
+    def get_color(self):
+        return None
+
+    def get_reflected_light(self):
+        return 0
+
+    def get_ambient_light(self):
+        return 0
+
+    def get_rgb_intensity(self):
+        return (0, 0, 0, 0)
+
+    def light_up_all(self, brightness=100):
+        pass
+
+    def light_up(self, light_1, light_2, light_3):
+        pass
+
+
+class DistanceSensor:
+    """A distance sensor without anything in range."""
+
+    def __init__(self, port):
+        self.port = port
+
+    def get_distance_cm(self, short_range=False):
+        return None
+
+    def get_distance_inches(self, short_range=False):
+        return None
+
+    def get_distance_percentage(self, short_range=False):
+        return None
+
+    def light_up_all(self, brightness=100):
+        pass
+
+    def light_up(self, right_top, left_top, right_bottom, left_bottom):
+        pass
+
+
+class ForceSensor:
+    """A force sensor that is never pressed."""
+
+    def __init__(self, port):
+        self.port = port
+
+    def is_pressed(self):
+        return False
+
+    def get_force_newton(self):
+        return 0
+
+    def get_force_percentage(self):
+        return 0
+
+
+class App:
+    def play_sound(self, name, volume=100):
+        world.current.record("app", "play_sound", name=name)
+
+    def start_sound(self, name, volume=100):
+        world.current.record("app", "start_sound", name=name)
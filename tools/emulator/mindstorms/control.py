@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+# Stand-in for mindstorms.control on the virtual clock.
+
+import world
+
+from mindstorms.operator import equal_to
+
+POLL_INTERVAL = 0.01
+
+
+def wait_for_seconds(seconds):
+    world.current.advance(seconds)
+
+
+def wait_until(get_value_function, operator_function=equal_to, target_value=True):
+    # the time limit of the world ends conditions that never become true
+    while not operator_function(get_value_function(), target_value):
+        world.current.advance(POLL_INTERVAL)
+
+
+class Timer:
+    def __init__(self):
+        self.start = world.current.time
+
+    def reset(self):
+        self.start = world.current.time
+
+    def now(self):
+        return int(world.current.time - self.start)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+# Stand-in for mindstorms.operator.
+
+
+def greater_than(a, b):
+    return a > b
+
+
+def greater_than_or_equal_to(a, b):
+    return a >= b
+
+
+def less_than(a, b):
+    return a < b
+
+
+def less_than_or_equal_to(a, b):
+    return a <= b
+
+
+def equal_to(a, b):
+    return a == b
+
+
+def not_equal_to(a, b):
+    return a != b
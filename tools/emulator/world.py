@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+# State of an emulated robot: a virtual clock, the motors and a differential drive with a pen ("Tricky").
+# Blocking commands advance the clock instead of waiting, so a program runs in milliseconds.
+
+import math
+import types
+
+# the world the mindstorms stand-in modules act on, set by emulate.py for each run
+current = None
+
+
+class TimeLimit(BaseException):
+    """Raised when the program runs longer than the time limit, e.g. in an endless loop. It is no Exception, so the
+    program cannot catch it by accident."""
+
+
+class MotorState:
+    def __init__(self, port):
+        self.port = port
+        self.speed = 0.0  # deg/s
+        self.degrees = 0.0
+
+
+class World:
+    def __init__(self, drive=("B", "A"), track=11.2, pen_port="C", pen_offset=8.6, pen_up_position=165,
+                 max_speed=1000, time_limit=600, step=0.05, call_time=0.001, roll=0, pitch=0):
+        self.drive = drive
+        self.track = track
+        self.pen_port = pen_port
+        self.pen_offset = pen_offset
+        self.pen_up_position = pen_up_position
+        self.max_speed = max_speed
+        self.time_limit = time_limit
+        self.step = step
+        self.call_time = call_time
+        self.roll = roll
+        self.pitch = pitch
+
+        self.time = 0.0
+        self.motors = {}
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = math.pi / 2
+        self.yaw_offset = self.heading
+        self.wheel_circumference = 17.6
+        self.strokes = []
+        self.pen_down = False
+        self.events = []
+        self.output = []
+
+    def motor(self, port):
+        if port not in self.motors:
+            self.motors[port] = MotorState(port)
+        return self.motors[port]
+
+    def speed(self, percent):
+        """Converts a speed in percent into deg/s."""
+        return max(-100, min(100, percent)) * self.max_speed / 100
+
+    def record(self, target, command, duration=0.0, **args):
+        self.events.append({"t": round(self.time, 6), "target": target, "command": command,
+                            "duration": round(duration, 6), "args": args})
+        if not duration:
+            self.call()
+
+    def call(self):
+        """Lets the time of a non-blocking call pass, so polling loops like programs/balance.py make progress."""
+        self.advance(self.call_time)
+
+    def print(self, *args, sep=" ", end="\n", **kwargs):
+        self.output.append(sep.join(str(arg) for arg in args) + end)
+
+    def pen(self):
+        return (self.x + self.pen_offset * math.cos(self.heading), self.y + self.pen_offset * math.sin(self.heading))
+
+    def update_pen(self):
+        pen_down = self.pen_port in self.motors and \
+            self.motors[self.pen_port].degrees - self.pen_up_position >= 45
+        if pen_down and not self.pen_down:
+            self.strokes.append([self.pen()])
+        elif pen_down:
+            self.strokes[-1].append(self.pen())
+        self.pen_down = pen_down
+
+    def advance(self, duration):
+        """Moves all running motors and the robot for duration seconds."""
+        if duration <= 0:
+            return
+        if self.time + duration > self.time_limit:
+            raise TimeLimit(f"program runs longer than {self.time_limit}s")
+
+        left, right = (self.motors.get(port) for port in self.drive)
+        # the left motor is mirrored, it turns backwards when the robot drives forward
+        v_left = -left.speed / 360 * self.wheel_circumference if left else 0.0
+        v_right = right.speed / 360 * self.wheel_circumference if right else 0.0
+        v = (v_left + v_right) / 2
+        omega = (v_right - v_left) / self.track
+
+        # small steps, so pen strokes follow arcs and the pen motor's position
+        steps = max(1, math.ceil(duration / self.step), math.ceil(abs(omega * duration) / math.radians(5)))
+        dt = duration / steps
+        for _ in range(steps):
+            if abs(omega) < 1e-9:
+                self.x += v * dt * math.cos(self.heading)
+                self.y += v * dt * math.sin(self.heading)
+            else:
+                heading = self.heading + omega * dt
+                self.x += v / omega * (math.sin(heading) - math.sin(self.heading))
+                self.y -= v / omega * (math.cos(heading) - math.cos(self.heading))
+                self.heading = heading
+            for motor in self.motors.values():
+                motor.degrees += motor.speed * dt
+            self.time += dt
+            self.update_pen()
+
+    def yaw(self):
+        """Yaw angle in degrees like the hub reports it, clockwise positive in -180..180."""
+        yaw = -math.degrees(self.heading - self.yaw_offset)
+        return int(round((yaw + 180) % 360 - 180))
+
+    def time_module(self):
+        """Returns a stand-in for MicroPython's time module on the virtual clock."""
+        module = types.ModuleType("time")
+        module.time = lambda: self.time
+        module.ticks_ms = lambda: int(self.time * 1000)
+        module.ticks_us = lambda: int(self.time * 1000000)
+        module.ticks_diff = lambda a, b: a - b
+        module.ticks_add = lambda a, b: a + b
+        module.sleep = self.advance
+        module.sleep_ms = lambda ms: self.advance(ms / 1000)
+        module.sleep_us = lambda us: self.advance(us / 1000000)
+        return module
+
+    def result(self):
+        return {
+            "time": round(self.time, 6),
+            "pose": [round(self.x, 3), round(self.y, 3), self.yaw()],
+            "strokes": [[[round(x, 3), round(y, 3)] for x, y in stroke] for stroke in self.strokes],
+            "events": self.events,
+            "output": self.output,
+        }
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# A minimal fake gateway answering RPC requests with fixed responses, so no hub is needed. Used by startup_bench.py
+# and the tests:
+#
+#   with FakeGateway(0) as gateway:
+#       rpc = spikejsonrpc.RPC(gateway.address)
+
+import json
+import socket
+import threading
+
+RESPONSES = {
+    'get_storage_status': {
+        'storage': {'available': 28372, 'total': 31744, 'pct': 11.6225, 'unit': 'kb', 'free': 28372},
+        'slots': {},
+    },
+    'get_hub_info': {'version': [1, 0, 6, 34], 'runtime': [2, 1, 4]},
+}
+
+
+class FakeGateway:
+    def __init__(self, port):
+        self.server_socket = socket.create_server(('localhost', port))
+        self.address = self.server_socket.getsockname()
+        self.client_sockets = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def serve(self):
+        while True:
+            try:
+                client_socket, _ = self.server_socket.accept()
+            except OSError:
+                # closed
+                return
+            with self.lock:
+                self.client_sockets.append(client_socket)
+            threading.Thread(target=self.handle, args=(client_socket,), daemon=True).start()
+
+    def handle(self, client_socket):
+        buffer = b''
+        with client_socket:
+            while True:
+                try:
+                    data = client_socket.recv(1024)
+                except OSError:
+                    return
+                if not data:
+                    return
+                buffer += data
+                while b'\r' in buffer:
+                    line, buffer = buffer.split(b'\r', 1)
+                    request = json.loads(line)
+                    response = {'i': request['i'], 'r': RESPONSES.get(request['m'])}
+                    client_socket.sendall(json.dumps(response).encode('utf-8') + b'\r')
+
+    def close(self):
+        self.server_socket.close()
+        with self.lock:
+            for client_socket in self.client_sockets:
+                try:
+                    client_socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self.client_sockets.clear()
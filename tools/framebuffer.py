@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+# Framebuffer for the 5x5 LED matrix of the hub. Pixels are drawn locally, commit() sends only what changed since the
+# last commit, either as single scratch.display_set_pixel calls or as one scratch.display_image, whatever needs fewer
+# round trips. play() streams an animation at a target frame rate and drops frames when the link falls behind:
+#
+#   display = framebuffer.Framebuffer(spikejsonrpc.RPC())
+#   display.set_pixel(2, 2, 9)
+#   display.commit()
+#   display.play(["00000:00000:00900:00000:00000", "00000:09990:09090:09990:00000"] * 10, fps=10)
+
+import time
+
+SIZE = 5
+MAX_BRIGHTNESS = 9
+
+
+def parse_image(image):
+    """Converts an image string "xxxxx:xxxxx:xxxxx:xxxxx:xxxxx" or rows of brightness values into a list of 25
+    brightness values."""
+    rows = image.split(":") if isinstance(image, str) else image
+    if len(rows) != SIZE or any(len(row) != SIZE for row in rows):
+        raise ValueError(f"image needs {SIZE} rows of {SIZE} pixels: {image!r}")
+    return [check_brightness(int(value)) for row in rows for value in row]
+
+
+def format_image(pixels):
+    return ":".join("".join(str(value) for value in pixels[y * SIZE:(y + 1) * SIZE]) for y in range(SIZE))
+
+
+def check_brightness(brightness):
+    if not 0 <= brightness <= MAX_BRIGHTNESS:
+        raise ValueError(f"brightness has to be in range 0-{MAX_BRIGHTNESS}: {brightness}")
+    return brightness
+
+
+class Framebuffer:
+    def __init__(self, rpc, image_cost=1):
+        """image_cost is the cost of a display_image call in display_set_pixel calls, an image is sent if it is
+        cheaper than the changed pixels."""
+        self.rpc = rpc
+        self.image_cost = image_cost
+        self.pixels = [0] * SIZE * SIZE
+        # what the hub shows, None until the first commit
+        self.shown = None
+        self.calls = 0
+
+    def get_pixel(self, x, y):
+        return self.pixels[self.index(x, y)]
+
+    def set_pixel(self, x, y, brightness=MAX_BRIGHTNESS):
+        self.pixels[self.index(x, y)] = check_brightness(brightness)
+
+    def fill(self, brightness=0):
+        self.pixels = [check_brightness(brightness)] * SIZE * SIZE
+
+    def clear(self):
+        self.fill(0)
+
+    def load(self, image):
+        self.pixels = parse_image(image)
+
+    def image(self):
+        return format_image(self.pixels)
+
+    def invalidate(self):
+        """Forgets what the hub shows, e.g. after display_text, so the next commit sends the whole image."""
+        self.shown = None
+
+    def dirty(self):
+        """Returns the indices of the pixels that differ from what the hub shows."""
+        if self.shown is None:
+            return list(range(SIZE * SIZE))
+        return [i for i, (pixel, shown) in enumerate(zip(self.pixels, self.shown)) if pixel != shown]
+
+    def commit(self):
+        """Sends the changes to the hub and returns the number of calls."""
+        dirty = self.dirty()
+        if not dirty:
+            return 0
+        if len(dirty) > self.image_cost:
+            if any(self.pixels):
+                self.rpc.display_image(self.image())
+            else:
+                self.rpc.display_clear()
+            calls = 1
+        else:
+            for i in dirty:
+                self.rpc.display_set_pixel(i % SIZE, i // SIZE, self.pixels[i])
+            calls = len(dirty)
+        self.shown = list(self.pixels)
+        self.calls += calls
+        return calls
+
+    def play(self, frames, fps=10, clock=time.monotonic, sleep=time.sleep):
+        """Shows the frames (images or rows) at fps frames per second. If committing a frame takes longer than its
+        slot, the frames that are already due are skipped and the latest of them is shown. Returns the number of
+        shown and dropped frames."""
+        interval = 1 / fps
+        shown = dropped = 0
+        start = clock()
+        pending = None
+        for n, frame in enumerate(frames):
+            if pending is not None:
+                dropped += 1
+            pending = frame
+            next_due = start + (n + 1) * interval
+            if clock() >= next_due:
+                # the link is behind, the next frame is due already
+                continue
+            self.load(pending)
+            self.commit()
+            pending = None
+            shown += 1
+            delay = next_due - clock()
+            if delay > 0:
+                sleep(delay)
+        if pending is not None:
+            # the last frame is always shown
+            self.load(pending)
+            self.commit()
+            shown += 1
+        return shown, dropped
+
+    @staticmethod
+    def index(x, y):
+        if not (0 <= x < SIZE and 0 <= y < SIZE):
+            raise IndexError(f"pixel ({x}, {y}) is outside of the display")
+        return y * SIZE + x
@@ -0,0 +1,113 @@
+import unittest
+
+import framebuffer
+
+CROSS = "90009:09090:00900:09090:90009"
+
+
+class FakeRPC:
+    def __init__(self, clock=None, latency=0.0):
+        self.calls = []
+        self.clock = clock
+        self.latency = latency
+
+    def call(self, *args):
+        self.calls.append(args)
+        if self.clock:
+            self.clock.now += self.latency
+
+    def display_set_pixel(self, x, y, brightness=9):
+        self.call("set_pixel", x, y, brightness)
+
+    def display_image(self, image):
+        self.call("image", image)
+
+    def display_clear(self):
+        self.call("clear")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FramebufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rpc = FakeRPC()
+        self.display = framebuffer.Framebuffer(self.rpc)
+
+    def test_first_commit_sends_image(self):
+        self.display.set_pixel(1, 2, 5)
+        self.assertEqual(1, self.display.commit())
+        self.assertEqual([("image", "00000:00000:05000:00000:00000")], self.rpc.calls)
+        self.assertEqual(0, self.display.commit())
+
+    def test_few_pixels(self):
+        self.display.commit()
+        self.display.set_pixel(4, 0)
+        self.display.commit()
+        self.assertEqual([("clear",), ("set_pixel", 4, 0, 9)], self.rpc.calls)
+
+    def test_many_pixels(self):
+        display = framebuffer.Framebuffer(self.rpc, image_cost=3)
+        display.load(CROSS)
+        display.commit()
+        display.set_pixel(0, 0, 0)
+        display.set_pixel(4, 4, 0)
+        display.commit()
+        display.fill(9)
+        display.commit()
+        self.assertEqual([("image", CROSS), ("set_pixel", 0, 0, 0), ("set_pixel", 4, 4, 0),
+                          ("image", "99999:99999:99999:99999:99999")], self.rpc.calls)
+        self.assertEqual(4, display.calls)
+
+    def test_invalidate(self):
+        self.display.commit()
+        self.display.invalidate()
+        self.display.commit()
+        self.assertEqual([("clear",), ("clear",)], self.rpc.calls)
+
+    def test_invalid(self):
+        self.assertRaises(IndexError, self.display.set_pixel, 5, 0)
+        self.assertRaises(ValueError, self.display.set_pixel, 0, 0, 10)
+        self.assertRaises(ValueError, self.display.load, "9999:99999:99999:99999:99999")
+
+    def test_rows(self):
+        self.display.load([[0, 1, 2, 3, 4]] * 5)
+        self.assertEqual(3, self.display.get_pixel(3, 4))
+        self.assertEqual(":".join(["01234"] * 5), self.display.image())
+
+
+class PlayTestCase(unittest.TestCase):
+    def frames(self, count):
+        return [framebuffer.format_image([n % 10] + [0] * 24) for n in range(count)]
+
+    def test_on_time(self):
+        clock = FakeClock()
+        rpc = FakeRPC(clock, latency=0.02)
+        display = framebuffer.Framebuffer(rpc)
+        self.assertEqual((10, 0), display.play(self.frames(10), fps=10, clock=clock, sleep=clock.sleep))
+        self.assertAlmostEqual(1.0, clock.now)
+
+    def test_drops_frames(self):
+        clock = FakeClock()
+        rpc = FakeRPC(clock, latency=0.25)
+        display = framebuffer.Framebuffer(rpc)
+        frames = self.frames(10)
+        shown, dropped = display.play(frames, fps=10, clock=clock, sleep=clock.sleep)
+        self.assertEqual(10, shown + dropped)
+        self.assertGreater(dropped, 0)
+        self.assertLess(clock.now, 10 * 0.25)
+        # the last frame is shown in the end
+        self.assertEqual(frames[-1], display.image())
+        self.assertEqual(("set_pixel", 0, 0, 9), rpc.calls[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Binary framing for gateway clients. Instead of the hub's JSON text a client can ask for length-prefixed frames:
+#
+#   uint32 length (big endian), uint8 kind, payload[length - 1]
+#
+# kind MESSAGE:  the decoded hub message, encoded with MessagePack or CBOR
+# kind SENSOR:   a m=0 notification in a fixed little endian layout (see SENSOR_LAYOUT)
+# kind RAW:      a line from the hub that is no valid JSON, as is
+#
+# The gateway decodes every hub message once and encodes it once per format, all clients using the same format
+# share the encoded buffer.
+
+import base64
+import json
+import socket
+import struct
+
+MESSAGE = 0
+SENSOR = 1
+RAW = 2
+
+HEADER = struct.Struct(">IB")
+
+# hub time, 6 x (gadget, value count, 4 values), accelerometer, gyroscope, position, display length
+SENSOR_LAYOUT = struct.Struct("<i" + "Bb4h" * 6 + "9hB")
+NULL = -0x8000
+
+
+def load_codec(name):
+    """Returns (encode, decode) functions of a binary format, its module is only imported when needed."""
+    if name == "msgpack":
+        import msgpack
+        return msgpack.packb, lambda data: msgpack.unpackb(data, raw=False)
+    if name == "cbor":
+        import cbor2
+        return cbor2.dumps, cbor2.loads
+    raise ValueError(f"unknown format '{name}'")
+
+
+def pack_sensor(p):
+    """Packs a m=0 payload or returns None if it does not fit into the fixed layout."""
+    try:
+        if len(p) != 11:
+            return None
+        values = [p[10]]
+        for gadget, port_values in p[0:6]:
+            if len(port_values) > 4:
+                return None
+            values += [gadget, len(port_values)]
+            values += [NULL if value is None else value for value in port_values]
+            values += [NULL] * (4 - len(port_values))
+        values += p[6] + p[7] + p[8]
+        display = p[9].encode('utf-8')
+        values.append(len(display))
+        return SENSOR_LAYOUT.pack(*values) + display
+    except (struct.error, TypeError, ValueError, AttributeError):
+        # a float, a value out of range or a malformed entry, the message is sent as is
+        return None
+
+
+def unpack_sensor(payload):
+    values = SENSOR_LAYOUT.unpack_from(payload)
+    p = []
+    for i in range(6):
+        gadget, count, *port_values = values[1 + i * 6:7 + i * 6]
+        p.append([gadget, [None if value == NULL else value for value in port_values[:count]]])
+    p += [list(values[37:40]), list(values[40:43]), list(values[43:46])]
+    p.append(payload[SENSOR_LAYOUT.size:SENSOR_LAYOUT.size + values[46]].decode('utf-8'))
+    p.append(values[0])
+    return {"m": 0, "p": p}
+
+
+def frame(kind, payload):
+    return HEADER.pack(len(payload) + 1, kind) + payload
+
+
+class Encoder:
+    def __init__(self, name):
+        self.name = name
+        self.encode_message, _ = load_codec(name)
+
+    def encode(self, line, message):
+        if message is None:
+            return frame(RAW, line)
+        if message.get("m") == 0 and len(message) == 2:
+            payload = pack_sensor(message["p"])
+            if payload is not None:
+                return frame(SENSOR, payload)
+        return frame(MESSAGE, self.encode_message(message))
+
+
+class FrameReader:
+    """Splits received data into frames and decodes them, returns raw lines as bytes."""
+
+    def __init__(self, name):
+        _, self.decode_message = load_codec(name)
+        self.buffer = bytes()
+
+    def feed(self, data):
+        self.buffer += data
+        while len(self.buffer) >= HEADER.size:
+            length, kind = HEADER.unpack_from(self.buffer)
+            if len(self.buffer) < 4 + length:
+                return
+            payload = self.buffer[HEADER.size:4 + length]
+            self.buffer = self.buffer[4 + length:]
+            if kind == SENSOR:
+                yield unpack_sensor(payload)
+            elif kind == MESSAGE:
+                yield self.decode_message(payload)
+            else:
+                yield payload
+
+
+def line_end(buffer):
+    ends = [pos for pos in (buffer.find(b'\r'), buffer.find(b'\n')) if pos != -1]
+    return min(ends) if ends else -1
+
+
+def connect(address, name):
+    """Connects to a gateway, switches to a binary format and yields the received hub messages."""
+    with socket.create_connection(address) as client_socket:
+        request = {"i": "strm", "m": "gateway.stream", "p": {"format": name}}
+        client_socket.sendall(json.dumps(request).encode('utf-8') + b'\r')
+
+        # the response is the last text line, everything after it is binary
+        buffer = bytes()
+        response = None
+        while response is None:
+            data = client_socket.recv(1024)
+            if not data:
+                return
+            buffer += data
+            while response is None:
+                end = line_end(buffer)
+                if end == -1:
+                    break
+                line, buffer = buffer[:end], buffer[end + 1:]
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(message, dict) and message.get("i") == request["i"]:
+                    response = message
+        if "e" in response:
+            raise ConnectionError(json.loads(base64.b64decode(response["e"])))
+
+        reader = FrameReader(name)
+        yield from reader.feed(buffer)
+        while True:
+            data = client_socket.recv(4096)
+            if not data:
+                return
+            yield from reader.feed(data)
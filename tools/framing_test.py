@@ -0,0 +1,105 @@
+import json
+import socket
+import threading
+import unittest
+
+import framing
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+SENSOR = {"m": 0, "p": [[75, [0, 0, -138, 0]], [75, [0, 1, 121, 0]], [75, [0, 0, 136, 0]], [62, [None]], [0, []],
+                        [0, []], [-19, -11, 1008], [3, 8, -1], [-47, 1, 0], "", 1234]}
+
+
+class SensorLayoutTestCase(unittest.TestCase):
+    def test_roundtrip(self):
+        payload = framing.pack_sensor(SENSOR["p"])
+        self.assertLess(len(payload), len(json.dumps(SENSOR)) / 2)
+        self.assertEqual(framing.unpack_sensor(payload), SENSOR)
+
+    def test_display(self):
+        p = json.loads(json.dumps(SENSOR["p"]))
+        p[9] = "09090:99999"
+        self.assertEqual(framing.unpack_sensor(framing.pack_sensor(p))["p"], p)
+
+    def test_not_packable(self):
+        p = json.loads(json.dumps(SENSOR["p"]))
+        p[6][0] = 0.5
+        self.assertIsNone(framing.pack_sensor(p))
+        p[6][0] = 100000
+        self.assertIsNone(framing.pack_sensor(p))
+
+    def test_malformed(self):
+        for port in ([75], 75, [75, 5], [75, ["x"]]):
+            p = json.loads(json.dumps(SENSOR["p"]))
+            p[0] = port
+            self.assertIsNone(framing.pack_sensor(p), port)
+        p = json.loads(json.dumps(SENSOR["p"]))
+        p[9] = None
+        self.assertIsNone(framing.pack_sensor(p))
+        self.assertIsNone(framing.pack_sensor(None))
+
+
+@unittest.skipUnless(msgpack, "msgpack not installed")
+class FrameReaderTestCase(unittest.TestCase):
+    def test_split_frames(self):
+        encoder = framing.Encoder("msgpack")
+        battery = {"m": 2, "p": [7.893, 80, True]}
+        data = encoder.encode(b'', SENSOR) + encoder.encode(b'', battery) + encoder.encode(b'0]}', None)
+
+        reader = framing.FrameReader("msgpack")
+        messages = list(reader.feed(data[:7])) + list(reader.feed(data[7:]))
+        self.assertEqual(messages, [SENSOR, battery, b'0]}'])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            framing.Encoder("xml")
+
+    def test_malformed_sensor_message(self):
+        message = {"m": 0, "p": [[75]] * 6 + [[0, 0, 0], [0, 0, 0], [0, 0, 0], "", 1]}
+        data = framing.Encoder("msgpack").encode(b'', message)
+        self.assertEqual(framing.MESSAGE, data[4])
+        self.assertEqual([message], list(framing.FrameReader("msgpack").feed(data)))
+
+    def test_connect(self):
+        encoder = framing.Encoder("msgpack")
+        server = socket.create_server(("localhost", 0))
+        self.addCleanup(server.close)
+
+        def gateway():
+            connection, _ = server.accept()
+            with connection:
+                connection.recv(1024)
+                # a hub line before the response, which is written without spaces
+                connection.sendall(b'{"m":2,"p":[7.89, 80, true]}\r\n{"i":"strm","r":{"format":"msgpack"}}\r' +
+                                   encoder.encode(b'', SENSOR))
+
+        thread = threading.Thread(target=gateway)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.assertEqual([SENSOR], list(framing.connect(server.getsockname(), "msgpack")))
+
+
+@unittest.skipUnless(cbor2, "cbor2 not installed")
+class CborTestCase(unittest.TestCase):
+    def test_split_frames(self):
+        encoder = framing.Encoder("cbor")
+        battery = {"m": 2, "p": [7.893, 80, True]}
+        data = encoder.encode(b'', SENSOR) + encoder.encode(b'', battery) + encoder.encode(b'0]}', None)
+        self.assertEqual(framing.SENSOR, data[4])
+
+        reader = framing.FrameReader("cbor")
+        messages = list(reader.feed(data[:7])) + list(reader.feed(data[7:]))
+        self.assertEqual(messages, [SENSOR, battery, b'0]}'])
+
+
+if __name__ == '__main__':
+    unittest.main()
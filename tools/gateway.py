@@ -6,15 +6,24 @@ import argparse
 import base64
 import json
 import os
+import signal
 import socket
 import sys
+import threading
 import traceback
-from time import sleep
-
-import bluetooth
-import serial
+from datetime import datetime
+from time import sleep, time
 
 from ansi import esc, color
+import clocksync
+import delta
+import framing
+import hubprofile
+import hubstate
+import instrumentation
+import pipeline
+import responsecache
+import scheduler
 import select
 
 # for testing you can use a PTY:
@@ -67,10 +76,14 @@ class LineReader:
 
 
 class HubConnection(LineReader):
+    # False if the hub never answers requests, e.g. when a trace is replayed
+    answers = True
+
     def __init__(self, name):
         super().__init__(name)
         self.charging = False
         self.charged = 0
+        self.profile = hubprofile.ProfileReport()
 
     def read(self):
         pass
@@ -82,21 +95,53 @@ class HubConnection(LineReader):
         pass
 
     def read_line(self, line, line_terminators):
-        log.input(line)
-        self.parse_line(line.decode('utf-8', 'ignore'))
+        # host time of the line, sensor frames get the corrected time they were sampled on the hub
+        self.received = self.timestamp = time()
+        message = self.parse_line(line.decode('utf-8', 'ignore'))
+        log.input(line, self.timestamp)
+        if pipelines and message is not None:
+            push_event(pipeline.Event(self.timestamp, '<', message))
+        # each format is encoded at most once per line, all clients using it share the buffer
+        encoded = {None: line + line_terminators}
+        stamped = None
         closed_clients = []
         for client in clients:
             try:
-                client.write_line(line, line_terminators)
+                if client.timestamps and message is not None and message.get('m') == 0:
+                    if stamped is None:
+                        stamped = dict(message, t=round(self.timestamp, 6))
+                        stamped_line = json.dumps(stamped).encode('utf-8')
+                        stamped_encoded = {None: stamped_line + line_terminators}
+                    client.write_message(stamped_line, stamped, stamped_encoded)
+                else:
+                    client.write_message(line, message, encoded)
             except:
                 closed_clients.append(client)
                 client.close()
+        if message is not None and 'i' in message and ('r' in message or 'e' in message):
+            rtt = hub_requests.response(message['i'])
+            if rtt is not None:
+                clock.round_trip(rtt)
+            origin = request_ids.answer(message['i'])
+            if origin is not None:
+                client, i = origin
+                response = message
+                if i != message['i']:
+                    # the request was forwarded with a new id, its client gets the answer with its own id
+                    response = dict(message, i=i)
+                    if client not in closed_clients and client in clients:
+                        client.write_response(response)
+                # answers for the clients whose identical requests were collapsed into this one
+                for waiter, waiter_response in cache.response(client, response):
+                    if waiter not in closed_clients and waiter in clients:
+                        waiter.write_response(waiter_response)
         for client in closed_clients:
             clients.remove(client)
 
     def parse_line(self, line):
+        message = None
         try:
-            message = json.loads(line)
+            message = self.decode(line)
             if 'i' in message and 'm' in message and 'p' in message:
                 self.handle_request(message)
             elif 'i' not in message and 'm' in message and 'p' in message:
@@ -114,6 +159,10 @@ class HubConnection(LineReader):
         except Exception as e:
             traceback.print_exc()
             self.print(f"{color:2}{e}{color:0}: {line}", f"{color:31}FAILED:")
+        return message if isinstance(message, dict) else None
+
+    def decode(self, line):
+        return json.loads(line)
 
     def decode_base64(self, value):
         return base64.b64decode(value).decode('utf-8', 'ignore')
@@ -122,6 +171,9 @@ class HubConnection(LineReader):
         i = message['i']
         m = message['m']
         p = message['p']
+        if m == 'userProgram.print':
+            self.handle_user_program_print(message)
+            return
         self.print(f"{m}: {json.dumps(p)}", f"{color:33}REQUEST:", id=i)
 
     def handle_response(self, message):
@@ -135,7 +187,20 @@ class HubConnection(LineReader):
         p = message['p']
         if m != 'userProgram.print':
             raise AssertionError(f"m={m} but expected to be userProgram.print")
-        self.print(self.decode_base64(p['value']), "{color:32}OUTPUT:", id=i, wrap=True)
+        value = self.decode_base64(p['value'])
+        if hubprofile.PREFIX not in value:
+            self.print(value, f"{color:32}OUTPUT:", id=i, wrap=True)
+            return
+        # reports of a program instrumented by hubprofile.py, mixed with its regular output
+        output = []
+        for line in value.splitlines():
+            if line.startswith(hubprofile.PREFIX):
+                name = self.profile.add(line)
+                self.print(self.profile.format(name), f"{color:36}PROFILE:", id=i)
+            else:
+                output.append(line)
+        if output:
+            self.print("\n".join(output), f"{color:32}OUTPUT:", id=i, wrap=True)
 
     def handle_error(self, message):
         i = message['i']
@@ -145,13 +210,19 @@ class HubConnection(LineReader):
     def handle_notification(self, message):
         m = message['m']
         p = message['p']
+        cache.notification(m)
         if m == 0:
+            self.timestamp = clock.frame(p[10], self.received)
+            archive.append(self.timestamp, p)
+            snapshot.frame(self.timestamp, p)
             self.handle_sensor_notification(p[0:6], p[6], p[7], p[8], p[9], p[10])
         elif m == 1:
             self.handle_storage_notification(p)
         elif m == 2:
+            snapshot.battery(self.received, *p)
             self.handle_battery_notification(*p)
         elif m == 3:
+            snapshot.button(self.received, *p)
             self.handle_button_notification(*p)
         elif m == 4:
             self.handle_gesture_notification(p)
@@ -165,6 +236,7 @@ class HubConnection(LineReader):
         # 10 error
         # 11 vm state
         elif m == 12:
+            snapshot.program(self.received, p)
             self.handle_program_notification(p)
         # 13 linegraph timer reset
         # 14 orientation status
@@ -251,8 +323,35 @@ class HubConnection(LineReader):
         sys.stdout.write(data)
 
 
+# Hub transports are registered by name and import their backend (pyserial, pybluez) only when they are
+# instantiated, so replaying a trace or running the tests does not need any of them installed. Additional
+# transports can be provided by other packages through the "robot_inventor_tools.transports" entry point group.
+transports = {}
+
+
+def transport(name):
+    def register(cls):
+        transports[name] = cls
+        return cls
+    return register
+
+
+def get_transport(name):
+    if name not in transports:
+        from importlib.metadata import entry_points
+        for entry_point in entry_points(group="robot_inventor_tools.transports"):
+            if entry_point.name == name:
+                transports[name] = entry_point.load()
+                break
+        else:
+            raise KeyError(f"unknown transport '{name}' (available: {', '.join(sorted(transports))})")
+    return transports[name]
+
+
+@transport("serial")
 class SerialHubConnection(HubConnection):
     def __init__(self, port):
+        import serial
         super().__init__(f"SerialHubConnection ({port})")
         self.port = serial.Serial(port)
 
@@ -272,8 +371,10 @@ class SerialHubConnection(HubConnection):
         return self.port.name
 
 
+@transport("rfcomm")
 class BluetoothHubConnection(HubConnection):
     def __init__(self, device):
+        import bluetooth
         super().__init__(f"BluetoothClientConnection ({device})")
         self.socket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
         self.socket.connect((device, 1))
@@ -294,7 +395,10 @@ class BluetoothHubConnection(HubConnection):
         return self.socket.getpeername()
 
 
+@transport("file")
 class FileHubConnection(HubConnection):
+    answers = False
+
     def __init__(self, path):
         super().__init__(f"FileHubConnection ({path})")
         self.file = open(path, 'rb')
@@ -307,6 +411,8 @@ class FileHubConnection(HubConnection):
                 print("\nEOF")
                 os._exit(1)
         data = data[2:]
+        if data.startswith(b'@'):
+            data = data.split(b' ', 1)[1]
         data = data.replace(b'\n', b'\r')
         sleep(0.001)
         return data
@@ -328,12 +434,119 @@ class ClientConnection(LineReader):
     def __init__(self, name):
         super().__init__(name)
         self.name = name
+        self.encoder = None
+        self.timestamps = False
         clients.append(self)
 
     def read_line(self, line, line_terminators):
+        # requests to the gateway itself, e.g. {"i": "x1Yz", "m": "gateway.stream", "p": {"format": "msgpack"}}
+        if b'"gateway.' in line:
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                message = None
+            if isinstance(message, dict) and str(message.get('m')).startswith('gateway.'):
+                self.handle_gateway_request(message)
+                return
+
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            message = None
+        if isinstance(message, dict) and 'm' in message:
+            response = cache.request(self, message)
+            if response:
+                print(f"{color:33}CACHED:{color:0}  ", line.decode('utf-8', 'ignore'), end=f"{esc:K}\n")
+                self.write_response(response)
+                return
+            if response is False:
+                print(f"{color:33}COLLAPSED:{color:0}", line.decode('utf-8', 'ignore'), end=f"{esc:K}\n")
+                return
+
         print(f"{color:33}REQUEST:{color:0} ", line.decode('utf-8', 'ignore'), end=f"{esc:K}\n")
-        log.output(line)
-        hub.write_line(line, line_terminators)
+        if isinstance(message, dict) and 'i' in message and 'm' in message:
+            message, line = request_ids.forward(self, message, line)
+        hub_requests.submit(line, line_terminators, message)
+
+    def handle_gateway_request(self, message):
+        i = message.get('i')
+        m = message['m']
+        p = message.get('p', {})
+        print(f"{color:35}GATEWAY:{color:0} ", f"{m}: {json.dumps(p)}", end=f"{esc:K}\n")
+        try:
+            if m == 'gateway.stream':
+                result = self.handle_stream_request(p)
+            elif m == 'gateway.clock':
+                result = clock.state()
+            elif m == 'gateway.stats':
+                result = self.handle_stats_request(p)
+            elif m == 'gateway.profile':
+                result = self.handle_profile_request(p)
+            else:
+                raise ValueError(f"unknown gateway method {m}")
+        except Exception as e:
+            error = {'message': str(e), 'type': type(e).__name__}
+            self.write_response({'i': i, 'e': base64.b64encode(json.dumps(error).encode('utf-8')).decode('ascii')})
+        else:
+            if m == 'gateway.stream':
+                # the acknowledgement is the last text line, the client reads its new format after it
+                self.write_json({'i': i, 'r': result})
+            else:
+                self.write_response({'i': i, 'r': result})
+
+    def handle_stream_request(self, p):
+        format = p.get('format', 'json')
+        timestamps = bool(p.get('timestamps', False))
+        if timestamps and format != 'json':
+            raise ValueError("timestamps are only supported with format json")
+        if format == 'json':
+            encoder = None
+        elif format == 'delta':
+            encoder = delta.DeltaEncoder(p.get('keyframe', 50), p.get('deadband', {}))
+        else:
+            # stateless encoders are shared, so their output is shared, too
+            if format not in encoders:
+                encoders[format] = framing.Encoder(format)
+            encoder = encoders[format]
+        # an invalid request keeps the format, its error is sent in the format the client reads
+        self.encoder, self.timestamps = encoder, timestamps
+        return {'format': format, 'timestamps': True} if timestamps else {'format': format}
+
+    def handle_stats_request(self, p):
+        # {"enable": true} installs the counters, {"enable": false} removes them, {"reset": true} clears them
+        if p.get('reset'):
+            stages.reset()
+        if p.get('enable') is True:
+            stages.enable()
+        elif p.get('enable') is False:
+            stages.disable()
+        return {'enabled': stages.enabled, 'stages': stages.report()}
+
+    def handle_profile_request(self, p):
+        # {"action": "start"} starts sampling, {"action": "stop", "path": ...} stops and writes the collapsed stacks
+        action = p.get('action', 'status')
+        if action == 'start':
+            profiler.start(main_thread)
+        elif action == 'stop':
+            path = profile_path(p.get('path'))
+            profiler.stop()
+            return {'running': False, 'path': path, 'samples': profiler.dump(path)}
+        elif action != 'status':
+            raise ValueError(f"unknown profile action {action}")
+        return {'running': profiler.running, 'samples': sum(profiler.samples.values())}
+
+    def write_json(self, message):
+        self.write(json.dumps(message).encode('utf-8') + b'\r')
+
+    def write_response(self, message):
+        line = json.dumps(message).encode('utf-8')
+        self.write_message(line, message, {None: line + b'\r'})
+
+    def write_message(self, line, message, encoded):
+        if self.encoder not in encoded:
+            encoded[self.encoder] = self.encoder.encode(line, message)
+        if encoded[self.encoder]:
+            self.write(encoded[self.encoder])
 
     def read(self):
         pass
@@ -363,6 +576,7 @@ class SocketClientConnection(ClientConnection):
 
 class BluetoothClientConnection(SocketClientConnection):
     def __init__(self):
+        import bluetooth
         self.server_socket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
         self.server_socket.bind(('', bluetooth.PORT_ANY))
         self.server_socket.listen(1)
@@ -391,10 +605,10 @@ class NoopLogger:
     def __init__(self):
         print("No Logging")
 
-    def output(self, line):
+    def output(self, line, t=None):
         pass
 
-    def input(self, line):
+    def input(self, line, t=None):
         pass
 
 
@@ -403,11 +617,55 @@ class FileLogger:
         print(f"Logging to {path}")
         self.file = open(path, mode='wb', buffering=0)
 
-    def output(self, line):
-        self.file.write(b'> ' + line + b'\n')
+    def output(self, line, t=None):
+        if t is None:
+            self.file.write(b'> ' + line + b'\n')
+        else:
+            self.file.write(b'> @%.6f ' % t + line + b'\n')
+
+    def input(self, line, t=None):
+        if t is None:
+            self.file.write(b'< ' + line + b'\n')
+        else:
+            self.file.write(b'< @%.6f ' % t + line + b'\n')
 
-    def input(self, line):
-        self.file.write(b'< ' + line + b'\n')
+
+class NoopArchive:
+    def append(self, t, p):
+        pass
+
+    def close(self):
+        pass
+
+
+class RequestIds:
+    """Ids of the requests forwarded to the hub. The clients choose their ids, so two of them may use the same id at
+    the same time. Such a request is forwarded with a new id and its answer is given back with the original one."""
+
+    def __init__(self, clock=time):
+        self.clock = clock
+        self.requests = {}  # id sent to the hub -> (client, id of the client, sent)
+        self.count = 0
+
+    def forward(self, client, message, line):
+        """Registers a request and returns it as it has to be sent, (message, line)."""
+        now = self.clock()
+        for i in [i for i, (_, _, sent) in self.requests.items() if now - sent > scheduler.TIMEOUT]:
+            del self.requests[i]
+        i = message['i']
+        if i in self.requests:
+            while f"gw{self.count}" in self.requests:
+                self.count += 1
+            message = dict(message, i=f"gw{self.count}")
+            line = json.dumps(message).encode('utf-8')
+            self.count += 1
+        self.requests[message['i']] = (client, i, now)
+        return message, line
+
+    def answer(self, i):
+        """Returns (client, id of the client) of the answered request, None if it is unknown."""
+        request = self.requests.pop(i, None)
+        return None if request is None else request[:2]
 
 
 class ServerSocket:
@@ -426,10 +684,115 @@ class ServerSocket:
         self.server_socket.close()
 
 
+# stages of the gateway whose calls and time are counted while the counters are enabled
+stages = instrumentation.StageCounters()
+stages.register(LineReader, 'data_ready', 'data_ready')
+stages.register(HubConnection, 'read_line', 'hub.read_line')
+stages.register(HubConnection, 'decode', 'hub.json')
+stages.register(HubConnection, 'handle_notification', 'hub.notification', key=lambda self, message: message['m'])
+stages.register(HubConnection, 'handle_request', 'hub.request')
+stages.register(HubConnection, 'handle_response', 'hub.response')
+stages.register(HubConnection, 'handle_error', 'hub.error')
+stages.register(HubConnection, 'print', 'hub.print')
+stages.register(ClientConnection, 'read_line', 'client.read_line')
+stages.register(ClientConnection, 'write_message', 'client.write_message')
+stages.register(SocketClientConnection, 'write', 'client.sendall')
+stages.register(FileLogger, 'input', 'log.input')
+stages.register(FileLogger, 'output', 'log.output')
+stages.register(clocksync.ClockSync, 'frame', 'clock.frame')
+stages.register(hubstate.SnapshotWriter, 'publish', 'snapshot.publish')
+stages.register(pipeline.Feed, 'push', 'pipeline.push')
+profiler = instrumentation.SamplingProfiler()
+main_thread = None
+
+
+def time_path(prefix, extension):
+    return datetime.now().strftime(f"{prefix}-%Y%m%d-%H%M%S.{extension}")
+
+
+def profile_path(name=None):
+    # the gateway may run as root, so clients may only choose the name of a .folded file in the working directory
+    if name is None:
+        return time_path('gateway-profile', 'folded')
+    if not isinstance(name, str) or os.path.basename(name) != name or not name.endswith('.folded') or \
+            name.startswith('.'):
+        raise ValueError(f"profile path has to be a file name ending with .folded: {name}")
+    return name
+
+
+def toggle_profiler(signum, frame):
+    if profiler.running:
+        profiler.stop()
+        path = time_path('gateway-profile', 'folded')
+        print(f"Profile with {profiler.dump(path)} samples written to {path}{esc:K}")
+    else:
+        print(f"Profiling{esc:K}")
+        profiler.start(main_thread)
+
+
 clients = []
+encoders = {}
 log = NoopLogger()
+archive = NoopArchive()
+snapshot = hubstate.NoopSnapshot()
+clock = clocksync.ClockSync()
+cache = responsecache.ResponseCache()
+request_ids = RequestIds()
 hub = HubConnection("NoOpHubConnetion")
 
+
+def write_request(line, line_terminators, message):
+    # the pipelines get the request when it is sent, with the time of the trace file
+    t = time()
+    log.output(line, t)
+    if isinstance(message, dict):
+        cache.sent(message)
+        if pipelines:
+            push_event(pipeline.Event(t, '>', message))
+    hub.write_line(line, line_terminators)
+
+
+hub_requests = scheduler.RequestScheduler(write_request)
+
+# pipeline.Feed instances, they get the messages of the hub and the requests sent to it
+pipelines = []
+
+
+def expire_requests():
+    # the clients whose requests were collapsed into one the hub did not answer get an error
+    for client, response in cache.expire():
+        if client in clients:
+            try:
+                client.write_response(response)
+            except:
+                clients.remove(client)
+                client.close()
+
+
+def push_event(event):
+    for feed in list(pipelines):
+        try:
+            feed.push(event)
+        except Exception:
+            # a failing pipeline is removed, the gateway goes on
+            traceback.print_exc()
+            pipelines.remove(feed)
+
+
+def close_pipelines():
+    # the pipelines finish with the events they still hold, a failing one must not prevent the others from closing
+    for feed in pipelines:
+        try:
+            feed.close()
+        except Exception:
+            traceback.print_exc()
+    pipelines.clear()
+
+
+def print_pipeline_output(item):
+    hub.print(pipeline.format_item(item), f"{color:36}PIPELINE:")
+
+
 def start():
     parser = argparse.ArgumentParser(
         description="Tool for Monitoring Lego Mindstorms Roboter Inventor Hub and multiplexing connections.")
@@ -441,23 +804,68 @@ def start():
     log_group = parser.add_mutually_exclusive_group()
     log_group.add_argument("-l", "--log", help="log file (default: trace-Ymd-HMS.log", metavar="<path>")
     log_group.add_argument("-n", "--nolog", help="don't create log file", action="store_true")
+    parser.add_argument("-a", "--archive", help="archive sensor data in a tiered telemetry database",
+                        metavar="<path>")
+    parser.add_argument("-s", "--snapshot", help="publish the latest hub state in a memory-mapped file",
+                        metavar="<path>")
 
     device_group = parser.add_mutually_exclusive_group(required=True)
     device_group.add_argument("-t", "--tty", help="device path", metavar="<path>")
     device_group.add_argument("-d", "--device", help="bluetooth device address", metavar="<bdaddr>")
     device_group.add_argument("-f", "--file", help="test data file", metavar="<path>")
+    device_group.add_argument("--hub", help="hub transport plugin and its address, e.g. serial:/dev/ttyACM0",
+                              metavar="<transport>:<address>")
+    parser.add_argument("-o", "--outstanding", help="requests waiting for the hub's answer at most (default: 2)",
+                        metavar="<n>", default=2, type=int)
+    parser.add_argument("--stats", help="count calls and time of the gateway's stages and show them at exit",
+                        action="store_true")
+    parser.add_argument("-x", "--pipeline", help="run a pipeline over the messages, e.g. pipeline:latencies",
+                        metavar="<module>:<name>", action="append", default=[])
+    parser.add_argument("--bulk-interval", help="ms between program upload packages at least (default: 10)",
+                        metavar="<ms>", default=10, type=float)
 
     args = parser.parse_args()
-
+    if args.hub:
+        name, _, address = args.hub.partition(":")
+        try:
+            hub_transport = get_transport(name)
+        except KeyError as e:
+            parser.error(e.args[0])
+    for spec in args.pipeline:
+        try:
+            pipelines.append(pipeline.Feed(pipeline.load(spec), print_pipeline_output))
+        except Exception as e:
+            parser.error(f"cannot load pipeline {spec}: {type(e).__name__}: {e}")
+
+    global log, archive, snapshot, hub, main_thread
+    main_thread = threading.get_ident()
+    if args.stats:
+        stages.enable()
+    if hasattr(signal, 'SIGUSR1'):
+        # kill -USR1 <pid> starts the sampling profiler, the next one stops it and writes the profile
+        signal.signal(signal.SIGUSR1, toggle_profiler)
+    hub_requests.max_outstanding = args.outstanding
+    hub_requests.bulk_interval = args.bulk_interval / 1000
     if not args.nolog:
         log = FileLogger(args.log)
 
+    if args.archive:
+        from telemetry import TelemetryArchive
+        archive = TelemetryArchive(args.archive)
+
+    if args.snapshot:
+        snapshot = hubstate.SnapshotWriter(args.snapshot)
+
     if args.tty:
-        hub = SerialHubConnection(args.tty)
+        hub = get_transport("serial")(args.tty)
     elif args.device:
-        hub = BluetoothHubConnection(args.device)
+        hub = get_transport("rfcomm")(args.device)
     elif args.file:
-        hub = FileHubConnection(args.file)
+        hub = get_transport("file")(args.file)
+    elif args.hub:
+        hub = hub_transport(address)
+
+    hub_requests.answered = hub.answers
 
     if args.bluetooth:
         bluetooth_client = BluetoothClientConnection()
@@ -466,12 +874,22 @@ def start():
 
     try:
         while True:
-            ready_inputs, _, _ = select.select(clients + [hub, server], [], [])
+            timeouts = [t for t in (hub_requests.timeout(), cache.timeout()) if t is not None]
+            ready_inputs, _, _ = select.select(clients + [hub, server], [], [], min(timeouts, default=None))
             for input in ready_inputs:
                 input.data_ready()
+            hub_requests.pump()
+            expire_requests()
     finally:
         for input in clients + [hub, server]:
             input.close()
+        close_pipelines()
+        archive.close()
+        snapshot.close()
+        if stages.enabled:
+            for name, stats in stages.report().items():
+                print(f"{name:32} n={stats['count']:<9} total={stats['total_ms']:10.1f}ms "
+                      f"mean={stats['mean_us']:8.1f}us")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,17 @@
 
+import base64
+import json
+import sys
 import unittest
+import unittest.mock
 import gateway
 import tempfile
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 
 class NoopLoggerTestCase(unittest.TestCase):
     def setUp(self):
@@ -27,12 +36,265 @@ class FileLoggerTestCase(unittest.TestCase):
         line = self.file.read(1024)
         self.assertEqual(line, b"< an input line\n")
 
+    def test_input_with_time(self):
+        self.log.input(b"an input line", 1613926312.0415)
+
+        line = self.file.read(1024)
+        self.assertEqual(line, b"< @1613926312.041500 an input line\n")
+
     def test_output(self):
         self.log.output(b"an output line")        
 
         line = self.file.read(1024)
         self.assertEqual(line, b"> an output line\n")
 
+class TransportTestCase(unittest.TestCase):
+    def test_backends_not_imported(self):
+        self.assertNotIn("serial", sys.modules)
+        self.assertNotIn("bluetooth", sys.modules)
+
+    def test_get_transport(self):
+        self.assertIs(gateway.get_transport("file"), gateway.FileHubConnection)
+        self.assertIs(gateway.get_transport("serial"), gateway.SerialHubConnection)
+
+    def test_unknown_transport(self):
+        with self.assertRaises(KeyError):
+            gateway.get_transport("carrier-pigeon")
+
+    def test_bluetooth_server_is_no_hub_transport(self):
+        self.assertNotIn("rfcomm-server", gateway.transports)
+
+class RecordingClientConnection(gateway.ClientConnection):
+    def __init__(self):
+        super().__init__("RecordingClientConnection")
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+
+
+class ClientConnectionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hub = gateway.HubConnection("HubConnection")
+        self.hub.print = lambda *args, **kwargs: None
+        self.hub.write = lambda data: self.sent.append(data)
+        self.sent = []
+        # each test gets its own gateway state, the module's is restored afterwards
+        for name, value in (('hub', self.hub), ('cache', gateway.responsecache.ResponseCache()),
+                            ('request_ids', gateway.RequestIds()), ('clock', gateway.clocksync.ClockSync()),
+                            ('hub_requests', gateway.scheduler.RequestScheduler(gateway.write_request))):
+            patcher = unittest.mock.patch.object(gateway, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(gateway.clients.clear)
+
+    def test_text_clients_get_raw_line(self):
+        client = RecordingClientConnection()
+        self.hub.read_line(b'{"m":2,"p":[7.89, 80, true]}', b'\r')
+        self.assertEqual(client.data, [b'{"m":2,"p":[7.89, 80, true]}\r'])
+
+    def test_unknown_format(self):
+        client = RecordingClientConnection()
+        client.read_line(b'{"i": "x1", "m": "gateway.stream", "p": {"format": "xml"}}', b'\r')
+        response = json.loads(client.data[0])
+        self.assertEqual(response['i'], 'x1')
+        self.assertEqual(json.loads(base64.b64decode(response['e']))['type'], 'ValueError')
+
+    def test_invalid_delta_parameters(self):
+        client = RecordingClientConnection()
+        client.read_line(b'{"i": "x1", "m": "gateway.stream", "p": {"format": "delta", "keyframe": -1}}', b'\r')
+        client.read_line(b'{"i": "x2", "m": "gateway.stream", "p": {"format": "delta", "deadband": {"A": "x"}}}',
+                         b'\r')
+        for data in client.data:
+            self.assertEqual(json.loads(base64.b64decode(json.loads(data)['e']))['type'], 'ValueError')
+        self.assertIsNone(client.encoder)
+
+    @unittest.skipUnless(msgpack, "msgpack not installed")
+    def test_binary_clients_share_buffer(self):
+        first, second = RecordingClientConnection(), RecordingClientConnection()
+        for client in (first, second):
+            client.read_line(b'{"i": "x1", "m": "gateway.stream", "p": {"format": "msgpack"}}', b'\r')
+            self.assertEqual(json.loads(client.data.pop()), {'i': 'x1', 'r': {'format': 'msgpack'}})
+
+        self.hub.read_line(b'{"m":2,"p":[7.89, 80, true]}', b'\r')
+        self.assertIs(first.data[0], second.data[0])
+
+    @unittest.skipUnless(msgpack, "msgpack not installed")
+    def test_gateway_responses_are_framed(self):
+        client = RecordingClientConnection()
+        client.read_line(b'{"i": "x1", "m": "gateway.stream", "p": {"format": "msgpack"}}', b'\r')
+        self.assertEqual(json.loads(client.data.pop()), {'i': 'x1', 'r': {'format': 'msgpack'}})
+
+        client.read_line(b'{"i": "x2", "m": "gateway.clock", "p": {}}', b'\r')
+        client.read_line(b'{"i": "x3", "m": "gateway.stream", "p": {"format": "xml"}}', b'\r')
+        reader = gateway.framing.FrameReader('msgpack')
+        clock, error = list(reader.feed(b''.join(client.data)))
+        self.assertEqual('x2', clock['i'])
+        self.assertIn('synced', clock['r'])
+        self.assertEqual('x3', error['i'])
+        self.assertIs(gateway.encoders['msgpack'], client.encoder)
+
+    def test_collapsed_requests(self):
+        first, second = RecordingClientConnection(), RecordingClientConnection()
+        first.read_line(b'{"i": "a1", "m": "get_hub_info", "p": {}}', b'\r')
+        second.read_line(b'{"i": "b1", "m": "get_hub_info", "p": {}}', b'\r')
+        self.assertEqual(self.sent, [b'{"i": "a1", "m": "get_hub_info", "p": {}}\r'])
+
+        self.hub.read_line(b'{"i": "a1", "r": {"version": [1, 2]}}', b'\r')
+        self.assertEqual(first.data, [b'{"i": "a1", "r": {"version": [1, 2]}}\r'])
+        self.assertEqual([json.loads(data) for data in second.data],
+                         [{"i": "a1", "r": {"version": [1, 2]}}, {"i": "b1", "r": {"version": [1, 2]}}])
+
+        # answered from the cache
+        second.read_line(b'{"i": "b2", "m": "get_hub_info", "p": {}}', b'\r')
+        self.assertEqual(json.loads(second.data[-1]), {"i": "b2", "r": {"version": [1, 2]}})
+        self.assertEqual(len(self.sent), 1)
+
+    def test_same_id_of_two_clients(self):
+        first, second = RecordingClientConnection(), RecordingClientConnection()
+        first.read_line(b'{"i": "x1", "m": "get_storage_status", "p": {}}', b'\r')
+        second.read_line(b'{"i": "x1", "m": "get_hub_info", "p": {}}', b'\r')
+        self.assertEqual(['x1', 'gw0'], [json.loads(data)['i'] for data in self.sent])
+        self.assertEqual(2, len(gateway.hub_requests.outstanding))
+
+        self.hub.read_line(b'{"i": "x1", "r": 42}', b'\r')
+        self.hub.read_line(b'{"i": "gw0", "r": {"version": [1, 2]}}', b'\r')
+        self.assertEqual([b'{"i": "x1", "r": 42}\r', b'{"i": "gw0", "r": {"version": [1, 2]}}\r'], first.data)
+        self.assertEqual({"i": "x1", "r": {"version": [1, 2]}}, json.loads(second.data[-1]))
+
+        # both answers were cached for their own method
+        second.read_line(b'{"i": "x2", "m": "get_hub_info", "p": {}}', b'\r')
+        self.assertEqual({"i": "x2", "r": {"version": [1, 2]}}, json.loads(second.data[-1]))
+        self.assertEqual(2, len(self.sent))
+
+    def test_control_requests_jump_ahead(self):
+        gateway.hub_requests.max_outstanding = 1
+        upload, control = RecordingClientConnection(), RecordingClientConnection()
+        for n in range(3):
+            upload.read_line(b'{"i": "u%d", "m": "write_package", "p": {}}' % n, b'\r')
+        control.read_line(b'{"i": "c1", "m": "program_terminate", "p": {}}', b'\r')
+        self.assertEqual([json.loads(data)['i'] for data in self.sent], ['u0', 'c1'])
+
+    def test_write_invalidates_when_sent(self):
+        gateway.hub_requests.max_outstanding = 1
+        client = RecordingClientConnection()
+        client.read_line(b'{"i": "a1", "m": "get_hub_info", "p": {}}', b'\r')
+        client.read_line(b'{"i": "a2", "m": "write_package", "p": {}}', b'\r')
+        client.read_line(b'{"i": "a3", "m": "get_storage_status", "p": {}}', b'\r')
+        self.hub.read_line(b'{"i": "a1", "r": {"version": [1, 2]}}', b'\r')
+        # the storage status overtakes the write, its answer is cached until the write is sent
+        self.hub.read_line(b'{"i": "a3", "r": 1}', b'\r')
+        self.assertEqual(['a1', 'a3', 'a2'], [json.loads(data)['i'] for data in self.sent])
+        client.read_line(b'{"i": "a4", "m": "get_storage_status", "p": {}}', b'\r')
+        self.hub.read_line(b'{"i": "a2", "r": null}', b'\r')
+        self.assertEqual('a4', json.loads(self.sent[-1])['i'])
+
+    def test_lost_collapsed_request(self):
+        first, second = RecordingClientConnection(), RecordingClientConnection()
+        first.read_line(b'{"i": "a1", "m": "get_hub_info", "p": {}}', b'\r')
+        second.read_line(b'{"i": "b1", "m": "get_hub_info", "p": {}}', b'\r')
+        gateway.expire_requests()
+        self.assertEqual([], second.data)
+        with unittest.mock.patch.object(gateway.cache, 'clock',
+                                        lambda: gateway.responsecache.time.monotonic() + 60):
+            gateway.expire_requests()
+        response = json.loads(second.data[0])
+        self.assertEqual('b1', response['i'])
+        self.assertEqual('TimeoutError', json.loads(base64.b64decode(response['e']))['type'])
+
+    def test_timestamps(self):
+        plain, stamped = RecordingClientConnection(), RecordingClientConnection()
+        stamped.read_line(b'{"i": "x1", "m": "gateway.stream", "p": {"timestamps": true}}', b'\r')
+        self.assertEqual(json.loads(stamped.data.pop()), {'i': 'x1', 'r': {'format': 'json', 'timestamps': True}})
+
+        self.hub.read_line(b'{"m":0,"p":[[0, []], [0, []], [0, []], [0, []], [0, []], [0, []], '
+                           b'[0, 0, 0], [0, 0, 0], [0, 0, 0], "", 1000]}', b'\r')
+        self.assertNotIn(b'"t"', plain.data[0])
+        message = json.loads(stamped.data[0])
+        self.assertEqual(message['t'], round(self.hub.timestamp, 6))
+        self.assertEqual(message['p'][10], 1000)
+
+        stamped.read_line(b'{"i": "x2", "m": "gateway.clock", "p": {}}', b'\r')
+        self.assertTrue(json.loads(stamped.data.pop())['r']['synced'])
+
+    def test_stats(self):
+        client = RecordingClientConnection()
+        client.read_line(b'{"i": "s1", "m": "gateway.stats", "p": {"enable": true}}', b'\r')
+        self.addCleanup(gateway.stages.disable)
+        self.hub.read_line(b'{"m":2,"p":[7.89, 80, true]}', b'\r')
+        client.read_line(b'{"i": "s2", "m": "gateway.stats", "p": {"enable": false}}', b'\r')
+        stats = json.loads(client.data[-1])['r']
+        self.assertFalse(stats['enabled'])
+        self.assertEqual(stats['stages']['hub.notification.2']['count'], 1)
+        self.assertEqual(stats['stages']['hub.json']['count'], 1)
+        self.assertIn('client.write_message', stats['stages'])
+
+    def test_profile_path(self):
+        client = RecordingClientConnection()
+        for path in ('/etc/passwd', '../x.folded', 'trace.log', '.folded'):
+            client.read_line(json.dumps({'i': 'p1', 'm': 'gateway.profile',
+                                         'p': {'action': 'stop', 'path': path}}).encode(), b'\r')
+            response = json.loads(client.data.pop())
+            self.assertEqual(json.loads(base64.b64decode(response['e']))['type'], 'ValueError', path)
+        self.assertEqual('x.folded', gateway.profile_path('x.folded'))
+        self.assertTrue(gateway.profile_path().startswith('gateway-profile-'))
+
+    def test_pipeline(self):
+        output = []
+        gateway.pipelines.append(gateway.pipeline.Feed(gateway.pipeline.latencies(), output.append))
+        self.addCleanup(gateway.pipelines.clear)
+        client = RecordingClientConnection()
+        client.read_line(b'{"i": "a1", "m": "get_hub_info", "p": {}}', b'\r')
+        self.hub.read_line(b'{"m":2,"p":[7.89, 80, true]}', b'\r')
+        self.hub.read_line(b'{"i": "a1", "r": {"version": [1, 2]}}', b'\r')
+        self.assertEqual(1, len(output))
+        self.assertEqual('get_hub_info', output[0]['m'])
+        self.assertGreaterEqual(output[0]['ms'], 0)
+
+    def test_pipeline_gets_requests_when_sent(self):
+        events = []
+        gateway.pipelines.append(gateway.pipeline.Feed(gateway.pipeline.Pipeline().select(direction='>'),
+                                                       events.append))
+        self.addCleanup(gateway.pipelines.clear)
+        logged = []
+        patcher = unittest.mock.patch.object(gateway.log, 'output', lambda line, t=None: logged.append(t))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        gateway.hub_requests.max_outstanding = 1
+        client = RecordingClientConnection()
+        client.read_line(b'{"i": "a1", "m": "get_hub_info", "p": {}}', b'\r')
+        client.read_line(b'{"i": "a2", "m": "scratch.display_image", "p": {}}', b'\r')
+        self.assertEqual(['a1'], [event.message['i'] for event in events])
+        self.hub.read_line(b'{"i": "a1", "r": {"version": [1, 2]}}', b'\r')
+        self.assertEqual(['a1', 'a2'], [event.message['i'] for event in events])
+        self.assertEqual(logged, [event.t for event in events])
+
+    def test_failing_pipeline_on_close(self):
+        def fail_at_end(events):
+            for event in events:
+                yield event
+            raise RuntimeError("flush failed")
+
+        failing = gateway.pipeline.Feed(gateway.pipeline.Pipeline().then(fail_at_end), print)
+        other = gateway.pipeline.Feed(gateway.pipeline.Pipeline(), print)
+        gateway.pipelines.extend([failing, other])
+        self.addCleanup(gateway.pipelines.clear)
+        with unittest.mock.patch('traceback.print_exc') as print_exc:
+            gateway.close_pipelines()
+        print_exc.assert_called_once()
+        self.assertTrue(other.closed)
+        self.assertEqual([], gateway.pipelines)
+
+    def test_failing_pipeline_is_removed(self):
+        feed = gateway.pipeline.Feed(gateway.pipeline.Pipeline().apply(lambda event: 1 / 0), print)
+        gateway.pipelines.append(feed)
+        self.addCleanup(gateway.pipelines.clear)
+        client = RecordingClientConnection()
+        with unittest.mock.patch('traceback.print_exc'):
+            self.hub.read_line(b'{"m":2,"p":[7.89, 80, true]}', b'\r')
+        self.assertEqual([], gateway.pipelines)
+        self.assertEqual(client.data, [b'{"m":2,"p":[7.89, 80, true]}\r'])
+
 
 if __name__ == '__main__':
     unittest.main()
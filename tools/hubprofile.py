@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+# Loop timing profiler for hub programs. Functions and loops marked with a `# profile` comment are instrumented
+# with time.ticks_us() probes before upload:
+#
+#   def act(self, set_point, state, dt=None):  # profile
+#   while True:  # profile 20
+#
+# A function records the time of each call, a loop the time of each iteration (<scope>:<line>) and the period
+# between the starts of two iterations (<scope>:<line>/period). A number after the marker is a deadline in ms,
+# calls or periods above it are counted as misses. The hub aggregates log2 histograms and prints them every second
+# as "@prof <name> <count> <total us> <max us> <misses> <16 buckets>", the gateway decodes and shows them.
+
+import ast
+import re
+
+MARKER = re.compile(r"#\s*profile\b(?:\s+(\d+(?:\.\d+)?))?")
+PREFIX = "@prof "
+
+# runs on the hub (MicroPython), so no f-strings
+RUNTIME = """
+import time as _prof_time
+
+
+class _Profiler:
+    def __init__(self, names, deadlines, interval):
+        self.names = names
+        self.deadlines = deadlines
+        self.interval = interval
+        self.stats = [[0] * 20 for _ in names]
+        self.last = [None] * len(names)
+        self.reported = _prof_time.ticks_ms()
+
+    def add(self, i, us):
+        s = self.stats[i]
+        s[0] += 1
+        s[1] += us
+        if us > s[2]:
+            s[2] = us
+        if self.deadlines[i] and us > self.deadlines[i]:
+            s[3] += 1
+        b = 0
+        while us > 1 and b < 15:
+            us >>= 1
+            b += 1
+        s[4 + b] += 1
+        if _prof_time.ticks_diff(_prof_time.ticks_ms(), self.reported) >= self.interval:
+            self.report()
+
+    def record(self, i, start):
+        self.add(i, _prof_time.ticks_diff(_prof_time.ticks_us(), start))
+
+    def start(self, i):
+        self.last[i] = None
+
+    def tick(self, i, now):
+        last = self.last[i]
+        self.last[i] = now
+        if last is not None:
+            self.add(i, _prof_time.ticks_diff(now, last))
+
+    def report(self):
+        self.reported = _prof_time.ticks_ms()
+        for i in range(len(self.names)):
+            s = self.stats[i]
+            if s[0]:
+                print('@prof', self.names[i], ' '.join([str(v) for v in s]))
+                self.stats[i] = [0] * 20
+"""
+
+
+def statements(source):
+    return ast.parse(source).body
+
+
+class Instrumenter(ast.NodeTransformer):
+    def __init__(self, lines):
+        self.lines = lines
+        self.scope = []
+        self.names = []
+        self.deadlines = []
+
+    def marker(self, node):
+        match = MARKER.search(self.lines[node.lineno - 1])
+        if match is None:
+            return None
+        return int(float(match.group(1)) * 1000) if match.group(1) else 0
+
+    def add(self, name, deadline):
+        self.names.append(name)
+        self.deadlines.append(deadline)
+        return len(self.names) - 1
+
+    def visit_ClassDef(self, node):
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+        return node
+
+    def visit_FunctionDef(self, node):
+        deadline = self.marker(node)
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        name = ".".join(self.scope)
+        self.scope.pop()
+        if deadline is None:
+            return node
+
+        i = self.add(name, deadline)
+        docstring = []
+        if node.body and isinstance(node.body[0], ast.Expr) and isinstance(node.body[0].value, ast.Constant) and \
+                isinstance(node.body[0].value.value, str):
+            docstring = [node.body.pop(0)]
+        probe = statements("_prof_start = _prof_time.ticks_us()\n"
+                           f"try:\n    pass\nfinally:\n    _profiler.record({i}, _prof_start)")
+        probe[1].body = node.body or [ast.Pass()]
+        node.body = docstring + probe
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_loop(self, node):
+        deadline = self.marker(node)
+        self.generic_visit(node)
+        if deadline is None:
+            return node
+
+        scope = ".".join(self.scope) or "<module>"
+        body = self.add(f"{scope}:{node.lineno}", 0)
+        period = self.add(f"{scope}:{node.lineno}/period", deadline)
+        probe = statements("_prof_start = _prof_time.ticks_us()\n"
+                           f"_profiler.tick({period}, _prof_start)\n"
+                           f"try:\n    pass\nfinally:\n    _profiler.record({body}, _prof_start)")
+        probe[2].body = node.body
+        node.body = probe
+        return [statements(f"_profiler.start({period})")[0], node]
+
+    visit_While = visit_loop
+    visit_For = visit_loop
+
+
+def instrument(source, interval=1000):
+    """Returns the source with probes for all marked functions and loops, or the source itself if none is marked."""
+    tree = ast.parse(source)
+    instrumenter = Instrumenter(source.splitlines())
+    tree = instrumenter.visit(tree)
+    if not instrumenter.names:
+        return source
+    setup = statements(RUNTIME) + \
+        statements(f"_profiler = _Profiler({instrumenter.names!r}, {instrumenter.deadlines!r}, {interval})")
+    tree.body = setup + tree.body
+    return ast.unparse(ast.fix_missing_locations(tree)) + "\n"
+
+
+class ProfileReport:
+    """Accumulates the reports printed by an instrumented program."""
+
+    def __init__(self):
+        self.stats = {}
+
+    def add(self, line):
+        name, *values = line[len(PREFIX):].split()
+        values = [int(value) for value in values]
+        if name not in self.stats:
+            self.stats[name] = values
+            return name
+        stats = self.stats[name]
+        stats[0] += values[0]
+        stats[1] += values[1]
+        stats[2] = max(stats[2], values[2])
+        for i in range(3, len(values)):
+            stats[i] += values[i]
+        return name
+
+    def percentile(self, name, fraction):
+        """Returns the upper bound in us of the histogram bucket containing the percentile."""
+        stats = self.stats[name]
+        histogram = stats[4:]
+        limit = fraction * stats[0]
+        count = 0
+        for bucket, n in enumerate(histogram[:-1]):
+            count += n
+            if count >= limit:
+                return 2 ** (bucket + 1)
+        return stats[2]
+
+    def format(self, name):
+        count, total, maximum, misses = self.stats[name][:4]
+        return f"{name:28} n={count:<7} mean={total / count:8.0f}us p50<{self.percentile(name, 0.5):6}us " \
+            f"p95<{self.percentile(name, 0.95):6}us max={maximum:6}us missed={misses}"
@@ -0,0 +1,77 @@
+import sys
+import types
+import unittest
+from unittest import mock
+
+import hubprofile
+
+PROGRAM = """
+import time
+
+
+def step(n):  # profile
+    '''does some work'''
+    time.sleep_us(300 * n)
+    return n
+
+
+total = 0
+for n in range(1, 5):  # profile 0.5
+    total += step(n)
+    if n == 2:
+        continue
+"""
+
+
+class FakeTime(types.ModuleType):
+    def __init__(self):
+        super().__init__("time")
+        self.now = 0
+
+    def ticks_us(self):
+        self.now += 10
+        return self.now
+
+    def ticks_ms(self):
+        return self.now // 1000
+
+    def ticks_diff(self, a, b):
+        return a - b
+
+    def sleep_us(self, us):
+        self.now += us
+
+
+class InstrumentTestCase(unittest.TestCase):
+    def run_program(self, source):
+        output = []
+        namespace = {"print": lambda *args: output.append(" ".join(str(arg) for arg in args))}
+        with mock.patch.dict(sys.modules, {"time": FakeTime()}):
+            exec(compile(source, "program.py", "exec"), namespace)
+            namespace["_profiler"].report()
+        return namespace, output
+
+    def test_unmarked_source_is_unchanged(self):
+        self.assertEqual(hubprofile.instrument("x = 1  # no profiling\n"), "x = 1  # no profiling\n")
+
+    def test_behaviour_is_kept(self):
+        namespace, output = self.run_program(hubprofile.instrument(PROGRAM))
+        self.assertEqual(namespace["total"], 10)
+        self.assertEqual(namespace["step"].__doc__, "does some work")
+
+    def test_report(self):
+        _, output = self.run_program(hubprofile.instrument(PROGRAM))
+        report = hubprofile.ProfileReport()
+        names = [report.add(line) for line in output]
+        self.assertEqual(names, ["step", "<module>:12", "<module>:12/period"])
+
+        count, total, maximum, misses = report.stats["step"][:4]
+        self.assertEqual(count, 4)
+        self.assertEqual(maximum, 1210)
+        self.assertEqual(report.stats["<module>:12/period"][:4], [3, 1920, 940, 2])
+        self.assertEqual(report.percentile("step", 0.5), 1024)
+        self.assertIn("missed=2", report.format("<module>:12/period"))
+
+
+if __name__ == '__main__':
+    unittest.main()
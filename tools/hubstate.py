@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Latest state of the hub in a memory-mapped file, written by the gateway with `-s <path>`. Local processes can read
+# it at any rate without a connection to the gateway and without syscalls:
+#
+#   reader = hubstate.SnapshotReader("/dev/shm/hub")
+#   state = reader.read()
+#   state["channels"]["position.roll"], state["battery"]["charge"]
+#
+# The file has a fixed little endian layout: a header (magic, version, uint64 sequence) and the state (see STATE).
+# The sequence is a sequence lock: the writer makes it odd before and even after each update, a reader copies the
+# state and retries if the sequence was odd or changed meanwhile.
+
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import time
+
+from channels import CHANNELS, sensor_channels
+
+MAGIC = b"RIT\x01"
+VERSION = 1
+
+HEADER = struct.Struct("<4sIQ")
+SEQUENCE_OFFSET = 8
+SEQUENCE = struct.Struct("<Q")
+
+# host time and hub time of the last frame, frame count, channel values (NaN if missing), display,
+# battery (voltage, charge, charging, host time), button (name, duration, host time),
+# program (JSON, host time), the texts are truncated to their fields
+STATE = struct.Struct(f"<dqQ{len(CHANNELS)}d32s" + "ddid" + "16sid" + "64sd")
+SIZE = HEADER.size + STATE.size
+
+
+def encode(text, size):
+    """Encodes a text for a field of size bytes, cut at a character boundary if it is too long."""
+    data = text.encode("utf-8")
+    if len(data) > size:
+        data = data[:size].decode("utf-8", "ignore").encode("utf-8")
+    return data
+
+
+def decode(data):
+    return data.rstrip(b"\0").decode("utf-8", "ignore")
+
+
+def decode_json(text):
+    """The program state is stored as JSON, but truncated if it is too long."""
+    try:
+        return json.loads(text) if text else None
+    except json.JSONDecodeError:
+        return text
+
+
+def number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else math.nan
+
+
+def value_of(number):
+    """Reverts number(), whole numbers become ints again."""
+    if math.isnan(number):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+class SnapshotWriter:
+    def __init__(self, path):
+        print(f"Publishing state to {path}")
+        # readers may have the file mapped, so it is neither truncated nor shrunk, which would crash them (SIGBUS)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < SIZE:
+            os.ftruncate(self.fd, SIZE)
+        self.map = mmap.mmap(self.fd, SIZE)
+        # a restarted writer goes on with the sequence, an odd one is left by a writer stopped while publishing
+        magic, version, sequence = HEADER.unpack_from(self.map)
+        self.sequence = sequence + sequence % 2 if (magic, version) == (MAGIC, VERSION) else 0
+        self.values = {
+            "time": 0.0, "hub_time": 0, "frames": 0, "channels": [math.nan] * len(CHANNELS), "display": "",
+            "voltage": math.nan, "charge": math.nan, "charging": -1, "battery_time": 0.0,
+            "button": "", "duration": 0, "button_time": 0.0,
+            "program": "", "program_time": 0.0,
+        }
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.sequence)
+        self.publish()
+
+    def frame(self, t, p):
+        """Publishes a m=0 payload with its (corrected) host time."""
+        values = dict(sensor_channels(p))
+        self.values["channels"] = [number(values.get(channel)) for channel in CHANNELS]
+        self.values["display"] = p[9] if len(p) > 9 and isinstance(p[9], str) else ""
+        self.values["hub_time"] = p[10] if len(p) > 10 and isinstance(p[10], int) else 0
+        self.values["time"] = t
+        self.values["frames"] += 1
+        self.publish()
+
+    def battery(self, t, voltage, charge, charging):
+        self.values.update(voltage=number(voltage), charge=number(charge), charging=int(charging), battery_time=t)
+        self.publish()
+
+    def button(self, t, button, duration):
+        self.values.update(button=str(button), duration=int(duration), button_time=t)
+        self.publish()
+
+    def program(self, t, p):
+        self.values.update(program=json.dumps(p), program_time=t)
+        self.publish()
+
+    def publish(self):
+        v = self.values
+        state = STATE.pack(v["time"], v["hub_time"], v["frames"], *v["channels"], encode(v["display"], 32),
+                           v["voltage"], v["charge"], v["charging"], v["battery_time"],
+                           encode(v["button"], 16), v["duration"], v["button_time"],
+                           encode(v["program"], 64), v["program_time"])
+        SEQUENCE.pack_into(self.map, SEQUENCE_OFFSET, self.sequence + 1)
+        self.map[HEADER.size:SIZE] = state
+        self.sequence += 2
+        SEQUENCE.pack_into(self.map, SEQUENCE_OFFSET, self.sequence)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+class NoopSnapshot:
+    def frame(self, t, p):
+        pass
+
+    def battery(self, t, voltage, charge, charging):
+        pass
+
+    def button(self, t, button, duration):
+        pass
+
+    def program(self, t, p):
+        pass
+
+    def close(self):
+        pass
+
+
+class SnapshotReader:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), SIZE, access=mmap.ACCESS_READ)
+        magic, version, _ = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is no hub snapshot of version {VERSION}")
+
+    def sequence(self):
+        """The sequence changes with every update, a reader can poll it to find out whether to read the state."""
+        return SEQUENCE.unpack_from(self.map, SEQUENCE_OFFSET)[0]
+
+    def read_raw(self, retries=10000):
+        for _ in range(retries):
+            before = self.sequence()
+            if before % 2:
+                continue
+            state = self.map[HEADER.size:SIZE]
+            if self.sequence() == before:
+                return before, STATE.unpack(state)
+        raise TimeoutError("the snapshot is not consistent, is the writer stuck?")
+
+    def read(self):
+        """Returns the latest state as dict, missing channel values are None."""
+        sequence, values = self.read_raw()
+        n = len(CHANNELS)
+        t, hub_time, frames = values[0:3]
+        channels = {channel: value_of(value) for channel, value in zip(CHANNELS, values[3:3 + n])}
+        (display, voltage, charge, charging, battery_time, button, duration, button_time, program,
+         program_time) = values[3 + n:]
+        return {
+            "sequence": sequence,
+            "time": t,
+            "hub_time": hub_time,
+            "frames": frames,
+            "channels": channels,
+            "display": decode(display),
+            "battery": {"voltage": value_of(voltage), "charge": value_of(charge),
+                        "charging": None if charging < 0 else charging, "time": battery_time},
+            "button": {"name": decode(button), "duration": duration, "time": button_time},
+            "program": {"state": decode_json(decode(program)), "time": program_time},
+        }
+
+    def close(self):
+        self.map.close()
+
+
+def start():
+    parser = argparse.ArgumentParser(description="Show the hub state published by the gateway.")
+    parser.add_argument("path", help="snapshot file of the gateway", metavar="<path>")
+    parser.add_argument("-w", "--watch", help="show the state every <seconds>", metavar="<seconds>", type=float)
+    args = parser.parse_args()
+    reader = SnapshotReader(args.path)
+    while True:
+        print(json.dumps(reader.read(), indent=2))
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+import hubstate
+
+FRAME = [[75, [0, 0, -138, 0]], [75, [0, 1, 121, 0]], [75, [0, 0, 136, 0]], [62, [None]], [0, []], [0, []],
+         [-19, -11, 1008], [3, 8, -1], [-47, 1, 0], "99999:00000", 1234]
+
+
+class HubStateTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = path = os.path.join(directory.name, "hub")
+        self.writer = hubstate.SnapshotWriter(path)
+        self.addCleanup(lambda: self.writer.close())
+        self.reader = hubstate.SnapshotReader(path)
+        self.addCleanup(self.reader.close)
+
+    def test_empty(self):
+        state = self.reader.read()
+        self.assertEqual(0, state["frames"])
+        self.assertIsNone(state["channels"]["A.2"])
+        self.assertIsNone(state["battery"]["charge"])
+        self.assertIsNone(state["program"]["state"])
+
+    def test_state(self):
+        self.writer.frame(100.5, FRAME)
+        self.writer.battery(101.0, 8.1, 93, 0)
+        self.writer.button(102.0, "left", 350)
+        self.writer.program(103.0, ["5", True])
+        state = self.reader.read()
+        self.assertEqual(1, state["frames"])
+        self.assertEqual(100.5, state["time"])
+        self.assertEqual(1234, state["hub_time"])
+        self.assertEqual(-138, state["channels"]["A.2"])
+        self.assertIsNone(state["channels"]["D.0"])
+        self.assertIsNone(state["channels"]["E.0"])
+        self.assertIs(int, type(state["channels"]["position.pitch"]))
+        self.assertEqual("99999:00000", state["display"])
+        self.assertEqual({"voltage": 8.1, "charge": 93, "charging": 0, "time": 101.0}, state["battery"])
+        self.assertEqual({"name": "left", "duration": 350, "time": 102.0}, state["button"])
+        self.assertEqual(["5", True], state["program"]["state"])
+
+    def test_sequence_lock(self):
+        before = self.reader.sequence()
+        self.writer.frame(100.5, FRAME)
+        self.assertEqual(before + 2, self.reader.sequence())
+        # a writer stopped in the middle of an update leaves an odd sequence
+        hubstate.SEQUENCE.pack_into(self.writer.map, hubstate.SEQUENCE_OFFSET, self.writer.sequence + 1)
+        self.assertRaises(TimeoutError, self.reader.read_raw, retries=10)
+
+    def test_restarted_writer(self):
+        self.writer.frame(100.5, FRAME)
+        # stopped while publishing
+        hubstate.SEQUENCE.pack_into(self.writer.map, hubstate.SEQUENCE_OFFSET, self.writer.sequence + 1)
+        self.writer.close()
+        before = self.reader.sequence()
+        self.writer = hubstate.SnapshotWriter(self.path)
+        self.assertEqual(hubstate.SIZE, os.path.getsize(self.path))
+        # the mapping of the reader stays valid and the sequence goes on
+        self.assertGreater(self.reader.sequence(), before)
+        self.assertEqual(0, self.reader.read()["frames"])
+
+    def test_long_texts_are_truncated(self):
+        self.writer.button(102.0, "ä" * 20, 350)
+        self.writer.program(103.0, ["x" * 100, True])
+        state = self.reader.read()
+        self.assertEqual("ä" * 8, state["button"]["name"])
+        self.assertEqual(64, len(state["program"]["state"]))
+
+    def test_no_snapshot(self):
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(bytes(hubstate.SIZE))
+            file.flush()
+            self.assertRaises(ValueError, hubstate.SnapshotReader, file.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# Instrumentation of the gateway itself, both can be switched on and off at runtime:
+#
+# StageCounters    counts the calls and cumulative time of registered methods (stages), optionally per key, e.g.
+#                  per message code. Timing wrappers are only installed while enabled, so when disabled the methods
+#                  are the original ones and cost nothing.
+# SamplingProfiler samples the stack of the gateway's main thread from a background thread and writes the stacks in
+#                  the collapsed format of flamegraph.pl ("frame;frame;frame count" per line).
+
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class StageCounters:
+    def __init__(self):
+        self.stages = []  # (class, method, name, key)
+        self.originals = []
+        self.stats = {}  # name -> [count, total seconds]
+
+    @property
+    def enabled(self):
+        return bool(self.originals)
+
+    def register(self, cls, method, name, key=None):
+        """Registers cls.method as stage, key(*args) splits its stats, e.g. by message code."""
+        self.stages.append((cls, method, name, key))
+
+    def enable(self):
+        if self.enabled:
+            return
+        for cls, method, name, key in self.stages:
+            original = cls.__dict__[method]
+            self.originals.append((cls, method, original))
+            setattr(cls, method, self.timed(original, name, key))
+
+    def disable(self):
+        for cls, method, original in reversed(self.originals):
+            setattr(cls, method, original)
+        self.originals.clear()
+
+    def timed(self, function, name, key):
+        stats = self.stats
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stage = name if key is None else f"{name}.{key(*args, **kwargs)}"
+                entry = stats.get(stage)
+                if entry is None:
+                    entry = stats[stage] = [0, 0.0]
+                entry[0] += 1
+                entry[1] += perf_counter() - start
+        timed.__wrapped__ = function
+        return timed
+
+    def reset(self):
+        self.stats.clear()
+
+    def report(self):
+        """Returns the stats per stage (calls, total and mean time), times include nested stages."""
+        return {name: {"count": count, "total_ms": total * 1000, "mean_us": total / count * 1e6}
+                for name, (count, total) in sorted(self.stats.items())}
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, thread_id=None):
+        """Starts sampling the thread (default: the calling thread)."""
+        if self.running:
+            return
+        thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.samples.clear()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, args=(thread_id,), daemon=True)
+        self.thread.start()
+
+    def run(self, thread_id):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        if not self.running:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+
+    def collapsed(self):
+        """Returns the samples in the collapsed stack format."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def dump(self, path):
+        with open(path, "w") as file:
+            file.write(self.collapsed())
+        return sum(self.samples.values())
@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+
+import instrumentation
+
+
+class Stage:
+    def work(self, kind):
+        return kind * 2
+
+
+class StageCountersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stages = instrumentation.StageCounters()
+        self.stages.register(Stage, 'work', 'stage.work', key=lambda self, kind: kind)
+        self.original = Stage.work
+        self.addCleanup(self.stages.disable)
+
+    def test_disabled_is_original(self):
+        self.stages.enable()
+        self.assertIsNot(self.original, Stage.work)
+        self.stages.disable()
+        self.assertIs(self.original, Stage.work)
+        self.assertEqual(6, Stage().work(3))
+        self.assertEqual({}, self.stages.report())
+
+    def test_counts_per_key(self):
+        self.stages.enable()
+        self.stages.enable()
+        stage = Stage()
+        for kind in (0, 1, 1):
+            stage.work(kind)
+        report = self.stages.report()
+        self.assertEqual(['stage.work.0', 'stage.work.1'], list(report))
+        self.assertEqual(2, report['stage.work.1']['count'])
+        self.assertGreaterEqual(report['stage.work.1']['total_ms'], 0)
+        self.stages.reset()
+        self.assertEqual({}, self.stages.report())
+
+
+class SamplingProfilerTestCase(unittest.TestCase):
+    def busy(self, seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    def test_collapsed_stacks(self):
+        profiler = instrumentation.SamplingProfiler(interval=0.001)
+        profiler.start()
+        self.assertTrue(profiler.running)
+        self.busy(0.1)
+        profiler.stop()
+        self.assertFalse(profiler.running)
+        lines = profiler.collapsed().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertIn('busy (instrumentation_test.py:', stack.split(';')[-1])
+
+    def test_other_thread(self):
+        profiler = instrumentation.SamplingProfiler(interval=0.001)
+        thread = threading.Thread(target=self.busy, args=(0.1,))
+        thread.start()
+        profiler.start(thread.ident)
+        thread.join()
+        profiler.stop()
+        self.assertIn('busy', profiler.collapsed())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Offline tuning of the balancing programs. An inverted pendulum model is fitted to the roll angle, gyroscope and
+# motor data of gateway traces, then thousands of gain sets and loop periods are simulated at once as NumPy arrays.
+# The controller reproduces PID.act of programs/b2.py: whole degrees from get_roll_angle(), the integral clamp,
+# rounding and clamping of the motor power and the STOP_ANGLE cutoff. The P controller of programs/balance.py
+# (speed = -r * 40) corresponds to --kp 40 --ki 0 --kd 0.
+
+import argparse
+import time
+
+import numpy as np
+
+from channels import PORTS
+from tracefile import read_messages
+
+# constants of programs/b2.py
+SET_POINT = -90.0
+STOP_ANGLE = 20
+MAX_INTEGRAL = 100
+
+
+class Model:
+    """Pendulum linearized around the set point: x'' = a * x - c * x' + b * u + bias, with the deviation x from the
+    set point in degrees and the motor power u in percent."""
+
+    def __init__(self, a=100.0, b=20.0, c=0.5, bias=0.0):
+        self.a = a
+        self.b = b
+        self.c = c
+        self.bias = bias
+
+    def __str__(self):
+        return f"x'' = {self.a:.4g} * x - {self.c:.4g} * x' + {self.b:.4g} * u + {self.bias:.4g}"
+
+
+def fit_model(messages, motors="BF", signs=(1, -1), frame_dt=0.02):
+    """Fits the model by least squares to m=0 notifications. The power u is the signed mean of the speeds of the
+    motor pair, frames are frame_dt apart unless the hub time increases."""
+    rows = []
+    for message in messages:
+        if message.get('m') != 0:
+            continue
+        p = message['p']
+        speeds = [p[PORTS.index(port)][1][0] if p[PORTS.index(port)][1] else 0 for port in motors]
+        rows.append([p[10] / 1000, p[8][2]] + p[7] + [sum(s * v for s, v in zip(signs, speeds)) / len(speeds)])
+    if len(rows) < 10:
+        raise ValueError("not enough sensor data to fit a model")
+    data = np.array(rows, dtype=float)
+    t = data[:, 0]
+    if not np.all(np.diff(t) > 0):
+        t = np.arange(len(data)) * frame_dt
+    x = data[:, 1] - SET_POINT
+    u = data[:, 5]
+    if np.std(x) < 0.5 or np.std(u) < 1:
+        raise ValueError("the robot hardly moves in the trace, there is nothing to fit a model to")
+
+    # the gyroscope axis that matches the change of the roll angle best is its rate
+    dx = np.gradient(x, t)
+    correlations = [np.corrcoef(dx, data[:, 2 + axis])[0, 1] if np.std(data[:, 2 + axis]) > 0 else 0
+                    for axis in range(3)]
+    axis = int(np.argmax(np.abs(correlations)))
+    v = data[:, 2 + axis] * np.sign(correlations[axis]) if correlations[axis] else dx
+
+    # the power is held between two frames, so the model is fitted to the mean acceleration of each interval
+    acceleration = np.diff(v) / np.diff(t)
+    x = (x[:-1] + x[1:]) / 2
+    v = (v[:-1] + v[1:]) / 2
+    design = np.column_stack([x, v, u[:-1], np.ones_like(x)])
+    (a, minus_c, b, bias), *_ = np.linalg.lstsq(design, acceleration, rcond=None)
+    return Model(a, b, -minus_c, bias)
+
+
+def simulate(model, kp, ki, kd, dt, initial=3.0, duration=5.0, step=0.001, tolerance=1.0):
+    """Simulates all gain sets and loop periods (broadcast arrays) at once, starting initial degrees off the set point.
+    Returns the fall time (inf if standing), the settle time (last time off by more than tolerance) and the
+    integral of the absolute deviation."""
+    kp, ki, kd, dt = (a.ravel() for a in np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (kp, ki, kd, dt))))
+    n = kp.size
+    x = np.full(n, float(initial))
+    v = np.zeros(n)
+    power = np.zeros(n)
+    integral = np.zeros(n)
+    prev_error = np.full(n, np.nan)
+    max_integral = np.where(ki == 0, MAX_INTEGRAL, MAX_INTEGRAL / np.where(ki == 0, 1, ki))
+    next_update = np.zeros(n)
+    alive = np.ones(n, dtype=bool)
+    fall_time = np.full(n, np.inf)
+    settle_time = np.zeros(n)
+    iae = np.zeros(n)
+
+    for k in range(int(round(duration / step))):
+        t = k * step
+        update = alive & (t >= next_update - step / 2)
+        if update.any():
+            state = np.round(x + SET_POINT)
+            fallen = update & (np.abs(state - SET_POINT) >= STOP_ANGLE)
+            if fallen.any():
+                fall_time[fallen] = t
+                alive &= ~fallen
+                update &= ~fallen
+                power[fallen] = 0
+            error = SET_POINT - state
+            prev = np.where(np.isnan(prev_error), error, prev_error)
+            integral = np.where(update, np.clip(integral + error * dt, -max_integral, max_integral), integral)
+            response = kp * error + ki * integral + kd * (error - prev) / dt
+            power = np.where(update, np.clip(np.round(response), -100, 100), power)
+            prev_error = np.where(update, error, prev_error)
+            next_update = np.where(update, next_update + dt, next_update)
+
+        acceleration = model.a * x - model.c * v + model.b * power + model.bias
+        v = np.where(alive, v + acceleration * step, v)
+        x = np.where(alive, x + v * step, x)
+        settle_time = np.where(alive & (np.abs(x) > tolerance), t + step, settle_time)
+        iae += np.abs(x) * step * alive
+
+    return fall_time, settle_time, iae
+
+
+def rank(fall_time, settle_time, iae):
+    """Returns the indices from best to worst: standing before fallen, then by settle time (or later fall) and iae."""
+    fallen = np.isfinite(fall_time)
+    return np.lexsort((iae, np.where(fallen, -fall_time, settle_time), fallen))
+
+
+def parse_values(text):
+    """Parses "start:stop:count" as evenly spaced values or a comma separated list."""
+    if ":" in text:
+        start, stop, count = text.split(":")
+        return np.linspace(float(start), float(stop), int(count))
+    return np.array([float(value) for value in text.split(",")])
+
+
+def start():
+    parser = argparse.ArgumentParser(description="Simulate and rank PID gains for the balancing programs.")
+    parser.add_argument("trace", nargs="*", help="gateway traces to fit the model to", metavar="<path>")
+    parser.add_argument("--kp", help="KP values (default: 0:40:21)", default="0:40:21", type=parse_values)
+    parser.add_argument("--ki", help="KI values (default: 0:200:11)", default="0:200:11", type=parse_values)
+    parser.add_argument("--kd", help="KD values (default: 0:0.5:6)", default="0:0.5:6", type=parse_values)
+    parser.add_argument("--dt", help="loop periods in seconds (default: 0.01,0.02,0.04)", default="0.01,0.02,0.04",
+                        type=parse_values)
+    parser.add_argument("--model", help="model parameters instead of fitting them", metavar="<a>,<b>,<c>")
+    parser.add_argument("--motors", help="ports of the motor pair (default: BF)", default="BF")
+    parser.add_argument("--initial", help="initial deviation in degrees (default: 3)", default=3.0, type=float)
+    parser.add_argument("--duration", help="simulated seconds (default: 5)", default=5.0, type=float)
+    parser.add_argument("--top", help="number of results to show (default: 10)", default=10, type=int)
+    args = parser.parse_args()
+
+    if args.model:
+        model = Model(*(float(value) for value in args.model.split(",")))
+    elif args.trace:
+        messages = (message for path in args.trace for message in read_messages(path))
+        try:
+            model = fit_model(messages, args.motors)
+        except ValueError as e:
+            print(f"Cannot fit model: {e}, using default model")
+            model = Model()
+    else:
+        model = Model()
+    print(f"Model: {model}")
+
+    kp, ki, kd, dt = np.meshgrid(args.kp, args.ki, args.kd, args.dt, indexing="ij")
+    kp, ki, kd, dt = kp.ravel(), ki.ravel(), kd.ravel(), dt.ravel()
+    started = time.perf_counter()
+    fall_time, settle_time, iae = simulate(model, kp, ki, kd, dt, args.initial, args.duration)
+    print(f"Simulated {kp.size} candidates in {time.perf_counter() - started:.1f}s, "
+          f"{np.isinf(fall_time).sum()} keep balancing")
+
+    print(f"{'KP':>8} {'KI':>8} {'KD':>8} {'DT':>6} {'settle':>8} {'fall':>8} {'IAE':>8}")
+    for i in rank(fall_time, settle_time, iae)[:args.top]:
+        if np.isfinite(fall_time[i]):
+            settle, fall = "       -", f"{fall_time[i]:7.2f}s"
+        else:
+            settle, fall = f"{settle_time[i]:7.2f}s", "       -"
+        print(f"{kp[i]:8.3g} {ki[i]:8.3g} {kd[i]:8.3g} {dt[i]:6.3f} {settle} {fall} {iae[i]:8.3f}")
+
+
+if __name__ == "__main__":
+    start()
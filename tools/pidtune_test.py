@@ -0,0 +1,80 @@
+import unittest
+
+try:
+    import numpy as np
+    import pidtune
+except ImportError:
+    np = None
+
+
+def simulate_scalar(model, kp, ki, kd, dt, initial, duration, step=0.001):
+    """Straightforward simulation with the controller of programs/b2.py."""
+    x, v, power = initial, 0.0, 0
+    integral, prev_error = 0.0, None
+    max_integral = 100 if ki == 0 else 100 / ki
+    next_update = 0.0
+    for k in range(int(round(duration / step))):
+        t = k * step
+        if t >= next_update - step / 2:
+            state = round(x + pidtune.SET_POINT)
+            if abs(state - pidtune.SET_POINT) >= pidtune.STOP_ANGLE:
+                return t
+            error = pidtune.SET_POINT - state
+            if prev_error is None:
+                prev_error = error
+            integral += error * dt
+            if abs(integral) > max_integral:
+                integral = max_integral if integral > 0 else -max_integral
+            response = kp * error + ki * integral + kd * (error - prev_error) / dt
+            prev_error = error
+            power = max(-100, min(100, int(round(response))))
+            next_update += dt
+        v += (model.a * x - model.c * v + model.b * power) * step
+        x += v * step
+    return float('inf')
+
+
+@unittest.skipUnless(np, "numpy not installed")
+class SimulateTestCase(unittest.TestCase):
+    def test_matches_scalar_controller(self):
+        model = pidtune.Model()
+        gains = [(10, 120, 0.1, 0.02), (10, 0, 0.1, 0.02), (40, 0, 0, 0.02), (18, 0, 0.5, 0.01), (0, 0, 0, 0.04)]
+        kp, ki, kd, dt = np.array(gains).T
+        fall_time, _, _ = pidtune.simulate(model, kp, ki, kd, dt, initial=3.0, duration=2.0)
+        expected = [simulate_scalar(model, *gain, initial=3.0, duration=2.0) for gain in gains]
+        np.testing.assert_allclose(fall_time, expected)
+
+    def test_rank(self):
+        fall_time = np.array([0.5, np.inf, 1.0, np.inf])
+        settle_time = np.array([0.5, 2.0, 1.0, 0.3])
+        iae = np.array([1.0, 1.0, 1.0, 1.0])
+        self.assertEqual(list(pidtune.rank(fall_time, settle_time, iae)), [3, 1, 2, 0])
+
+    def test_fit_model(self):
+        model = pidtune.Model(a=80, b=15, c=2, bias=0)
+        rng = np.random.default_rng(1)
+        messages, x, v, noise = [], 2.0, 0.0, 0
+        step = 0.001
+        for k in range(20000):
+            if k % 20 == 0:
+                # a stabilizing controller with random disturbances
+                noise = int(rng.integers(-20, 20)) if k % 200 == 0 else noise
+                u = round(-10 * x) + noise
+                speeds = [[75, [0, 0, 0, 0]]] * 6
+                speeds[1] = [75, [u, 0, 0, 0]]
+                speeds[5] = [75, [-u, 0, 0, 0]]
+                p = speeds + [[0, 0, 0], [round(v, 3), 0, 0], [0, 0, x + pidtune.SET_POINT], "", k]
+                messages.append({"m": 0, "p": p})
+            v += (model.a * x - model.c * v + model.b * u) * step
+            x += v * step
+        fitted = pidtune.fit_model(messages)
+        self.assertAlmostEqual(fitted.a, model.a, delta=8)
+        self.assertAlmostEqual(fitted.b, model.b, delta=1.5)
+
+    def test_parse_values(self):
+        np.testing.assert_allclose(pidtune.parse_values("0:40:5"), [0, 10, 20, 30, 40])
+        np.testing.assert_allclose(pidtune.parse_values("0.01,0.02"), [0.01, 0.02])
+
+
+if __name__ == '__main__':
+    unittest.main()
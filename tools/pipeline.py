@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Streaming operators for the messages of the hub and its clients. A pipeline is a chain of generators over events
+# (time, direction, message), the same pipeline runs over a trace file (Pipeline.read) and inside the gateway, which
+# pushes the messages it has decoded anyway into a Feed (gateway.py -x module:name). E.g. the battery voltage of the
+# last 10 battery notifications:
+#
+#   Pipeline().select(m=2).window(size=10).apply(lambda events: summary(e.message["p"][0] for e in events))
+#
+# Live the input is pushed one event at a time, so a generator may run out of input in the middle of the stream: the
+# source then yields PENDING, which every operator passes on unchanged. Custom operators added with Pipeline.then()
+# have to do the same. The messages are shared with the gateway and its clients and must not be modified.
+
+import argparse
+import importlib
+import inspect
+import json
+import sys
+import time
+from collections import deque, namedtuple, OrderedDict
+
+import scheduler
+import tracefile
+
+# direction is '<' for messages of the hub and '>' for requests of the clients, t is the host time or None
+Event = namedtuple("Event", "t direction message")
+
+# no further input yet, see above
+PENDING = object()
+
+
+def kind_of(message):
+    """Returns 'request', 'notification', 'response', 'error' or 'unknown', like the gateway tells them apart."""
+    if "i" in message:
+        if "m" in message:
+            return "request"
+        if "r" in message:
+            return "response"
+        if "e" in message:
+            return "error"
+    elif "m" in message and "p" in message:
+        return "notification"
+    return "unknown"
+
+
+def as_set(value):
+    """A single value or a collection of values as set, None stays None."""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return set(value)
+    return {value}
+
+
+def select(events, m=None, kind=None, direction=None):
+    """Passes the events with one of the message codes m, of one of the kinds and from the direction."""
+    ms, kinds = as_set(m), as_set(kind)
+    for event in events:
+        if event is PENDING or \
+                (ms is None or event.message.get("m") in ms) and \
+                (kinds is None or kind_of(event.message) in kinds) and \
+                (direction is None or event.direction == direction):
+            yield event
+
+
+def where(events, predicate):
+    """Passes the events for which predicate(event) is true."""
+    for event in events:
+        if event is PENDING or predicate(event):
+            yield event
+
+
+def apply(events, function):
+    """Yields function(event) for each event."""
+    for event in events:
+        yield event if event is PENDING else function(event)
+
+
+def window(events, size=None, duration=None, step=1):
+    """Yields sliding windows as tuples: the last size events (once there are as many) or the events of the last
+    duration seconds (which needs timed events), every step events."""
+    if (size is None) == (duration is None):
+        raise ValueError("either size or duration is needed")
+    buffer = deque(maxlen=size)
+    n = 0
+    for event in events:
+        if event is PENDING:
+            yield event
+            continue
+        buffer.append(event)
+        if duration is not None:
+            if event.t is None:
+                raise ValueError("windows by duration need events with time")
+            while event.t - buffer[0].t > duration:
+                buffer.popleft()
+        n += 1
+        if n % step == 0 and (size is None or len(buffer) == size):
+            yield tuple(buffer)
+
+
+def aggregate(events, function, initial=0, key=None):
+    """Yields the running value = function(value, event), starting with initial. With key the value is kept per
+    key(event) and (key, value) is yielded. initial is shared by all keys, so it should be immutable."""
+    totals = {}
+    total = initial
+    for event in events:
+        if event is PENDING:
+            yield event
+        elif key is None:
+            total = function(total, event)
+            yield total
+        else:
+            k = key(event)
+            totals[k] = function(totals.get(k, initial), event)
+            yield k, totals[k]
+
+
+def join(events, timeout=scheduler.TIMEOUT):
+    """Yields (request, answer) for the requests of the clients and the responses or errors of the hub with the same
+    id. Requests without answer are forgotten after timeout seconds (only if the events have a time)."""
+    requests = OrderedDict()
+    for event in events:
+        if event is PENDING:
+            yield event
+            continue
+        message = event.message
+        if "i" not in message:
+            continue
+        if event.direction == ">" and "m" in message:
+            requests.pop(message["i"], None)
+            requests[message["i"]] = event
+            if event.t is not None:
+                while requests:
+                    oldest = next(iter(requests.values()))
+                    if oldest.t is None or event.t - oldest.t <= timeout:
+                        break
+                    requests.popitem(last=False)
+        elif event.direction == "<" and ("r" in message or "e" in message):
+            request = requests.pop(message["i"], None)
+            if request is not None:
+                yield request, event
+
+
+def summary(numbers):
+    """count, min, max and mean of the numbers, e.g. of the values in a window."""
+    count, low, high, total = 0, None, None, 0
+    for number in numbers:
+        count += 1
+        total += number
+        low = number if low is None or number < low else low
+        high = number if high is None or number > high else high
+    return {"count": count, "min": low, "max": high, "mean": total / count if count else None}
+
+
+def read_events(path, direction=None, m=None):
+    """Yields the events of a trace file, lines which are no JSON objects are skipped. Lines of other directions and
+    numbered notifications of the hub with other message codes than m are skipped before they are decoded. Only the
+    hub's compact layout ({"m":0,...) is checked, so other lines still have to be filtered by select()."""
+    prefixes = None
+    # a float like 2.0 selects the notifications with m=2, too, but has no prefix
+    if m is not None and not any(isinstance(value, float) for value in as_set(m)):
+        prefixes = tuple(b'{"m":%d,' % value for value in as_set(m) if isinstance(value, int))
+    loads = json.loads
+    for line_direction, t, line in tracefile.read_timed_trace(path):
+        if direction is not None and line_direction != direction:
+            continue
+        if prefixes is not None and line.startswith(b'{"m":') and line[5:6].isdigit() and \
+                not line.startswith(prefixes):
+            continue
+        try:
+            message = loads(line)
+        except ValueError:
+            continue
+        if isinstance(message, dict):
+            yield Event(t, line_direction, message)
+
+
+class Pipeline:
+    """Chain of operators, built with the methods of the same name, each returns a new pipeline."""
+
+    def __init__(self, stages=()):
+        self.stages = tuple(stages)  # (operator, keyword arguments)
+
+    def then(self, operator, **kwargs):
+        """Appends operator(events, **kwargs), a generator which has to pass PENDING on."""
+        return Pipeline(self.stages + ((operator, kwargs),))
+
+    def select(self, m=None, kind=None, direction=None):
+        return self.then(select, m=m, kind=kind, direction=direction)
+
+    def where(self, predicate):
+        return self.then(where, predicate=predicate)
+
+    def apply(self, function):
+        return self.then(apply, function=function)
+
+    def window(self, size=None, duration=None, step=1):
+        if (size is None) == (duration is None):
+            raise ValueError("either size or duration is needed")
+        return self.then(window, size=size, duration=duration, step=step)
+
+    def aggregate(self, function, initial=0, key=None):
+        return self.then(aggregate, function=function, initial=initial, key=key)
+
+    def join(self, timeout=scheduler.TIMEOUT):
+        return self.then(join, timeout=timeout)
+
+    def __call__(self, events):
+        for operator, kwargs in self.stages:
+            events = operator(events, **kwargs)
+        return events
+
+    def read(self, path):
+        """Runs the pipeline over a trace file, a leading select() skips the lines it would drop undecoded."""
+        direction = m = None
+        if self.stages and self.stages[0][0] is select:
+            direction, m = self.stages[0][1]["direction"], self.stages[0][1]["m"]
+        return self(read_events(path, direction, m))
+
+
+class Feed:
+    """Runs a pipeline over events pushed one by one and passes its output to sink(item)."""
+
+    def __init__(self, pipeline, sink):
+        self.events = deque()
+        self.closed = False
+        self.sink = sink
+        self.output = pipeline(self.source())
+
+    def source(self):
+        while True:
+            while self.events:
+                yield self.events.popleft()
+            if self.closed:
+                return
+            yield PENDING
+
+    def push(self, event):
+        self.events.append(event)
+        self.drain()
+
+    def drain(self):
+        for item in self.output:
+            if item is PENDING:
+                return
+            self.sink(item)
+
+    def close(self):
+        """Ends the input, the pipeline finishes with the events it still holds."""
+        self.closed = True
+        self.drain()
+
+
+def load(spec):
+    """Returns the pipeline module:name, name is a Pipeline or a function returning one, e.g. pipeline:latencies."""
+    module, _, name = spec.partition(":")
+    if not module or not name:
+        raise ValueError(f"'{spec}' is no module:name")
+    target = getattr(importlib.import_module(module), name)
+    return target() if inspect.isfunction(target) else target
+
+
+def format_item(item):
+    return item if isinstance(item, str) else json.dumps(item, default=str)
+
+
+def latencies():
+    """Round trip times of the requests in ms."""
+    return Pipeline().join().apply(lambda pair: {
+        "m": pair[0].message["m"],
+        "ms": None if pair[0].t is None or pair[1].t is None else round((pair[1].t - pair[0].t) * 1000, 1),
+        "error": "e" in pair[1].message,
+    })
+
+
+def battery(size=10):
+    """Voltage of the last battery notifications."""
+    return Pipeline().select(m=2).window(size=size).apply(
+        lambda events: summary(event.message["p"][0] for event in events))
+
+
+def start():
+    parser = argparse.ArgumentParser(description="Run a pipeline over the messages of a trace file.")
+    parser.add_argument("trace", help="trace file written by the gateway", metavar="<path>")
+    parser.add_argument("pipeline", help="pipeline or function returning one, e.g. pipeline:battery",
+                        metavar="<module>:<name>")
+    parser.add_argument("-q", "--quiet", help="only show the number of results and the time taken",
+                        action="store_true")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    n = 0
+    for item in load(args.pipeline).read(args.trace):
+        n += 1
+        if not args.quiet:
+            print(format_item(item))
+    print(f"{n} results in {time.perf_counter() - started:.3f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    start()
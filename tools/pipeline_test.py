@@ -0,0 +1,142 @@
+import os
+import tempfile
+import unittest
+
+import pipeline
+from pipeline import Event, Feed, Pipeline
+
+TRACE = os.path.join(os.path.dirname(__file__), "..", "data", "hub-trace.bin")
+
+EVENTS = [
+    Event(1.0, "<", {"m": 2, "p": [7.9, 80, 0]}),
+    Event(1.1, ">", {"i": "a1", "m": "get_hub_info", "p": {}}),
+    Event(1.2, "<", {"m": 0, "p": [0] * 11}),
+    Event(1.3, "<", {"m": 2, "p": [7.8, 79, 0]}),
+    Event(1.4, "<", {"i": "a1", "r": {"version": [1, 2]}}),
+    Event(1.5, ">", {"i": "a2", "m": "program_terminate", "p": {}}),
+    Event(1.6, "<", {"m": 2, "p": [7.7, 78, 0]}),
+    Event(9.0, ">", {"i": "a3", "m": "get_storage_status", "p": {}}),
+    Event(9.1, "<", {"i": "a2", "e": "ZXJyb3I="}),
+    Event(9.2, "<", {"i": "a3", "r": {}}),
+]
+
+
+def run_live(pipeline, events):
+    output = []
+    feed = Feed(pipeline, output.append)
+    for event in events:
+        feed.push(event)
+    feed.close()
+    return output
+
+
+class OperatorTestCase(unittest.TestCase):
+    def test_kind_of(self):
+        self.assertEqual(["notification", "request", "notification", "notification", "response", "request",
+                          "notification", "request", "error", "response"],
+                         [pipeline.kind_of(event.message) for event in EVENTS])
+        self.assertEqual("unknown", pipeline.kind_of({"x": 1}))
+
+    def test_select(self):
+        self.assertEqual([0, 2, 3, 6], [EVENTS.index(e) for e in pipeline.select(EVENTS, m=(0, 2))])
+        self.assertEqual([4, 9], [EVENTS.index(e) for e in pipeline.select(EVENTS, kind="response")])
+        self.assertEqual([1, 5, 7], [EVENTS.index(e) for e in pipeline.select(EVENTS, direction=">")])
+
+    def test_window(self):
+        voltages = Pipeline().select(m=2).apply(lambda event: event.message["p"][0]).window(size=2)
+        self.assertEqual([(7.9, 7.8), (7.8, 7.7)], list(voltages(EVENTS)))
+
+        windows = list(pipeline.window(EVENTS, duration=0.25, step=3))
+        self.assertEqual([[1.0, 1.1, 1.2], [1.3, 1.4, 1.5], [9.0, 9.1]], [[e.t for e in w] for w in windows])
+        self.assertRaises(ValueError, Pipeline().window)
+
+    def test_aggregate(self):
+        count = pipeline.aggregate(EVENTS, lambda n, event: n + 1, key=lambda event: event.direction)
+        self.assertEqual(("<", 7), list(count)[-1])
+        self.assertEqual(10, list(pipeline.aggregate(EVENTS, lambda n, event: n + 1))[-1])
+
+    def test_join(self):
+        pairs = list(pipeline.join(EVENTS))
+        self.assertEqual([("a1", 1.4), ("a3", 9.2)], [(request.message["i"], answer.t) for request, answer in pairs])
+        # without timeout the unanswered program_terminate is matched with its late error
+        pairs = list(pipeline.join(EVENTS, timeout=100))
+        self.assertEqual(["a1", "a2", "a3"], [request.message["i"] for request, answer in pairs])
+
+    def test_summary(self):
+        self.assertEqual({"count": 3, "min": 1, "max": 5, "mean": 3}, pipeline.summary([3, 1, 5]))
+        self.assertIsNone(pipeline.summary([])["mean"])
+
+
+class FeedTestCase(unittest.TestCase):
+    def test_same_output_as_offline(self):
+        pipelines = [
+            pipeline.latencies(),
+            pipeline.battery(size=2),
+            Pipeline().window(duration=1, step=2).apply(len),
+            Pipeline().select(kind="notification").aggregate(lambda n, event: n + 1, key=lambda e: e.message["m"]),
+        ]
+        for p in pipelines:
+            self.assertEqual(list(p(EVENTS)), run_live(p, EVENTS))
+
+    def test_output_as_soon_as_possible(self):
+        output = []
+        feed = Feed(Pipeline().select(m=2).window(size=2), output.append)
+        feed.push(EVENTS[0])
+        feed.push(EVENTS[1])
+        self.assertEqual([], output)
+        feed.push(EVENTS[3])
+        self.assertEqual([(EVENTS[0], EVENTS[3])], output)
+
+
+class LoadTestCase(unittest.TestCase):
+    def test_load(self):
+        self.assertEqual(3, len(pipeline.load("pipeline:battery").stages))
+        self.assertRaises(ValueError, pipeline.load, "pipeline")
+        self.assertRaises(AttributeError, pipeline.load, "pipeline:nothing")
+
+
+class ReadEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        with tempfile.NamedTemporaryFile("wb", suffix=".log", delete=False) as f:
+            f.write(b'< @1.5 {"m":2,"p":[7.9, 80, 0]}\n'
+                    b'> @1.6 {"i": "a1", "m": "get_hub_info", "p": {}}\n'
+                    b'< {"m":0,"p":[]}\n'
+                    b'< 0]}\n'
+                    b'< {"m":"runtime_error","p":[]}\n'
+                    b'< @1.7 {"i": "a1", "r": {}}\n')
+        self.path = f.name
+        self.addCleanup(os.unlink, self.path)
+
+    def test_read_events(self):
+        events = list(pipeline.read_events(self.path))
+        self.assertEqual(5, len(events))
+        self.assertEqual(Event(1.6, ">", {"i": "a1", "m": "get_hub_info", "p": {}}), events[1])
+        self.assertIsNone(events[2].t)
+
+    def test_prefilter(self):
+        events = pipeline.read_events(self.path, direction="<", m=["runtime_error", 2])
+        # the response passes the check, select() drops it
+        self.assertEqual([2, "runtime_error", None], [event.message.get("m") for event in events])
+        self.assertEqual([2, "runtime_error"],
+                         [event.message["m"] for event in Pipeline().select(m=["runtime_error", 2]).read(self.path)])
+        self.assertEqual([((1.6, 1.7), False)], [((request.t, answer.t), "e" in answer.message)
+                                                 for request, answer in Pipeline().join().read(self.path)])
+
+    def test_prefilter_spaced_request(self):
+        for m in ("get_hub_info", ["get_hub_info", 2]):
+            selected = Pipeline().select(m=m)
+            self.assertEqual(list(selected(pipeline.read_events(self.path))), list(selected.read(self.path)))
+        self.assertEqual(["a1"], [event.message["i"] for event in Pipeline().select(m="get_hub_info").read(self.path)])
+        self.assertEqual([1.5], [event.t for event in Pipeline().select(m=2.0).read(self.path)])
+
+    @unittest.skipUnless(os.path.exists(TRACE), "no trace")
+    def test_trace(self):
+        battery = pipeline.battery()
+        offline = list(battery.read(TRACE))
+        self.assertEqual(list(battery(pipeline.read_events(TRACE))), offline)
+        self.assertEqual(offline, run_live(battery, pipeline.read_events(TRACE)))
+        self.assertTrue(all(result["count"] == 10 for result in offline))
+
+
+if __name__ == "__main__":
+    unittest.main()
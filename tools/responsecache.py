@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Cache for the responses of idempotent hub requests in the gateway. Repeated requests like get_hub_info are
+# answered from the cache while their entry is fresh. Identical requests of several clients, that are sent while the
+# first one is still waiting for the hub's answer, are collapsed into one hub call and each client gets the answer
+# under its own id. Writes to the storage invalidate the cached entries when they are sent to the hub (requests
+# overtaking a queued write still see the storage before it), as do the hub's m=1 storage notifications.
+
+import base64
+import json
+import time
+
+# seconds a response stays valid, only these methods are cached
+TTL = {
+    "get_hub_info": 300,
+    "get_storage_status": 30,
+}
+
+# requests and notifications (by m) changing what the cached methods return
+INVALIDATES = {
+    "start_write_program": ("get_storage_status",),
+    "write_package": ("get_storage_status",),
+    "move_project": ("get_storage_status",),
+    "remove_project": ("get_storage_status",),
+    1: ("get_storage_status",),
+}
+
+# a request without answer after this time is considered lost and sent again
+IN_FLIGHT_TIMEOUT = 10
+
+# error for the requests collapsed into a lost one
+LOST = base64.b64encode(json.dumps({"message": "no answer from the hub", "type": "TimeoutError"}).encode("utf-8")) \
+    .decode("ascii")
+
+
+class InFlight:
+    def __init__(self, key, sent):
+        self.key = key
+        self.sent = sent
+        self.stale = False
+        self.waiters = []  # (client, id)
+
+
+class ResponseCache:
+    def __init__(self, ttl=TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}  # key -> (expires, result)
+        self.in_flight = {}  # (client, id) of the forwarded request -> InFlight
+        self.hits = 0
+        self.collapsed = 0
+
+    @staticmethod
+    def key(message):
+        return message["m"], json.dumps(message.get("p"), sort_keys=True)
+
+    def request(self, client, message):
+        """Returns the response for the client if the request is answered by the gateway, None if it has to be
+        forwarded to the hub or False if it waits for the answer of an identical request."""
+        if message.get("m") not in self.ttl or "i" not in message:
+            return None
+
+        key = self.key(message)
+        now = self.clock()
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            return {"i": message["i"], "r": entry[1]}
+
+        for request in self.in_flight.values():
+            if request.key == key and not request.stale and now - request.sent <= IN_FLIGHT_TIMEOUT:
+                request.waiters.append((client, message["i"]))
+                self.collapsed += 1
+                return False
+        # ids are chosen by the clients, so two clients may use the same one at the same time
+        self.in_flight[(client, message["i"])] = InFlight(key, now)
+        return None
+
+    def response(self, client, message):
+        """Stores the hub's answer to a request of the client (with the client's id) and returns the (client, response)
+        pairs for the collapsed requests."""
+        request = self.in_flight.pop((client, message.get("i")), None)
+        if request is None:
+            return []
+        if "r" in message and not request.stale:
+            self.entries[request.key] = (self.clock() + self.ttl[request.key[0]], message["r"])
+        return [(client, dict(message, i=i)) for client, i in request.waiters]
+
+    def sent(self, message):
+        """Called when a request is sent to the hub."""
+        if message.get("m") in INVALIDATES:
+            self.invalidate(*INVALIDATES[message["m"]])
+
+    def expire(self):
+        """Forgets the requests without answer after IN_FLIGHT_TIMEOUT and returns (client, error response) pairs for
+        the requests collapsed into them."""
+        now = self.clock()
+        errors = []
+        for forwarded, request in list(self.in_flight.items()):
+            if now - request.sent > IN_FLIGHT_TIMEOUT:
+                del self.in_flight[forwarded]
+                errors += [(client, {"i": i, "e": LOST}) for client, i in request.waiters]
+        return errors
+
+    def timeout(self):
+        """Seconds until expire() has to be called again, None if no request is waiting for its answer."""
+        if not self.in_flight:
+            return None
+        oldest = min(request.sent for request in self.in_flight.values())
+        return max(0, oldest + IN_FLIGHT_TIMEOUT - self.clock())
+
+    def notification(self, m):
+        if m in INVALIDATES:
+            self.invalidate(*INVALIDATES[m])
+
+    def invalidate(self, *methods):
+        for key in [key for key in self.entries if key[0] in methods]:
+            del self.entries[key]
+        # a running request may have been answered before the change, its waiters get the answer but it is not cached
+        for request in self.in_flight.values():
+            if request.key[0] in methods:
+                request.stale = True
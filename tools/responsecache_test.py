@@ -0,0 +1,88 @@
+import unittest
+
+import responsecache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = responsecache.ResponseCache(clock=self.clock)
+
+    def test_ttl(self):
+        self.assertIsNone(self.cache.request("a", {"i": "a1", "m": "get_hub_info", "p": {}}))
+        self.assertEqual([], self.cache.response("a", {"i": "a1", "r": {"version": [1, 2]}}))
+        self.clock.now = 299
+        self.assertEqual({"i": "b1", "r": {"version": [1, 2]}},
+                         self.cache.request("b", {"i": "b1", "m": "get_hub_info", "p": {}}))
+        self.clock.now = 300
+        self.assertIsNone(self.cache.request("b", {"i": "b2", "m": "get_hub_info", "p": {}}))
+        self.assertEqual(1, self.cache.hits)
+
+    def test_not_cached(self):
+        self.assertIsNone(self.cache.request("a", {"i": "a1", "m": "program_execute", "p": {"slotid": 1}}))
+        self.assertEqual([], self.cache.response("a", {"i": "a1", "r": None}))
+        self.assertIsNone(self.cache.request("a", {"i": "a2", "m": "program_execute", "p": {"slotid": 1}}))
+
+    def test_collapse(self):
+        self.assertIsNone(self.cache.request("a", {"i": "a1", "m": "get_storage_status", "p": {}}))
+        self.assertIs(False, self.cache.request("b", {"i": "b1", "m": "get_storage_status", "p": {}}))
+        self.assertIs(False, self.cache.request("c", {"i": "c1", "m": "get_storage_status", "p": {}}))
+        self.assertEqual([("b", {"i": "b1", "r": 42}), ("c", {"i": "c1", "r": 42})],
+                         self.cache.response("a", {"i": "a1", "r": 42}))
+        self.assertEqual(2, self.cache.collapsed)
+
+    def test_same_id_of_other_clients(self):
+        self.assertIsNone(self.cache.request("a", {"i": "x1", "m": "get_storage_status", "p": {}}))
+        self.assertIsNone(self.cache.request("b", {"i": "x1", "m": "get_hub_info", "p": {}}))
+        self.assertIs(False, self.cache.request("c", {"i": "c1", "m": "get_hub_info", "p": {}}))
+        self.assertEqual([], self.cache.response("a", {"i": "x1", "r": 42}))
+        self.assertEqual([("c", {"i": "c1", "r": {"version": [1, 2]}})],
+                         self.cache.response("b", {"i": "x1", "r": {"version": [1, 2]}}))
+        self.assertEqual({"i": "a2", "r": 42}, self.cache.request("a", {"i": "a2", "m": "get_storage_status", "p": {}}))
+
+    def test_errors_are_not_cached(self):
+        self.cache.request("a", {"i": "a1", "m": "get_storage_status", "p": {}})
+        self.cache.request("b", {"i": "b1", "m": "get_storage_status", "p": {}})
+        self.assertEqual([("b", {"i": "b1", "e": "eyJ9"})], self.cache.response("a", {"i": "a1", "e": "eyJ9"}))
+        self.assertIsNone(self.cache.request("a", {"i": "a2", "m": "get_storage_status", "p": {}}))
+
+    def test_lost_request(self):
+        self.assertIsNone(self.cache.timeout())
+        self.cache.request("a", {"i": "a1", "m": "get_hub_info", "p": {}})
+        self.cache.request("c", {"i": "c1", "m": "get_hub_info", "p": {}})
+        self.assertEqual(responsecache.IN_FLIGHT_TIMEOUT, self.cache.timeout())
+        self.assertEqual([], self.cache.expire())
+        self.clock.now = responsecache.IN_FLIGHT_TIMEOUT + 1
+        self.assertIsNone(self.cache.request("b", {"i": "b1", "m": "get_hub_info", "p": {}}))
+        self.assertEqual([("c", {"i": "c1", "e": responsecache.LOST})], self.cache.expire())
+        self.assertEqual([], self.cache.response("a", {"i": "a1", "r": {"version": [1, 2]}}))
+
+    def test_invalidate(self):
+        self.cache.request("a", {"i": "a1", "m": "get_storage_status", "p": {}})
+        self.cache.response("a", {"i": "a1", "r": 1})
+        self.cache.notification(1)
+        self.assertIsNone(self.cache.request("a", {"i": "a2", "m": "get_storage_status", "p": {}}))
+        self.cache.response("a", {"i": "a2", "r": 2})
+
+        # a write only invalidates once it is sent to the hub
+        remove = {"i": "a3", "m": "remove_project", "p": {"slotid": 3}}
+        self.assertIsNone(self.cache.request("a", remove))
+        self.assertEqual({"i": "a4", "r": 2}, self.cache.request("a", {"i": "a4", "m": "get_storage_status", "p": {}}))
+        self.cache.sent(remove)
+        self.assertIsNone(self.cache.request("a", {"i": "a5", "m": "get_storage_status", "p": {}}))
+        # answered before the write was done, so it is delivered but not cached
+        self.cache.sent({"i": "a6", "m": "move_project", "p": {"old_slotid": 1, "new_slotid": 2}})
+        self.cache.response("a", {"i": "a5", "r": 3})
+        self.assertIsNone(self.cache.request("a", {"i": "a7", "m": "get_storage_status", "p": {}}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Scheduler for the requests the gateway forwards to the hub. Requests are queued in priority classes and only a
+# limited number of them may wait for the hub's answer at the same time, so a long upload of one client does not
+# delay the commands of another by its whole backlog:
+#
+#   control      stopping programs and motors, always sent immediately, even beyond the limit
+#   interactive  everything else
+#   bulk         program uploads, at most one outstanding and paced by a minimal interval
+#
+# The ids have to be unique among the requests of all clients (see RequestIds in gateway.py). If the hub connection
+# never answers (replaying a trace), the requests are only paced, not limited.
+
+import time
+from collections import deque
+
+CONTROL, INTERACTIVE, BULK = range(3)
+PRIORITIES = ("control", "interactive", "bulk")
+
+CLASSES = {
+    "program_terminate": CONTROL,
+    "scratch.motor_stop": CONTROL,
+    "scratch.move_stop": CONTROL,
+    "scratch.sound_off": CONTROL,
+    "start_write_program": BULK,
+    "write_package": BULK,
+}
+
+# a request without answer after this time is considered lost
+TIMEOUT = 5
+
+
+def priority(message):
+    return CLASSES.get(message.get("m"), INTERACTIVE)
+
+
+class RequestScheduler:
+    def __init__(self, write, max_outstanding=2, bulk_interval=0.01, clock=time.monotonic, answered=True):
+        """write(line, line_terminators, message) sends a request to the hub, answered is False if the hub never
+        answers."""
+        self.write = write
+        self.max_outstanding = max_outstanding
+        self.answered = answered
+        self.bulk_interval = bulk_interval
+        self.clock = clock
+        self.queues = [deque() for _ in PRIORITIES]
+        self.outstanding = {}  # id -> (priority, sent)
+        self.last_bulk = None
+
+    def submit(self, line, line_terminators, message):
+        """Queues a request, lines without id are sent immediately as their answer cannot be tracked."""
+        if not isinstance(message, dict) or "i" not in message:
+            self.write(line, line_terminators, message)
+            return
+        self.queues[priority(message)].append((message["i"], line, line_terminators, message))
+        self.pump()
+
+    def response(self, i):
+        """Returns the round trip time of the answered request, None if it was not sent by the scheduler."""
+        outstanding = self.outstanding.pop(i, None)
+        if outstanding is None:
+            return None
+        rtt = self.clock() - outstanding[1]
+        self.pump()
+        return rtt
+
+    def pump(self):
+        """Sends the queued requests the limits allow."""
+        now = self.clock()
+        for i in [i for i, (_, sent) in self.outstanding.items() if now - sent > TIMEOUT]:
+            del self.outstanding[i]
+
+        while self.queues[CONTROL]:
+            self.send(CONTROL, *self.queues[CONTROL].popleft())
+        while len(self.outstanding) < self.max_outstanding:
+            if self.queues[INTERACTIVE]:
+                self.send(INTERACTIVE, *self.queues[INTERACTIVE].popleft())
+            elif self.queues[BULK] and self.bulk_ready(now):
+                self.send(BULK, *self.queues[BULK].popleft())
+                self.last_bulk = now
+            else:
+                break
+
+    def bulk_ready(self, now):
+        if any(priority == BULK for priority, _ in self.outstanding.values()):
+            return False
+        return self.last_bulk is None or now - self.last_bulk >= self.bulk_interval
+
+    def send(self, priority, i, line, line_terminators, message):
+        if self.answered:
+            self.outstanding[i] = (priority, self.clock())
+        self.write(line, line_terminators, message)
+
+    def timeout(self):
+        """Seconds until pump() has to be called again, None if only an answer of the hub can send more."""
+        if not any(self.queues) and not self.outstanding:
+            return None
+        deadlines = [sent + TIMEOUT for _, sent in self.outstanding.values()]
+        if self.queues[BULK] and self.last_bulk is not None:
+            deadlines.append(self.last_bulk + self.bulk_interval)
+        return max(0, min(deadlines) - self.clock()) if deadlines else None
@@ -0,0 +1,81 @@
+import unittest
+
+import scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def request(i, m):
+    return b'{"i": "%s", "m": "%s", "p": {}}' % (i.encode(), m.encode()), b'\r', {"i": i, "m": m, "p": {}}
+
+
+class RequestSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sent = []
+        self.scheduler = scheduler.RequestScheduler(lambda line, line_terminators, message: self.sent.append(line),
+                                                    max_outstanding=2, bulk_interval=0.05, clock=self.clock)
+
+    def ids(self):
+        return [line.split(b'"')[3].decode() for line in self.sent]
+
+    def test_priorities(self):
+        for n in range(3):
+            self.scheduler.submit(*request(f"u{n}", "write_package"))
+        for n in range(3):
+            self.scheduler.submit(*request(f"i{n}", "scratch.display_image"))
+        self.scheduler.submit(*request("c0", "program_terminate"))
+        # one bulk and one interactive request fill the limit, control requests are sent anyway
+        self.assertEqual(["u0", "i0", "c0"], self.ids())
+
+        self.scheduler.response("u0")
+        self.scheduler.response("c0")
+        self.assertEqual(["u0", "i0", "c0", "i1"], self.ids())
+        self.scheduler.response("i0")
+        self.scheduler.response("i1")
+        self.assertEqual(["u0", "i0", "c0", "i1", "i2"], self.ids())
+
+        # the next package waits for the bulk interval
+        self.scheduler.response("i2")
+        self.assertEqual(5, len(self.sent))
+        self.assertAlmostEqual(0.05, self.scheduler.timeout())
+        self.clock.now = 0.05
+        self.scheduler.pump()
+        self.assertEqual("u1", self.ids()[-1])
+
+    def test_not_answered(self):
+        self.scheduler.answered = False
+        for n in range(2):
+            self.scheduler.submit(*request(f"u{n}", "write_package"))
+        for n in range(3):
+            self.scheduler.submit(*request(f"i{n}", "get_hub_info"))
+        self.assertEqual(["u0", "i0", "i1", "i2"], self.ids())
+        self.assertAlmostEqual(0.05, self.scheduler.timeout())
+        self.clock.now = 0.05
+        self.scheduler.pump()
+        self.assertEqual("u1", self.ids()[-1])
+        self.assertIsNone(self.scheduler.timeout())
+
+    def test_without_id(self):
+        self.scheduler.submit(b'garbage', b'\r', None)
+        self.assertEqual([b'garbage'], self.sent)
+        self.assertIsNone(self.scheduler.timeout())
+
+    def test_lost_response(self):
+        for n in range(3):
+            self.scheduler.submit(*request(f"i{n}", "get_hub_info"))
+        self.assertEqual(["i0", "i1"], self.ids())
+        self.assertEqual(scheduler.TIMEOUT, self.scheduler.timeout())
+        self.clock.now = scheduler.TIMEOUT + 1
+        self.scheduler.pump()
+        self.assertEqual(["i0", "i1", "i2"], self.ids())
+
+
+if __name__ == "__main__":
+    unittest.main()
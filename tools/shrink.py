@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+# Shrinks hub programs before upload. The source is parsed and written again without comments, docstrings, unused
+# imports and dead code (`if False:` blocks and statements after return, raise, break and continue). Optionally
+#
+#   fold    module level names assigned a number once (like `wheel_radius = 2.8`), math constants and the arithmetic
+#           on them are replaced by their values
+#   rename  local variables of functions get short names (parameters keep theirs, they may be passed by keyword)
+#
+# Imports are assumed to have no side effects if their module is in PURE_MODULES, other imports keep at least one
+# name. Programs using eval, exec, globals or locals keep all their names. Folding computes with double precision,
+# the hub's MicroPython may round the intermediate results of the original expression differently.
+
+import ast
+import builtins
+import keyword
+import math
+import operator
+
+PURE_MODULES = {"mindstorms", "mindstorms.control", "mindstorms.operator", "math", "time", "utime", "random",
+                "urandom", "hub"}
+DYNAMIC = {"eval", "exec", "globals", "locals", "vars", "__import__"}
+MATH_CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau}
+
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+def used_names(tree):
+    """Names read anywhere in the tree."""
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Store)}
+
+
+def stored_names(tree):
+    """Names bound anywhere in the tree, counted by binding."""
+    names = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            bound = [node.id]
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound = [node.name]
+        elif isinstance(node, ast.arg):
+            bound = [node.arg]
+        elif isinstance(node, ast.alias):
+            bound = [(node.asname or node.name).split(".")[0]]
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound = [node.name]
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound = node.names
+        else:
+            continue
+        for name in bound:
+            names[name] = names.get(name, 0) + 1
+    return names
+
+
+def yields(statements):
+    """True if the statements contain a yield of the function they are in, nested functions don't count."""
+    nodes = list(statements)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ast.Yield, ast.YieldFrom)):
+            return True
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            nodes.extend(ast.iter_child_nodes(node))
+    return False
+
+
+def generator_marker():
+    """Replaces a removed yield, the function stays a generator."""
+    return ast.parse("if False:\n    yield").body[0]
+
+
+def too_large(function, *values):
+    """True if a product or power of ints would exceed 2 ** 30, checked before it is computed (10 ** 10 ** 8 would
+    take ages)."""
+    if len(values) != 2 or not all(isinstance(value, int) for value in values):
+        return False
+    left, right = values
+    if function is operator.mul:
+        return left.bit_length() + right.bit_length() - 2 > 30
+    if function is operator.pow:
+        return right > 0 and abs(left) > 1 and (left.bit_length() - 1) * right > 30
+    return False
+
+
+def is_docstring(node):
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+
+
+def is_number(node):
+    return isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and \
+        not isinstance(node.value, bool)
+
+
+class DeadCodeRemover(ast.NodeTransformer):
+    """Removes docstrings, `if False:` blocks and unreachable statements of all blocks. A removed yield is replaced by
+    `if False: yield`, otherwise a generator would become a plain function."""
+
+    def generic_visit(self, node):
+        super().generic_visit(node)
+        for field in ("body", "orelse", "finalbody"):
+            block = getattr(node, field, None)
+            if isinstance(block, list) and block and isinstance(block[0], ast.stmt):
+                setattr(node, field, self.block(block))
+        return node
+
+    def block(self, statements):
+        result = []
+        for index, statement in enumerate(statements):
+            if is_docstring(statement):
+                continue
+            result.append(statement)
+            if isinstance(statement, (ast.Return, ast.Raise, ast.Break, ast.Continue)):
+                if yields(statements[index + 1:]):
+                    result.append(generator_marker())
+                break
+        return result
+
+    def visit_If(self, node):
+        self.generic_visit(node)
+        if isinstance(node.test, ast.Constant):
+            branch, removed = (node.body, node.orelse) if node.test.value else (node.orelse, node.body)
+            statements = [statement for statement in branch if not isinstance(statement, ast.Pass)]
+            if yields(removed):
+                statements.append(generator_marker())
+            return statements or None
+        return node
+
+    def visit_While(self, node):
+        self.generic_visit(node)
+        if isinstance(node.test, ast.Constant) and not node.test.value:
+            if yields(node.body):
+                return node.orelse + [generator_marker()]
+            return node.orelse or None
+        return node
+
+
+def fill_blocks(tree):
+    """Puts a pass into the blocks which became empty."""
+    for node in ast.walk(tree):
+        if isinstance(getattr(node, "body", None), list) and not node.body:
+            node.body = [ast.Pass()]
+        # a try needs a handler or a finally block, even if it only had a docstring left
+        if isinstance(node, ast.Try) and not node.handlers and not node.finalbody:
+            node.finalbody = [ast.Pass()]
+    return tree
+
+
+class ImportRemover(ast.NodeTransformer):
+    def __init__(self, used):
+        self.used = used
+
+    def visit_Import(self, node):
+        return self.remove_unused(node, [alias for alias in node.names
+                                         if (alias.asname or alias.name).split(".")[0] in self.used],
+                                  [alias.name for alias in node.names])
+
+    def visit_ImportFrom(self, node):
+        if any(alias.name == "*" for alias in node.names):
+            return node
+        module = "." * node.level + (node.module or "")
+        return self.remove_unused(node, [alias for alias in node.names if (alias.asname or alias.name) in self.used],
+                                  [module])
+
+    def remove_unused(self, node, names, modules):
+        if not names:
+            if all(module in PURE_MODULES for module in modules):
+                return None
+            # the import may be needed for its side effects
+            names = node.names[:1]
+        node.names = names
+        return node
+
+
+class ConstantFolder(ast.NodeTransformer):
+    def __init__(self, constants, math_names):
+        self.constants = constants
+        self.math_names = math_names
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.constants:
+            return ast.copy_location(ast.Constant(self.constants[node.id]), node)
+        return node
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        if isinstance(node.ctx, ast.Load) and isinstance(node.value, ast.Name) and \
+                node.value.id in self.math_names and node.attr in MATH_CONSTANTS:
+            return ast.copy_location(ast.Constant(MATH_CONSTANTS[node.attr]), node)
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if is_number(node.left) and is_number(node.right) and type(node.op) in OPERATORS:
+            return self.fold(node, OPERATORS[type(node.op)], node.left.value, node.right.value)
+        return node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if is_number(node.operand) and type(node.op) in OPERATORS:
+            return self.fold(node, OPERATORS[type(node.op)], node.operand.value)
+        return node
+
+    def fold(self, node, function, *values):
+        if too_large(function, *values):
+            return node
+        try:
+            value = function(*values)
+        except (ArithmeticError, ValueError):
+            return node
+        # keep huge numbers (e.g. 2 ** 1000) as expression
+        if isinstance(value, int) and abs(value) > 2 ** 30 or not isinstance(value, (int, float)):
+            return node
+        return ast.copy_location(ast.Constant(value), node)
+
+
+def fold_constants(tree):
+    """Replaces module level names bound once to a number, math constants and arithmetic on them by their values."""
+    stored = stored_names(tree)
+    math_names = {alias.asname or alias.name for node in tree.body if isinstance(node, ast.Import)
+                  for alias in node.names if alias.name == "math" and stored[alias.asname or alias.name] == 1}
+    constants = {}
+    folder = ConstantFolder(constants, math_names)
+    for statement in tree.body:
+        folder.visit(statement)
+        if isinstance(statement, ast.Assign) and len(statement.targets) == 1 and \
+                isinstance(statement.targets[0], ast.Name) and stored[statement.targets[0].id] == 1:
+            if is_number(statement.value):
+                constants[statement.targets[0].id] = statement.value.value
+    # the folded names are only removed if nothing reads them any more
+    folder.visit(tree)
+    used = used_names(tree)
+    tree.body = [statement for statement in tree.body
+                 if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1 and
+                         isinstance(statement.targets[0], ast.Name) and statement.targets[0].id in constants and
+                         statement.targets[0].id not in used)]
+    return tree
+
+
+def short_names(taken):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    length = 1
+    while True:
+        for n in range(len(letters) ** length):
+            name = ""
+            for _ in range(length):
+                n, i = divmod(n, len(letters))
+                name += letters[i]
+            if name not in taken and not keyword.iskeyword(name):
+                yield name
+        length += 1
+
+
+class LocalRenamer(ast.NodeTransformer):
+    def __init__(self, taken):
+        self.names = short_names(taken)
+
+    def visit_FunctionDef(self, node):
+        self.generic_visit(node)
+        nested = [child for child in ast.walk(node) if child is not node and
+                  isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef))]
+        declared = {name for child in ast.walk(node) if isinstance(child, (ast.Global, ast.Nonlocal))
+                    for name in child.names}
+        if nested or declared:
+            return node
+        # defaults and decorators are evaluated outside of the function
+        body = [child for statement in node.body for child in ast.walk(statement)]
+        arguments = {arg.arg for arg in ast.walk(node.args) if isinstance(arg, ast.arg)}
+        imported = {(alias.asname or alias.name).split(".")[0] for child in body if isinstance(child, ast.alias)}
+        comprehensions = {id(child) for comprehension in body
+                          if isinstance(comprehension, (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp))
+                          for child in ast.walk(comprehension)}
+        local = {child.id for child in body if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store) and
+                 id(child) not in comprehensions}
+        local |= {child.name for child in body if isinstance(child, ast.ExceptHandler) and child.name}
+        mapping = {name: next(self.names) for name in sorted(local - arguments - imported) if len(name) > 1}
+        for child in body:
+            if isinstance(child, ast.Name) and child.id in mapping:
+                child.id = mapping[child.id]
+            elif isinstance(child, ast.ExceptHandler) and child.name in mapping:
+                child.name = mapping[child.name]
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+
+def shrink(source, fold=False, rename=False):
+    """Returns the shrunk source. Names are only changed if the program does not access them dynamically."""
+    tree = ast.parse(source)
+    dynamic = bool(used_names(tree) & DYNAMIC)
+    tree = DeadCodeRemover().visit(tree)
+    if fold and not dynamic:
+        tree = fold_constants(tree)
+    if not dynamic:
+        tree = ImportRemover(used_names(tree)).visit(tree)
+    if rename and not dynamic:
+        taken = set(stored_names(tree)) | used_names(tree) | set(dir(builtins))
+        tree = LocalRenamer(taken).visit(tree)
+    return ast.unparse(ast.fix_missing_locations(fill_blocks(tree))) + "\n"
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+
+import emulate
+import shrink
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "programs")
+
+PROGRAM = '''
+"""module docstring"""
+from mindstorms import MSHub, Motor, ColorSensor  # unused ColorSensor
+from mindstorms.operator import greater_than, equal_to
+import math
+import mylib
+
+RADIUS = 2.8
+speed = 10
+
+
+def circumference(factor=RADIUS):
+    """docstring"""
+    result = RADIUS * 2 * math.pi * factor
+    return result
+    print("never")
+
+
+def describe(value):
+    try:
+        text = str(value)
+    except ValueError as error:
+        text = repr(error)
+    return [text for character in text]
+
+
+if False:
+    print("debug")
+speed += 1
+print(circumference(), describe(speed), greater_than(1, 0))
+'''
+
+
+def run(source):
+    output = []
+    exec(compile(source, "<program>", "exec"), {"print": lambda *args: output.append(args), "__name__": "__main__"})
+    return output
+
+
+class ShrinkTestCase(unittest.TestCase):
+    def test_basic(self):
+        source = PROGRAM.replace("import mylib\n", "")
+        shrunk = shrink.shrink(source)
+        self.assertNotIn("docstring", shrunk)
+        self.assertNotIn("never", shrunk)
+        self.assertNotIn("debug", shrunk)
+        self.assertNotIn("ColorSensor", shrunk)
+        self.assertNotIn("equal_to", shrunk)
+        self.assertIn("from mindstorms.operator import greater_than\n", shrunk)
+        self.assertIn("RADIUS = 2.8", shrunk)
+
+    def test_fold_and_rename(self):
+        source = PROGRAM.replace("from mindstorms import MSHub, Motor, ColorSensor  # unused ColorSensor\n", "") \
+            .replace("from mindstorms.operator import greater_than, equal_to\n", "greater_than = max\n") \
+            .replace("import mylib\n", "")
+        shrunk = shrink.shrink(source, fold=True, rename=True)
+        self.assertNotIn("RADIUS", shrunk)
+        self.assertNotIn("import math", shrunk)
+        self.assertIn(repr(2.8 * 2 * 3.141592653589793), shrunk)
+        # speed is changed later, the parameter keeps its name
+        self.assertIn("speed = 10", shrunk)
+        self.assertIn("factor", shrunk)
+        self.assertNotIn("result", shrunk)
+        self.assertNotIn("error", shrunk)
+        self.assertEqual(run(source), run(shrunk))
+
+    def test_side_effects(self):
+        shrunk = shrink.shrink("import mylib, math\nfrom other import a, b\n")
+        self.assertEqual("import mylib\nfrom other import a\n", shrunk)
+
+    def test_dynamic(self):
+        source = "import math\nradius = 2\n\ndef f():\n    value = 1\n    return eval('value')\n"
+        shrunk = shrink.shrink(source, fold=True, rename=True)
+        self.assertIn("import math", shrunk)
+        self.assertIn("value", shrunk)
+
+    def test_empty_blocks(self):
+        shrunk = shrink.shrink("try:\n    import math\nexcept ImportError:\n    pass\n\ndef f():\n    '''doc'''\n")
+        compile(shrunk, "<shrunk>", "exec")
+        for source in ("try:\n    x = 1\nfinally:\n    'doc'\n",
+                       "try:\n    'doc'\nfinally:\n    'doc'\n",
+                       "try:\n    x = 1\nexcept ValueError:\n    'doc'\nelse:\n    'doc'\nfinally:\n    'doc'\n",
+                       "for x in y:\n    'doc'\nelse:\n    'doc'\n",
+                       "while x:\n    break\n    x = 1\nelse:\n    'doc'\n",
+                       "if x:\n    'doc'\nelse:\n    'doc'\n",
+                       "with x:\n    'doc'\n"):
+            compile(shrink.shrink(source), "<shrunk>", "exec")
+
+    def test_dead_yield(self):
+        for source in ("def g():\n    return\n    yield\n",
+                       "def g():\n    if False:\n        yield 1\n",
+                       "def g():\n    while 0:\n        yield from x\n",
+                       "def g():\n    return\n    if x:\n        yield\n"):
+            namespace = {}
+            exec(shrink.shrink(source), namespace)
+            self.assertEqual([], list(namespace["g"]()), source)
+        self.assertNotIn("yield", shrink.shrink("def f():\n    return 1\n    def g():\n        yield\n"))
+
+    def test_huge_numbers_are_not_folded(self):
+        self.assertEqual("x = 10 ** 100000000\ny = 7 * 1000000000\nprint(1024)\n",
+                         shrink.shrink("x = 10 ** 10 ** 8\ny = 7 * 10 ** 9\nz = 2 ** 10\nprint(z)\n", fold=True))
+
+    def test_programs_draw_the_same(self):
+        for name in ("house.py", "drive.py", "crazy.py"):
+            path = os.path.join(PROGRAMS, name)
+            with open(path) as file:
+                source = file.read()
+            shrunk = shrink.shrink(source, fold=True, rename=True)
+            self.assertLess(len(shrunk), len(source) * 0.8)
+            with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as file:
+                file.write(shrunk)
+            self.addCleanup(os.unlink, file.name)
+            original, result = emulate.run(path, seed=1), emulate.run(file.name, seed=1)
+            self.assertIsNone(result["error"])
+            self.assertEqual(len(original["strokes"]), len(result["strokes"]))
+            for stroke, other in zip(original["strokes"], result["strokes"]):
+                for point, other_point in zip(stroke, other):
+                    self.assertAlmostEqual(point[0], other_point[0], places=2)
+                    self.assertAlmostEqual(point[1], other_point[1], places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
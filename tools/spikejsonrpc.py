@@ -8,26 +8,68 @@
 
 import socket
 import base64
-import os
 # import sys
 import argparse
-from tqdm import tqdm
 import time
 import json
 import random
+import re
 import string
 import logging
+import threading
+from collections import OrderedDict, deque
 from datetime import datetime
 
 letters = string.ascii_letters + string.digits + '_'
 def random_id(len = 4):
   return ''.join(random.choice(letters) for _ in range(4))
 
+def parse_address(address):
+  """Returns (host, port) of a gateway endpoint like localhost:8888, :8889 or [::1]:8888, a device path like
+  /dev/ttyACM0 or COM3 as is. Raises ValueError for anything else."""
+  if address.startswith('/') or re.fullmatch(r'COM\d+', address, re.IGNORECASE):
+    return address
+  host, colon, port = address.rpartition(':')
+  if not colon or not port.isdigit() or int(port) > 65535:
+    raise ValueError("'%s' is no host:port or device path" % address)
+  if host.startswith('[') and host.endswith(']'):
+    host = host[1:-1]
+  return (host or 'localhost', int(port))
+
+class SerialConnection:
+  """Talks to a hub connected by USB directly, with the part of the socket interface used by RPC."""
+  def __init__(self, path):
+    import serial
+    self.port = serial.Serial(path)
+
+  def settimeout(self, timeout):
+    self.port.timeout = timeout
+
+  def recv(self, size):
+    data = self.port.read(size)
+    if not data:
+      if self.port.timeout == 0:
+        raise BlockingIOError()
+      raise socket.timeout()
+    return data
+
+  def send(self, data):
+    return self.port.write(data)
+
+  def close(self):
+    self.port.close()
+
 class RPC:
-  def __init__(self):
-    self.socket = socket.create_connection(('localhost', 8888))
+  def __init__(self, address = ('localhost', 8888)):
+    if isinstance(address, str):
+      self.socket = SerialConnection(address)
+    else:
+      self.socket = socket.create_connection(address)
     self.recv_buf = bytearray()
 
+  def close(self):
+    self.socket.close()
+
   def recv_message(self, timeout = 100):
     self.socket.settimeout(timeout)
     while True:
@@ -49,7 +91,7 @@ class RPC:
         self.recv_buf += data
     return None
 
-  def send_message(self, name, params = {}):
+  def send_message(self, name, params = {}, timeout = 100):
     while True:
       if not self.recv_message(timeout=0):
         break
@@ -59,11 +101,15 @@ class RPC:
     logging.debug('sending: %s' % msg_string)
     self.socket.send(msg_string.encode('utf-8'))
     self.socket.send(b'\r')
-    return self.recv_response(id)
+    return self.recv_response(id, timeout)
 
-  def recv_response(self, id):
+  def recv_response(self, id, timeout = 100):
+    deadline = time.monotonic() + timeout
     while True:
-      m = self.recv_message()
+      remaining = deadline - time.monotonic()
+      m = self.recv_message(remaining) if remaining > 0 else None
+      if m is None:
+        raise TimeoutError('no response to %s within %ss' % (id, timeout))
       if 'i' in m and m['i'] == id:
         logging.debug('response: %s' % m)
         if 'e' in m:
@@ -89,6 +135,17 @@ class RPC:
   def write_package(self, data, transferid):
     return self.send_message('write_package', {'data': str(base64.b64encode(data), 'utf-8'), 'transferid': transferid})
 
+  def upload_program(self, data, name, slot, progress = None):
+    now = int(time.time() * 1000)
+    start = self.start_write_program(name, len(data), slot, now, now)
+    bs = start['blocksize']
+    id = start['transferid']
+    for offset in range(0, len(data), bs):
+      b = data[offset:offset + bs]
+      self.write_package(b, id)
+      if progress:
+        progress(len(b))
+
   def move_project(self, from_slot, to_slot):
     return self.send_message('move_project', {'old_slotid': from_slot, 'new_slotid': to_slot})
 
@@ -117,68 +174,301 @@ class RPC:
 #  def get_time(self):
 #    return self.send_message('get_hub_info'), trigger_current_sttae
 
+# Motor Methods
+  def motor_start(self, port, speed, stall = True):
+    return self.send_message('scratch.motor_start', {'port': port, 'speed': speed, 'stall': stall})
+
+  def motor_stop(self, port, stop = 1):
+    return self.send_message('scratch.motor_stop', {'port': port, 'stop': stop})
+
+  def move_start_speeds(self, lspeed, rspeed, lmotor = 'B', rmotor = 'A'):
+    return self.send_message('scratch.move_start_speeds', {'lspeed': lspeed, 'rspeed': rspeed, 'lmotor': lmotor, 'rmotor': rmotor})
+
+  def move_stop(self, lmotor = 'B', rmotor = 'A', stop = 1):
+    return self.send_message('scratch.move_stop', {'lmotor': lmotor, 'rmotor': rmotor, 'stop': stop})
+
+# Sound Methods
+  def sound_beep(self, note = 60, volume = 100):
+    return self.send_message('scratch.sound_beep', {'note': note, 'volume': volume})
+
+  def sound_off(self):
+    return self.send_message('scratch.sound_off')
+
 # Hub Methods
   def get_firmware_info(self):
     return self.send_message('get_hub_info')
 
+  def remote_control(self, rate = 20, timeout = None):
+    return RemoteControl(self, rate, timeout)
+
+
+class RemoteControl:
+  """Sends control commands in the background, at most rate commands per second. Each actuator (motor port, motor
+  pair, display, speaker) has at most one pending command, newer input replaces it, so the hub never acts on stale
+  input when the link is slow. A command without response after timeout seconds (default one interval) is dropped,
+  a late response is discarded with the next command. The RPC must not be used by others while the remote control
+  is open."""
+
+  def __init__(self, rpc, rate = 20, timeout = None, clock = time.monotonic):
+    self.rpc = rpc
+    self.interval = 1 / rate
+    self.timeout = self.interval if timeout is None else timeout
+    self.clock = clock
+    self.pending = OrderedDict()  # actuator -> (method, params, submitted)
+    self.condition = threading.Condition()
+    self.running = True
+    self.sent = 0
+    self.replaced = 0
+    self.errors = 0
+    self.timeouts = 0
+    self.latencies = deque(maxlen=1000)
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def submit(self, actuator, name, params = None):
+    if params is None:
+      params = {}
+    with self.condition:
+      if not self.running:
+        raise ValueError('remote control is closed')
+      if actuator in self.pending:
+        self.replaced += 1
+      # a replaced command keeps its place in the queue, so one busy actuator cannot starve the others
+      self.pending[actuator] = (name, params, self.clock())
+      self.condition.notify()
+
+  def run(self):
+    next_send = 0
+    while True:
+      with self.condition:
+        while True:
+          if not self.pending:
+            if not self.running:
+              return
+            self.condition.wait()
+            continue
+          delay = next_send - self.clock()
+          if delay <= 0:
+            break
+          self.condition.wait(delay)
+        actuator, (name, params, submitted) = self.pending.popitem(last=False)
+      next_send = self.clock() + self.interval
+      try:
+        self.rpc.send_message(name, params, timeout=self.timeout)
+      except TimeoutError:
+        # dropped, it is stale by now and newer input is sent instead of waiting longer for its response
+        self.timeouts += 1
+      except Exception as e:
+        # e.g. the link is lost, the following commands may get through again
+        self.errors += 1
+        logging.warning('%s failed: %r' % (name, e))
+      else:
+        self.latencies.append(self.clock() - submitted)
+      self.sent += 1
+
+  def close(self, flush = True):
+    """Stops the remote control after sending the pending commands, or dropping them if flush is False."""
+    with self.condition:
+      self.running = False
+      if not flush:
+        self.pending.clear()
+      self.condition.notify()
+    self.thread.join()
+
+  def stats(self):
+    """Returns the number of sent, replaced, failed and timed out commands and the end-to-end latency (mean, 95th
+    percentile and max in seconds) from the newest input to the hub's response."""
+    latencies = sorted(self.latencies)
+    result = {'sent': self.sent, 'replaced': self.replaced, 'errors': self.errors, 'timeouts': self.timeouts}
+    if latencies:
+      result.update({'mean': sum(latencies) / len(latencies), 'p95': latencies[int(0.95 * (len(latencies) - 1))],
+                     'max': latencies[-1]})
+    return result
+
+  def motor_start(self, port, speed):
+    self.submit(port, 'scratch.motor_start', {'port': port, 'speed': speed, 'stall': True})
+
+  def motor_stop(self, port):
+    self.submit(port, 'scratch.motor_stop', {'port': port, 'stop': 1})
+
+  def move(self, lspeed, rspeed, lmotor = 'B', rmotor = 'A'):
+    self.submit(lmotor + rmotor, 'scratch.move_start_speeds', {'lspeed': lspeed, 'rspeed': rspeed, 'lmotor': lmotor, 'rmotor': rmotor})
+
+  def move_stop(self, lmotor = 'B', rmotor = 'A'):
+    self.submit(lmotor + rmotor, 'scratch.move_stop', {'lmotor': lmotor, 'rmotor': rmotor, 'stop': 1})
+
+  def display_image(self, image):
+    self.submit('display', 'scratch.display_image', {'image': image})
+
+  def display_clear(self):
+    self.submit('display', 'scratch.display_clear')
+
+  def sound_beep(self, note = 60, volume = 100):
+    self.submit('speaker', 'scratch.sound_beep', {'note': note, 'volume': volume})
+
+  def sound_off(self):
+    self.submit('speaker', 'scratch.sound_off')
+
+
+def list_slots(info):
+  """Formats the storage information as table."""
+  storage = info['storage']
+  slots = info['slots']
+  lines = ["%4s %-40s %6s %-20s %-12s %-10s" % ("Slot", "Decoded Name", "Size",  "Last Modified", "Project_id", "Type")]
+  for i in range(20):
+    if str(i) in slots:
+      sl = slots[str(i)]
+      modified = datetime.utcfromtimestamp(sl['modified']/1000).strftime('%Y-%m-%d %H:%M:%S')
+      try:
+        decoded_name = base64.b64decode(sl['name']).decode('utf-8')
+      except:
+        decoded_name = sl['name']
+      try:
+        project = sl['project_id']
+      except:
+        project = " "
+      try:
+        type = sl['type']
+      except:
+        type = " "
+      # print("%2s %-40s %-40s %5db %6s %-20s %-20s %-10s" % (i, sl['name'], decoded_name, sl['size'], sl['id'], modified, project, type))
+      lines.append("%4s %-40s %5db %-20s %-12s %-10s" % (i, decoded_name, sl['size'], modified, project, type))
+  lines.append("Storage free %s%s of total %s%s" % (storage['free'], storage['unit'], storage['total'], storage['unit']))
+  return lines
+
+
+def read_inventory(path):
+  """Reads a hub inventory, one hub per line: [name] address, where address is a gateway endpoint (host:port) or a
+  device path. Returns a list of (name, address) tuples, raises ValueError with the line number of a bad line."""
+  hubs = []
+  with open(path) as f:
+    for number, line in enumerate(f, 1):
+      fields = line.split('#', 1)[0].split()
+      if not fields:
+        continue
+      address = fields[-1]
+      name = fields[0] if len(fields) > 1 else address
+      try:
+        hubs.append((name, parse_address(address)))
+      except ValueError as e:
+        raise ValueError('%s:%d: %s' % (path, number, e))
+  return hubs
+
+
+def run_fleet(hubs, command, jobs = 8):
+  """Runs command(rpc) for all hubs with at most jobs hubs at a time. Yields (name, error, seconds, result) as the
+  hubs finish, error is None if the command succeeded."""
+  from concurrent.futures import ThreadPoolExecutor, as_completed
+
+  def run(name, address):
+    started = time.monotonic()
+    try:
+      rpc = RPC(address)
+      try:
+        return name, None, time.monotonic() - started, command(rpc)
+      finally:
+        rpc.close()
+    except Exception as e:
+      return name, '%s: %s' % (type(e).__name__, e), time.monotonic() - started, None
+
+  with ThreadPoolExecutor(max_workers=jobs) as executor:
+    futures = [executor.submit(run, name, address) for name, address in hubs]
+    for future in as_completed(futures):
+      yield future.result()
+
 
 if __name__ == "__main__":
   def handle_list():
-    info = rpc.get_storage_information()
-    storage = info['storage']
-    slots = info['slots']
-    print("%4s %-40s %6s %-20s %-12s %-10s" % ("Slot", "Decoded Name", "Size",  "Last Modified", "Project_id", "Type"))
-    for i in range(20):
-      if str(i) in slots:
-        sl = slots[str(i)]
-        modified = datetime.utcfromtimestamp(sl['modified']/1000).strftime('%Y-%m-%d %H:%M:%S')
-        try:
-          decoded_name = base64.b64decode(sl['name']).decode('utf-8')
-        except:
-          decoded_name = sl['name']
-        try:
-          project = sl['project_id']
-        except:
-          project = " "
-        try:
-          type = sl['type']
-        except:
-          type = " "
-        # print("%2s %-40s %-40s %5db %6s %-20s %-20s %-10s" % (i, sl['name'], decoded_name, sl['size'], sl['id'], modified, project, type))
-        print("%4s %-40s %5db %-20s %-12s %-10s" % (i, decoded_name, sl['size'], modified, project, type))
-    print(("Storage free %s%s of total %s%s" % (storage['free'], storage['unit'], storage['total'], storage['unit'])))
+    for line in list_slots(rpc.get_storage_information()):
+      print(line)
   def handle_fwinfo():
     info = rpc.get_firmware_info()
     fw = '.'.join(str(x) for x in info['version'])
     rt = '.'.join(str(x) for x in info['runtime'])
     print("Firmware version: %s; Runtime version: %s" % (fw, rt))
-  def handle_upload():
+  def read_program():
     with open(args.file, "rb") as f:
-      size = os.path.getsize(args.file)
-      name = args.name if args.name else args.file
-      now = int(time.time() * 1000)
-      start = rpc.start_write_program(name, size, args.to_slot, now, now)
-      bs = start['blocksize']
-      id = start['transferid']
-      with tqdm(total=size, unit='B', unit_scale=True) as pbar:
-        b = f.read(bs)
-        while b:
-          rpc.write_package(b, id)
-          pbar.update(len(b))
-          b = f.read(bs)
+      data = f.read()
+    if args.profile:
+      import hubprofile
+      data = hubprofile.instrument(data.decode('utf-8')).encode('utf-8')
+    if args.shrink or args.fold or args.rename:
+      import shrink
+      size = len(data)
+      data = shrink.shrink(data.decode('utf-8'), args.fold, args.rename).encode('utf-8')
+      print("Shrunk from %d to %d bytes (%d%% saved)" % (size, len(data), 100 * (size - len(data)) // size if size else 0))
+    return data
+  def handle_upload():
+    # imported here to keep short commands like `ls` fast
+    from tqdm import tqdm
+    data = read_program()
+    name = args.name if args.name else args.file
+    with tqdm(total=len(data), unit='B', unit_scale=True) as pbar:
+      rpc.upload_program(data, name, args.to_slot, pbar.update)
+    if args.start:
+      rpc.program_execute(args.to_slot)
+  def fleet_upload():
+    data = read_program()
+    name = args.name if args.name else args.file
+    def upload(rpc):
+      rpc.upload_program(data, name, args.to_slot)
       if args.start:
         rpc.program_execute(args.to_slot)
+      return "%d bytes to slot %d%s" % (len(data), args.to_slot, ", started" if args.start else "")
+    return upload
+  def handle_fleet():
+    if not hasattr(args, 'fleet'):
+      parser.error("--fleet supports the commands ls, upload, start and stop")
+    try:
+      hubs = read_inventory(args.inventory)
+    except ValueError as e:
+      parser.error(str(e))
+    started = time.monotonic()
+    failed = 0
+    for name, error, seconds, result in run_fleet(hubs, args.fleet(), args.jobs):
+      if error:
+        failed += 1
+      lines = [error] if error else result if isinstance(result, list) else [result or "ok"]
+      print("%-20s %-6s %6.2fs %s" % (name, "FAILED" if error else "ok", seconds, lines[0]))
+      for line in lines[1:]:
+        print("%36s%s" % ("", line))
+    print("%d hubs in %.2fs, %d failed" % (len(hubs), time.monotonic() - started, failed))
+    if failed:
+      raise SystemExit(1)
+  def handle_animate():
+    import framebuffer
+    with open(args.file) as f:
+      frames = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    display = framebuffer.Framebuffer(rpc)
+    for _ in range(args.repeat):
+      shown, dropped = display.play(frames, args.fps)
+      print("%d frames shown, %d dropped, %d calls" % (shown, dropped, display.calls))
+  def handle_latency():
+    state = rpc.send_message('gateway.clock')
+    def ms(value):
+      return "-" if value is None else "%.1fms" % (value * 1000)
+    print("Hub clock: %s, drift %.1fppm" % ("synchronized" if state['synced'] else "not running", state['drift_ppm']))
+    print("Latency: %s, jitter %s" % (ms(state['latency']), ms(state['jitter'])))
+    print("Round trip: min %s, mean %s, jitter %s" % (ms(state['rtt_min']), ms(state['rtt_mean']), ms(state['rtt_jitter'])))
   def handle_get_time():
     result = rpc.get_time()
 
   parser = argparse.ArgumentParser(description='Tools for Spike Hub RPC protocol')
   parser.add_argument('-t', '--tty', help='Spike Hub device path', default='/dev/ttyACM0')
   parser.add_argument('--debug', help='Enable debug', action='store_true')
+  parser.add_argument('--fleet', help='Run the command on all hubs of an inventory file, one "[name] host:port" or "[name] device" per line', metavar='inventory', dest='inventory')
+  parser.add_argument('--jobs', '-j', help='Hubs at a time in fleet mode (default: 8)', type=int, default=8)
   parser.set_defaults(func=lambda: parser.print_help())
   sub_parsers = parser.add_subparsers()
 
   list_parser = sub_parsers.add_parser('list', aliases=['ls'], help='List stored programs')
-  list_parser.set_defaults(func=handle_list)
+  list_parser.set_defaults(func=handle_list, fleet=lambda: lambda rpc: list_slots(rpc.get_storage_information()))
 
   fwinfo_parser = sub_parsers.add_parser('fwinfo', help='Show firmware version')
   fwinfo_parser.set_defaults(func=handle_fwinfo)
@@ -186,6 +476,9 @@ if __name__ == "__main__":
   get_time_parser = sub_parsers.add_parser('time', help='Get time')
   get_time_parser.set_defaults(func=handle_get_time)
 
+  latency_parser = sub_parsers.add_parser('latency', help='Show the link latency and hub clock estimated by the gateway')
+  latency_parser.set_defaults(func=handle_latency)
+
   mvprogram_parser = sub_parsers.add_parser('mv', help='Changes program slot')
   mvprogram_parser.add_argument('from_slot', type=int)
   mvprogram_parser.add_argument('to_slot', type=int)
@@ -196,7 +489,11 @@ if __name__ == "__main__":
   cpprogram_parser.add_argument('to_slot', type=int)
   cpprogram_parser.add_argument('name', nargs='?')
   cpprogram_parser.add_argument('--start', '-s', help='Start after upload', action='store_true')
-  cpprogram_parser.set_defaults(func=handle_upload)
+  cpprogram_parser.add_argument('--profile', '-p', help='Instrument functions and loops marked with "# profile"', action='store_true')
+  cpprogram_parser.add_argument('--shrink', help='Remove comments, docstrings, unused imports and dead code', action='store_true')
+  cpprogram_parser.add_argument('--fold', help='Shrink and fold constants', action='store_true')
+  cpprogram_parser.add_argument('--rename', help='Shrink and shorten local names', action='store_true')
+  cpprogram_parser.set_defaults(func=handle_upload, fleet=fleet_upload)
 
   rmprogram_parser = sub_parsers.add_parser('rm', help='Removes the program at a given slot')
   rmprogram_parser.add_argument('from_slot', type=int)
@@ -204,10 +501,10 @@ if __name__ == "__main__":
 
   startprogram_parser = sub_parsers.add_parser('start', help='Starts a program')
   startprogram_parser.add_argument('slot', type=int)
-  startprogram_parser.set_defaults(func=lambda: rpc.program_execute(args.slot))
+  startprogram_parser.set_defaults(func=lambda: rpc.program_execute(args.slot), fleet=lambda: lambda rpc: rpc.program_execute(args.slot))
 
   stopprogram_parser = sub_parsers.add_parser('stop', help='Stop program execution')
-  stopprogram_parser.set_defaults(func=lambda: rpc.program_terminate())
+  stopprogram_parser.set_defaults(func=lambda: rpc.program_terminate(), fleet=lambda: lambda rpc: rpc.program_terminate())
 
   display_parser = sub_parsers.add_parser('display', help='Controls 5x5 LED matrix display')
   display_parser.set_defaults(func=lambda: display_parser.print_help())
@@ -230,8 +527,17 @@ if __name__ == "__main__":
   display_pixel_parser.add_argument('brightness', nargs='?', type=int, default=9, help='pixel brightness 0-9')
   display_pixel_parser.set_defaults(func=lambda: rpc.display_set_pixel(args.x, args.y, args.brightness))
 
+  display_animate_parser = display_parsers.add_parser('animate', help='Plays an animation on the LED matrix')
+  display_animate_parser.add_argument('file', help='file with one image per line')
+  display_animate_parser.add_argument('--fps', type=float, default=10, help='frames per second (default: 10)')
+  display_animate_parser.add_argument('--repeat', '-r', type=int, default=1, help='number of repetitions')
+  display_animate_parser.set_defaults(func=handle_animate)
+
   args = parser.parse_args()
   if args.debug:
     logging.basicConfig(level=logging.DEBUG)
-  rpc = RPC()
-  args.func()
+  if args.inventory:
+    handle_fleet()
+  else:
+    rpc = RPC()
+    args.func()
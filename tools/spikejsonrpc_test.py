@@ -0,0 +1,182 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+import spikejsonrpc
+from fakegateway import FakeGateway
+
+
+class FakeRPC:
+    """Records the messages, each response is held back until release() is called."""
+
+    def __init__(self):
+        self.messages = []
+        self.received = threading.Semaphore(0)
+        self.responses = threading.Semaphore(0)
+
+    def send_message(self, name, params={}, timeout=100):
+        self.messages.append((name, params))
+        self.received.release()
+        self.responses.acquire()
+        return None
+
+    def release(self, n=1):
+        for _ in range(n):
+            self.responses.release()
+
+
+class FakeClock:
+    """Advances by a small step on every call, so pacing does not depend on the load of the machine."""
+
+    def __init__(self, step=0.02):
+        self.t = 0.0
+        self.step = step
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.t += self.step
+            return self.t
+
+
+class RemoteControlTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rpc = FakeRPC()
+        self.remote = spikejsonrpc.RemoteControl(self.rpc, rate=1000)
+
+    def tearDown(self):
+        self.rpc.release(100)
+        self.remote.close(flush=False)
+
+    def test_latest_wins(self):
+        self.remote.motor_start('C', 10)
+        self.rpc.received.acquire()
+        # the link is stuck, newer input replaces the pending commands
+        for speed in range(20, 100, 10):
+            self.remote.move(-speed, speed)
+        self.remote.motor_start('C', 50)
+        self.remote.move_stop()
+        self.remote.display_image('99999:00000:00000:00000:00000')
+        self.rpc.release(4)
+        self.remote.close()
+        self.assertEqual([
+            ('scratch.motor_start', {'port': 'C', 'speed': 10, 'stall': True}),
+            ('scratch.move_stop', {'lmotor': 'B', 'rmotor': 'A', 'stop': 1}),
+            ('scratch.motor_start', {'port': 'C', 'speed': 50, 'stall': True}),
+            ('scratch.display_image', {'image': '99999:00000:00000:00000:00000'}),
+        ], self.rpc.messages)
+        stats = self.remote.stats()
+        self.assertEqual(4, stats['sent'])
+        self.assertEqual(8, stats['replaced'])
+        self.assertLessEqual(stats['mean'], stats['max'])
+
+    def test_rate(self):
+        clock = FakeClock()
+        times = []
+        self.rpc.send_message = lambda name, params={}, timeout=100: times.append(clock.t)
+        remote = spikejsonrpc.RemoteControl(self.rpc, rate=20, clock=clock)
+        for port in 'ABC':
+            remote.motor_stop(port)
+        remote.close()
+        self.assertEqual(3, len(times))
+        self.assertGreaterEqual(times[1] - times[0], 0.05)
+        self.assertGreaterEqual(times[2] - times[1], 0.05)
+        # two intervals between three commands
+        self.assertGreaterEqual(remote.stats()['max'], 0.1)
+
+    def test_error_keeps_sending(self):
+        messages = []
+
+        def send_message(name, params={}, timeout=100):
+            messages.append(name)
+            if len(messages) == 1:
+                raise ConnectionError({'message': 'unknown method', 'type': 'NameError'})
+
+        self.rpc.send_message = send_message
+        remote = spikejsonrpc.RemoteControl(self.rpc, rate=1000)
+        with self.assertLogs(level='WARNING'):
+            remote.motor_stop('A')
+            remote.sound_off()
+            remote.close()
+        self.assertEqual(['scratch.motor_stop', 'scratch.sound_off'], messages)
+        self.assertEqual(1, remote.stats()['errors'])
+
+    def test_timeout_drops_command(self):
+        timeouts = []
+
+        def send_message(name, params={}, timeout=100):
+            timeouts.append(timeout)
+            if len(timeouts) == 1:
+                raise TimeoutError()
+
+        self.rpc.send_message = send_message
+        remote = spikejsonrpc.RemoteControl(self.rpc, rate=50)
+        remote.motor_stop('A')
+        remote.sound_off()
+        remote.close()
+        self.assertEqual([0.02, 0.02], timeouts)
+        stats = remote.stats()
+        self.assertEqual((2, 1, 0), (stats['sent'], stats['timeouts'], stats['errors']))
+
+    def test_rpc_timeout(self):
+        with FakeGateway(0) as gateway:
+            rpc = spikejsonrpc.RPC(gateway.address)
+            self.addCleanup(rpc.close)
+            with unittest.mock.patch.object(rpc, 'recv_message', return_value=None):
+                self.assertRaises(TimeoutError, rpc.send_message, 'get_hub_info', timeout=0.01)
+            # the late response is discarded
+            self.assertEqual([1, 0, 6, 34], rpc.get_firmware_info()['version'])
+
+    def test_closed(self):
+        self.remote.close()
+        self.assertRaises(ValueError, self.remote.sound_beep)
+
+
+class FleetTestCase(unittest.TestCase):
+    def test_read_inventory(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('# our hubs\nred localhost:8888\n:8889  # second gateway\n\nblue /dev/ttyACM0\n')
+        self.addCleanup(os.unlink, f.name)
+        self.assertEqual([('red', ('localhost', 8888)), (':8889', ('localhost', 8889)), ('blue', '/dev/ttyACM0')],
+                         spikejsonrpc.read_inventory(f.name))
+
+    def test_parse_address(self):
+        self.assertEqual(('computer', 8888), spikejsonrpc.parse_address('computer:8888'))
+        self.assertEqual(('com-lab-3', 8888), spikejsonrpc.parse_address('com-lab-3:8888'))
+        self.assertEqual(('::1', 8888), spikejsonrpc.parse_address('[::1]:8888'))
+        self.assertEqual('COM3', spikejsonrpc.parse_address('COM3'))
+        for address in ('hub1', 'hub1:', 'hub1:http', 'localhost:99999'):
+            self.assertRaises(ValueError, spikejsonrpc.parse_address, address)
+
+    def test_bad_inventory_line(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('red localhost:8888\nblue hub1\n')
+        self.addCleanup(os.unlink, f.name)
+        with self.assertRaisesRegex(ValueError, r':2: .*hub1'):
+            spikejsonrpc.read_inventory(f.name)
+
+    def test_run_fleet(self):
+        hubs = []
+        for n in range(3):
+            gateway = FakeGateway(0)
+            self.addCleanup(gateway.close)
+            hubs.append(('hub%d' % n, gateway.address))
+        # nobody listens on this port
+        with socket.create_server(('localhost', 0)) as closed:
+            hubs.append(('gone', closed.getsockname()))
+
+        results = {name: (error, result) for name, error, seconds, result in
+                   spikejsonrpc.run_fleet(hubs, lambda rpc: spikejsonrpc.list_slots(rpc.get_storage_information()))}
+        self.assertEqual(4, len(results))
+        for n in range(3):
+            error, result = results['hub%d' % n]
+            self.assertIsNone(error)
+            self.assertEqual('Storage free 28372kb of total 31744kb', result[-1])
+        self.assertIn('ConnectionRefusedError', results['gone'][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
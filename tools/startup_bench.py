@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Measures the wall clock time of short command line invocations, e.g. `spikejsonrpc.py ls`, to make sure they
+# stay fast on small machines. A minimal fake gateway answers the RPC requests, so no hub is needed.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from fakegateway import FakeGateway
+
+COMMANDS = [
+    ['spikejsonrpc.py', '--help'],
+    ['spikejsonrpc.py', 'ls'],
+    ['spikejsonrpc.py', 'fwinfo'],
+    ['gateway.py', '--help'],
+]
+
+
+def measure(command, runs):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), command[0])
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, path] + command[1:], check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of the command line tools.")
+    parser.add_argument("-n", "--runs", help="runs per command (default: 10)", metavar="<n>", default=10, type=int)
+    parser.add_argument("-p", "--port", help="port of the fake gateway (default: 8888)", metavar="<port>",
+                        default=8888, type=int)
+    parser.add_argument("-b", "--budget", help="fail if the median of a command exceeds <seconds>",
+                        metavar="<seconds>", type=float)
+    args = parser.parse_args()
+
+    FakeGateway(args.port)
+
+    failed = False
+    print(f"{'command':32} {'min':>8} {'median':>8} {'max':>8}")
+    for command in COMMANDS:
+        timings = measure(command, args.runs)
+        median = statistics.median(timings)
+        print(f"{' '.join(command):32} {min(timings) * 1000:6.1f}ms {median * 1000:6.1f}ms {max(timings) * 1000:6.1f}ms")
+        if args.budget and median > args.budget:
+            failed = True
+    if failed:
+        print(f"median startup time exceeds budget of {args.budget * 1000:.0f}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Tiered on-disk archive for m=0 sensor notifications. Recent frames are kept raw with one column per channel,
+# older data only as 1s and 1min rollups (count, min, max, mean and last value per channel). Each tier has its own
+# retention, so the database stays bounded. Deleted pages are reused by SQLite instead of growing the file.
+
+import argparse
+import sqlite3
+import threading
+import time
+
+from channels import CHANNELS, sensor_channels
+
+TIERS = {"1s": 1, "1m": 60}
+
+
+class TelemetryReader:
+    def __init__(self, path, raw_retention=3600, retention_1s=86400, retention_1m=30 * 86400):
+        self.path = path
+        self.retention = {"raw": raw_retention, "1s": retention_1s, "1m": retention_1m}
+
+    def tier_for(self, start, now=None):
+        """Returns the finest tier whose retention still covers start."""
+        age = (now if now is not None else time.time()) - start
+        for tier in ("raw", "1s"):
+            if age <= self.retention[tier]:
+                return tier
+        return "1m"
+
+    def query(self, channel, start, end, tier=None):
+        """Returns (time, min, max, mean, last) rows of a channel between start and end (host time in seconds)."""
+        if channel not in CHANNELS:
+            raise KeyError(f"unknown channel '{channel}'")
+        tier = tier or self.tier_for(start)
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            if tier == "raw":
+                rows = db.execute(f'SELECT t, "{channel}" FROM raw WHERE t >= ? AND t < ? AND "{channel}" IS NOT NULL '
+                                  "ORDER BY t", (start, end))
+                return [(t, value, value, value, value) for t, value in rows]
+            if tier not in TIERS:
+                raise KeyError(f"unknown tier '{tier}'")
+            return db.execute(f"SELECT bucket, min, max, mean, last FROM rollup_{tier} "
+                              "WHERE channel = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                              (channel, int(start // TIERS[tier]) * TIERS[tier], end)).fetchall()
+        finally:
+            db.close()
+
+
+class TelemetryArchive(TelemetryReader):
+    def __init__(self, path, raw_retention=3600, retention_1s=86400, retention_1m=30 * 86400, interval=1.0):
+        print(f"Archiving telemetry to {path}")
+        super().__init__(path, raw_retention, retention_1s, retention_1m)
+        self.interval = interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        db = self.connect()
+        columns = ", ".join(f'"{channel}" REAL' for channel in CHANNELS)
+        db.execute(f"CREATE TABLE IF NOT EXISTS raw (t REAL NOT NULL, hub_time INTEGER, {columns})")
+        db.execute("CREATE INDEX IF NOT EXISTS raw_t ON raw (t)")
+        for tier in TIERS:
+            db.execute(f"CREATE TABLE IF NOT EXISTS rollup_{tier} (bucket INTEGER NOT NULL, channel TEXT NOT NULL, "
+                       "count INTEGER, min REAL, max REAL, mean REAL, last REAL, PRIMARY KEY (bucket, channel)) "
+                       "WITHOUT ROWID")
+        db.commit()
+        db.close()
+
+        self.thread = threading.Thread(target=self.run, name="TelemetryArchive", daemon=True)
+        self.thread.start()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def append(self, t, p):
+        """Queues a m=0 payload received at host time t, it is written by the background thread."""
+        with self.lock:
+            self.pending.append((t, p))
+
+    def run(self):
+        db = self.connect()
+        while not self.stopped.wait(self.interval):
+            self.flush(db)
+        self.flush(db)
+        db.close()
+
+    def flush(self, db, now=None):
+        with self.lock:
+            frames, self.pending = self.pending, []
+        if frames:
+            self.write(db, frames)
+        self.expire(db, now if now is not None else time.time())
+        db.commit()
+
+    def write(self, db, frames):
+        rows = []
+        rollups = {tier: {} for tier in TIERS}
+        for t, p in frames:
+            values = dict(sensor_channels(p))
+            rows.append([t, p[10]] + [values.get(channel) for channel in CHANNELS])
+            for tier, seconds in TIERS.items():
+                buckets = rollups[tier]
+                bucket = int(t // seconds) * seconds
+                for channel, value in values.items():
+                    if not isinstance(value, (int, float)):
+                        continue
+                    aggregate = buckets.get((bucket, channel))
+                    if aggregate is None:
+                        buckets[(bucket, channel)] = [1, value, value, value, value]
+                    else:
+                        aggregate[0] += 1
+                        aggregate[1] = min(aggregate[1], value)
+                        aggregate[2] = max(aggregate[2], value)
+                        aggregate[3] += value
+                        aggregate[4] = value
+
+        placeholders = ", ".join("?" * (len(CHANNELS) + 2))
+        db.executemany(f"INSERT INTO raw VALUES ({placeholders})", rows)
+        for tier, buckets in rollups.items():
+            # buckets may already contain data of an earlier flush, so they are merged
+            db.executemany(
+                f"INSERT INTO rollup_{tier} VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (bucket, channel) DO UPDATE SET "
+                "mean = (mean * count + excluded.mean * excluded.count) / (count + excluded.count), "
+                "count = count + excluded.count, min = min(min, excluded.min), max = max(max, excluded.max), "
+                "last = excluded.last",
+                [(bucket, channel, count, low, high, total / count, last)
+                 for (bucket, channel), (count, low, high, total, last) in buckets.items()])
+
+    def expire(self, db, now):
+        db.execute("DELETE FROM raw WHERE t < ?", (now - self.retention["raw"],))
+        for tier in TIERS:
+            db.execute(f"DELETE FROM rollup_{tier} WHERE bucket < ?", (now - self.retention[tier],))
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def start():
+    parser = argparse.ArgumentParser(description="Query a telemetry archive written by the gateway.")
+    parser.add_argument("archive", help="archive file", metavar="<path>")
+    parser.add_argument("channel", help="channel, e.g. A.2 or gyroscope.x", metavar="<channel>")
+    parser.add_argument("-s", "--since", help="seconds back from now (default: 600)", metavar="<seconds>",
+                        default=600, type=float)
+    parser.add_argument("-r", "--resolution", help="tier to query (default: finest available)",
+                        choices=["raw"] + list(TIERS))
+    args = parser.parse_args()
+
+    now = time.time()
+    rows = TelemetryReader(args.archive).query(args.channel, now - args.since, now, args.resolution)
+    for t, low, high, mean, last in rows:
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+        print(f"{timestamp} min={low:<8g} max={high:<8g} mean={mean:<10.4g} last={last:g}")
+
+
+if __name__ == "__main__":
+    start()
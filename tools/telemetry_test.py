@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+import telemetry
+
+
+def frame(roll, time=0):
+    return [[75, [0, 0, roll, 0]], [75, [0, 1, 121, 0]], [0, []], [62, [None]], [0, []], [0, []],
+            [-19, -11, 1008], [3, 8, -1], [-47, 1, roll], "", time]
+
+
+class TelemetryArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "archive.db")
+        self.archive = telemetry.TelemetryArchive(path, raw_retention=10, retention_1s=100, interval=3600)
+        self.db = self.archive.connect()
+
+    def tearDown(self):
+        self.db.close()
+        self.archive.close()
+        self.directory.cleanup()
+
+    def test_raw(self):
+        self.archive.append(1000.5, frame(10))
+        self.archive.append(1000.7, frame(12))
+        self.archive.flush(self.db, now=1001)
+
+        rows = self.archive.query("A.2", 1000, 1001, "raw")
+        self.assertEqual(rows, [(1000.5, 10, 10, 10, 10), (1000.7, 12, 12, 12, 12)])
+        self.assertEqual(self.archive.query("D.0", 1000, 1001, "raw"), [])
+
+    def test_rollups_merge_across_flushes(self):
+        self.archive.append(1000.1, frame(10))
+        self.archive.flush(self.db, now=1001)
+        self.archive.append(1000.6, frame(20))
+        self.archive.append(1001.2, frame(30))
+        self.archive.flush(self.db, now=1002)
+
+        self.assertEqual(self.archive.query("position.roll", 1000, 1002, "1s"),
+                         [(1000, 10, 20, 15, 20), (1001, 30, 30, 30, 30)])
+        self.assertEqual(self.archive.query("position.roll", 960, 1020, "1m"), [(960, 10, 30, 20, 30)])
+
+    def test_retention(self):
+        self.archive.append(1000.0, frame(10))
+        self.archive.flush(self.db, now=1050)
+
+        self.assertEqual(self.archive.query("A.2", 0, 2000, "raw"), [])
+        self.assertEqual(len(self.archive.query("A.2", 0, 2000, "1s")), 1)
+        self.assertEqual(self.archive.tier_for(1045, now=1050), "raw")
+        self.assertEqual(self.archive.tier_for(1000, now=1050), "1s")
+        self.assertEqual(self.archive.tier_for(0, now=1050), "1m")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+# Reading of the trace files written by the gateway: one line per message, prefixed with "< " for messages from the
+# hub and "> " for requests of the clients. Newer traces have the host time after "< ", e.g. "< @1613926312.041532 ",
+# for sensor frames the corrected time they were sampled on the hub (see clocksync.py).
+
+import json
+
+
+def read_timed_trace(path):
+    """Yields (direction, time, line) tuples, direction is '<' or '>', time is None if the line has none."""
+    with open(path, 'rb') as file:
+        for line in file:
+            if line[:2] in (b'< ', b'> '):
+                t = None
+                data = line[2:].rstrip(b'\r\n')
+                if data.startswith(b'@'):
+                    stamp, _, data = data.partition(b' ')
+                    try:
+                        t = float(stamp[1:])
+                    except ValueError:
+                        # corrupt line
+                        continue
+                yield line[:1].decode(), t, data
+
+
+def read_trace(path):
+    """Yields (direction, line) tuples, direction is '<' or '>'."""
+    for direction, _, line in read_timed_trace(path):
+        yield direction, line
+
+
+def read_messages(path, direction='<'):
+    """Yields the decoded messages of one direction, skipping lines which are no JSON objects."""
+    for line_direction, line in read_trace(path):
+        if line_direction != direction:
+            continue
+        try:
+            message = json.loads(line)
+        except ValueError:
+            # also invalid UTF-8 of a truncated or corrupt trace
+            continue
+        if isinstance(message, dict):
+            yield message
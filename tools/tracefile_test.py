@@ -0,0 +1,24 @@
+import os
+import tempfile
+import unittest
+
+import tracefile
+
+
+class ReadMessagesTestCase(unittest.TestCase):
+    def test_corrupt_lines_are_skipped(self):
+        with tempfile.NamedTemporaryFile("wb", suffix=".log", delete=False) as f:
+            f.write(b'< {"m":2,"p":[7.9, 80, 0]}\n'
+                    b'< {"m":5,"p":"\xff\xfe"}\n'
+                    b'> {"i": "a1", "m": "get_hub_info", "p": {}}\n'
+                    b'< @1.5 {"m":2,"p":[7.8, 79, 0]\n'
+                    b'< @1.6 [1, 2]\n'
+                    b'< @1.\xff7 {"m":2,"p":[7.7, 78, 0]}\n'
+                    b'< {"i": "a1", "r": {}}\n')
+        self.addCleanup(os.unlink, f.name)
+        self.assertEqual([{"m": 2, "p": [7.9, 80, 0]}, {"i": "a1", "r": {}}], list(tracefile.read_messages(f.name)))
+        self.assertEqual(["get_hub_info"], [message["m"] for message in tracefile.read_messages(f.name, ">")])
+
+
+if __name__ == "__main__":
+    unittest.main()